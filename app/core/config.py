@@ -12,10 +12,76 @@ class Settings(BaseSettings):
 
     # MongoDB Atlas
     MONGODB_URL: Optional[str] = None
+    # Create the indexes in app/core/indexes.py at startup (also: python -m scripts.ensure_indexes).
+    # Required ones, like the webhook_dedup TTL, are created even when this is off.
+    MONGO_ENSURE_INDEXES: bool = True
+    # Motor connection pool, per server (pool metrics: /debug/metrics mongo_pool_*)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 5
+    MONGO_MAX_IDLE_TIME_MS: int = 300000
+    MONGO_MAX_CONNECTING: int = 2
+    # Fail an operation that waits this long for a pooled connection instead of queueing forever
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10000
+    MONGO_CONNECT_TIMEOUT_MS: int = 10000
+    MONGO_SOCKET_TIMEOUT_MS: int = 20000
 
     # OpenAI
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
+    # Override the API endpoint, e.g. http://127.0.0.1:8801/v1 for scripts/fakes/openai_server.py
+    OPENAI_BASE_URL: Optional[str] = None
+    # Classify order intent and draft the reply in one JSON-mode call
+    AI_MERGED_INTENT_REPLY: bool = True
+    # Local keyword classifier that skips LLM intent detection for obvious chat
+    INTENT_PREFILTER_ENABLED: bool = True
+    # Weighted fair LLM scheduling across shops: global and per-shop in-flight caps
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_PER_SHOP_CONCURRENCY: int = 4
+    # Adaptive OpenAI rate control: AIMD floor and decrease factor, retry policy
+    LLM_ADAPTIVE_MIN_CONCURRENCY: int = 1
+    LLM_ADAPTIVE_DECREASE_FACTOR: float = 0.5
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_SECONDS: float = 1.0
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 20.0
+    LLM_RETRY_MAX_QUEUE: int = 64
+
+    # Answer near-verbatim knowledge base questions without calling the LLM
+    KB_FAST_PATH_ENABLED: bool = True
+    KB_FAST_PATH_THRESHOLD: float = 0.9
+    KB_INDEX_TTL_SECONDS: float = 600
+    KB_INDEX_MAX_SHOPS: int = 200
+    KB_INDEX_MAX_ENTRIES: int = 2000
+    # Most relevant Q&A pairs (BM25) placed in the prompt per message
+    KB_CONTEXT_TOP_K: int = 5
+
+    # Compiled per-shop system prompts; budget is total cached characters
+    PROMPT_CACHE_MAX_CHARS: int = 8_000_000
+    PROMPT_CACHE_MAX_VARIANTS: int = 32
+
+    # Recent messages kept on the conversation document for prompts
+    CONVERSATION_WINDOW: int = 20
+    # Also keep every message in the conversation_messages collection
+    CONVERSATION_ARCHIVE_ENABLED: bool = False
+    # Older turns are folded into a stored running summary in the background
+    CONVERSATION_SUMMARY_ENABLED: bool = True
+    CONVERSATION_SUMMARY_TRIGGER_MESSAGES: int = 10
+    CONVERSATION_RECENT_MESSAGES: int = 4
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 200
+
+    # Per-shop product catalog cache used by the webhook
+    CATALOG_CACHE_TTL_SECONDS: float = 300
+    CATALOG_CACHE_MAX_SHOPS: int = 200
+    CATALOG_MAX_PRODUCTS: int = 20000
+    # Lowest product_matcher score accepted when pricing an ordered item
+    PRODUCT_MATCH_MIN_SCORE: float = 0.6
+    # Prompt tokens per LLM call (system prompt, retrieved context, history and message)
+    AI_PROMPT_TOKEN_BUDGET: int = 3000
+    AI_HISTORY_MAX_MESSAGES: int = 10
+    AI_MAX_USER_MESSAGE_TOKENS: int = 1000
+    # Catalog products (with prices) added to the prompt when a message mentions them; 0 disables
+    PRODUCT_CONTEXT_TOP_K: int = 3
+    PRODUCT_CONTEXT_MIN_SCORE: float = 0.75
 
     # Mock OTP mode for local testing (legacy)
     MOCK_OTP_MODE: bool = True
@@ -47,6 +113,48 @@ class Settings(BaseSettings):
     WEBHOOK_VERIFY_TOKEN: str = ""
     WHATSAPP_WABA_ID: str = ""
 
+    # Graph API HTTP client (shared, pooled; HTTP/2 needs the 'h2' package)
+    GRAPH_API_BASE_URL: str = "https://graph.facebook.com"
+    GRAPH_API_VERSION: str = "v22.0"
+    GRAPH_HTTP2: bool = False
+    GRAPH_MAX_CONNECTIONS: int = 100
+    GRAPH_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    GRAPH_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    GRAPH_TIMEOUT_SECONDS: float = 30
+    GRAPH_CONNECT_TIMEOUT_SECONDS: float = 10
+
+    # Outbound WhatsApp messages: dispatcher workers, per-number pacing, retries
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_RATE_PER_SECOND: float = 20
+    OUTBOX_BURST: int = 40
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BASE_SECONDS: float = 2.0
+    # Sent and dead-lettered messages (with their text) are deleted after these many seconds
+    OUTBOX_SENT_RETENTION_SECONDS: int = 7 * 24 * 3600
+    OUTBOX_DEAD_RETENTION_SECONDS: int = 30 * 24 * 3600
+
+    # Webhook processing: when async, the webhook stores the payload, answers
+    # 200 immediately and a background worker pool does the processing.
+    WHATSAPP_WEBHOOK_ASYNC: bool = False
+    WEBHOOK_WORKERS: int = 4
+    WEBHOOK_QUEUE_MAXSIZE: int = 1000
+    # Settled webhook events (raw payloads) are deleted this long after the last message was handled
+    WEBHOOK_EVENT_RETENTION_SECONDS: int = 7 * 24 * 3600
+    # How long the webhook waits for room on a full shard before answering 503 so Meta redelivers
+    WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS: float = 2.0
+    # Max conversations processed in parallel from one batched payload
+    WEBHOOK_BATCH_CONCURRENCY: int = 8
+    # Redelivered message ids are remembered this long (Meta retries for up to 7 days)
+    WEBHOOK_DEDUP_TTL_SECONDS: int = 7 * 24 * 3600
+    WEBHOOK_DEDUP_CACHE_MAX_ENTRIES: int = 50000
+
+    # phone_number_id -> shop cache used by the webhook
+    SHOP_CACHE_TTL_SECONDS: float = 300
+    SHOP_CACHE_MAX_ENTRIES: int = 1000
+
+    # Seconds between write-behind flushes of monthly message counters
+    QUOTA_FLUSH_INTERVAL_SECONDS: float = 5
+
     # Admin
     ADMIN_PHONE_NUMBER: Optional[str] = None
 
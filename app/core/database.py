@@ -1,28 +1,167 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
 from app.core.config import settings
+from app.core.metrics import metrics
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool metrics from pymongo's CMAP events.
+
+    Motor runs each operation on an executor thread, and a checkout starts
+    and finishes on the same thread, so the start time is kept per thread.
+    Pools are per server; saturation is that of the busiest one.
+
+    - ``mongo_pool_checkout_ms``: time to get a connection, including waits
+    - ``mongo_pool_connections`` / ``mongo_pool_in_use`` / ``mongo_pool_waiting``
+    - ``mongo_pool_saturation``: in use / MONGO_MAX_POOL_SIZE
+    - ``mongo_pool_checkout_failed_total{reason}``: timeouts mean the pool is too small
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connections = 0
+        self.waiting = 0
+        self.in_use: Dict[tuple, int] = {}
+
+    def _publish(self):
+        busiest = max(self.in_use.values(), default=0)
+        metrics.set_gauge("mongo_pool_connections", self.connections)
+        metrics.set_gauge("mongo_pool_in_use", sum(self.in_use.values()))
+        metrics.set_gauge("mongo_pool_waiting", self.waiting)
+        metrics.set_gauge("mongo_pool_saturation", round(busiest / self.max_pool_size, 3) if self.max_pool_size else 0.0)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self._publish()
+
+    def _check_out_finished(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        self.waiting = max(0, self.waiting - 1)
+        return (time.perf_counter() - started) * 1000.0 if started is not None else 0.0
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            elapsed = self._check_out_finished()
+            self.in_use[event.address] = self.in_use.get(event.address, 0) + 1
+            self._publish()
+        metrics.observe("mongo_pool_checkout_ms", elapsed)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            elapsed = self._check_out_finished()
+            self._publish()
+        metrics.observe("mongo_pool_checkout_ms", elapsed)
+        metrics.inc("mongo_pool_checkout_failed_total", reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use[event.address] = max(0, self.in_use.get(event.address, 0) - 1)
+            self._publish()
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+            self._publish()
+        metrics.inc("mongo_pool_connections_created_total")
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections = max(0, self.connections - 1)
+            self._publish()
+        metrics.inc("mongo_pool_connections_closed_total", reason=str(event.reason))
+
+    def pool_cleared(self, event):
+        metrics.inc("mongo_pool_cleared_total")
 
+    def pool_created(self, event):
+        pass
 
-# Simple MongoDB Atlas connection using MONGODB_URL
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+def database_name(url: Optional[str]) -> Optional[str]:
+    """Database name from the path of the connection string, or None."""
+    if not url:
+        return None
+    return url.rsplit('/', 1)[-1].split('?')[0] or None
+
+
+# MongoDB Atlas connection using MONGODB_URL, with a cached database handle
 class Database:
     client: AsyncIOMotorClient = None
     _connected: bool = False
 
+    def __init__(self):
+        self.database = None
+        self.pool_metrics: Optional[PoolMetrics] = None
+
     def connect(self):
-        if not self._connected:
-            try:
-                self.client = AsyncIOMotorClient(
-                    settings.MONGODB_URL,
-                    tls=True,
-                    tlsAllowInvalidCertificates=True,
-                    serverSelectionTimeoutMS=30000,
-                    connectTimeoutMS=30000,
-                    socketTimeoutMS=30000,
-                )
-                self._connected = True
-            except Exception as e:
-                print(f"[WARNING] Database connection failed: {e}")
-                self._connected = False
+        if self._connected:
+            return
+        if not settings.MONGODB_URL:
+            return
+        try:
+            self.pool_metrics = PoolMetrics(settings.MONGO_MAX_POOL_SIZE)
+            self.client = AsyncIOMotorClient(
+                settings.MONGODB_URL,
+                tls=True,
+                tlsAllowInvalidCertificates=True,
+                maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+                maxConnecting=settings.MONGO_MAX_CONNECTING,
+                waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+                event_listeners=[self.pool_metrics],
+            )
+            name = database_name(settings.MONGODB_URL)
+            self.database = self.client[name] if name else None
+            self._connected = True
+        except Exception as e:
+            print(f"[WARNING] Database connection failed: {e}")
+            self._connected = False
+
+    async def warmup(self) -> float:
+        """Connect, ping and open up to MONGO_MIN_POOL_SIZE connections.
+
+        Called from the lifespan so the first request does not pay for
+        server selection, TLS and authentication. Returns the ping in ms.
+        """
+        self.connect()
+        if self.client is None:
+            raise RuntimeError("MONGODB_URL is not configured")
+        with metrics.timer("mongo_connect_ms"):
+            await self.client.admin.command("ping")
+        started = time.perf_counter()
+        await self.client.admin.command("ping")
+        ping_ms = (time.perf_counter() - started) * 1000.0
+        metrics.observe("mongo_ping_ms", ping_ms)
+        if settings.MONGO_MIN_POOL_SIZE > 1:
+            # Concurrent pings each check out a connection, filling the pool now
+            # rather than in pymongo's background maintenance.
+            await asyncio.gather(*(
+                self.client.admin.command("ping") for _ in range(settings.MONGO_MIN_POOL_SIZE)
+            ))
+        return ping_ms
 
     def close(self):
         if self.client:
@@ -30,14 +169,14 @@ class Database:
                 self.client.close()
             except:
                 pass
-            self._connected = False
+        self.client = None
+        self.database = None
+        self._connected = False
 
     def get_db(self):
-        if not self.client:
+        if not self._connected:
             self.connect()
-        # Extract DB name from URL or use a default
-        db_name = settings.MONGODB_URL.rsplit('/', 1)[-1].split('?')[0] if settings.MONGODB_URL else None
-        return self.client[db_name] if self.client and db_name else None
+        return self.database
 
 db = Database()
 
@@ -0,0 +1,187 @@
+"""Declarative registry of the MongoDB indexes the hot queries rely on.
+
+``ensure_indexes`` creates every registered index (``create_index`` is a
+no-op for one that already exists) and is called from the app lifespan and
+``python -m scripts.ensure_indexes``. Indexes marked ``required`` are
+created at startup even with MONGO_ENSURE_INDEXES off. ``index_report`` compares the registry
+with the live database: registered indexes that are missing, indexes that
+are not registered, and ``$indexStats`` usage since the last server restart.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Case-insensitive string comparison (strength 2 ignores case, not accents).
+# Queries must pass the same collation to use an index built with it.
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    # The query this index serves, shown in reports.
+    purpose: str
+    unique: bool = False
+    sparse: bool = False
+    collation: Optional[dict] = None
+    expire_after_seconds: Optional[int] = None
+    name: Optional[str] = None
+    # The app misbehaves without it (e.g. a TTL that bounds a collection), not just slows down.
+    required: bool = False
+
+    @property
+    def index_name(self) -> str:
+        # Mongo's default name, so indexes created by hand are recognised.
+        return self.name or "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+    def options(self) -> dict:
+        options = {"name": self.index_name}
+        if self.unique:
+            options["unique"] = True
+        if self.sparse:
+            options["sparse"] = True
+        if self.collation:
+            options["collation"] = self.collation
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        return options
+
+
+def _spec(collection: str, *keys: str, purpose: str, **options) -> IndexSpec:
+    """``keys`` are field names, ``-field`` for descending."""
+    return IndexSpec(
+        collection,
+        tuple((k[1:], -1) if k.startswith("-") else (k, 1) for k in keys),
+        purpose,
+        **options,
+    )
+
+
+def registered_indexes() -> List[IndexSpec]:
+    return [
+        # Shop resolution: dashboard routes, owner login and webhook routing.
+        _spec("shops", "userId", purpose="shops.find_one({userId}) on every dashboard route"),
+        _spec("shops", "ownerPhone", purpose="knowledge base routes resolve the shop by owner phone"),
+        _spec("shops", "owner_phone", sparse=True, purpose="legacy owner phone fallback"),
+        _spec("shops", "whatsapp_phone_number_id", sparse=True, purpose="shop_cache.resolve for webhooks"),
+        # Both $or branches need an index or the whole query scans.
+        _spec("shops", "whatsappPhoneNumberId", sparse=True, purpose="shop_cache.resolve legacy field"),
+        # Catalog.
+        _spec("products", "shopId", "name", purpose="catalog load and import upsert by name"),
+        _spec("products", "shopId", "-createdAt", purpose="list_products newest first"),
+        # Orders.
+        _spec("orders", "shopId", "status", "-createdAt", purpose="list_orders by status, order stats"),
+        _spec("orders", "shopId", "-createdAt", purpose="list_orders without a status, weekly insights"),
+        _spec("orders", "customerPhone", "shopId", "status", purpose="pending_address order lookup per message"),
+        # Conversations.
+        _spec("conversations", "shopId", "customerPhone", purpose="history load and append per message"),
+        _spec("conversations", "-updatedAt", purpose="admin recent conversations and daily activity"),
+        _spec("conversation_messages", "shopId", "customerPhone", "timestamp",
+              purpose="archived history per customer"),
+        # Knowledge base.
+        _spec("knowledge_base", "shopId", "is_active", purpose="kb_index load and KB listing"),
+        _spec("knowledge_base", "shopId", "question", collation=CASE_INSENSITIVE,
+              purpose="duplicate question check on KB writes"),
+        # Auth.
+        _spec("users", "phone", purpose="login, signup and OTP lookups"),
+        _spec("otp_codes", "phone", purpose="OTP send and verify"),
+        # Background queues and webhook dedup.
+        _spec("outbound_messages", "status", "createdAt", purpose="outbox requeue on startup"),
+        _spec("outbound_messages", "sentAt", expire_after_seconds=settings.OUTBOX_SENT_RETENTION_SECONDS,
+              required=True, purpose="expire delivered messages"),
+        _spec("outbound_messages", "deadAt", expire_after_seconds=settings.OUTBOX_DEAD_RETENTION_SECONDS,
+              required=True, purpose="expire dead-lettered messages"),
+        _spec("webhook_events", "status", "receivedAt", purpose="webhook queue requeue on startup"),
+        _spec("webhook_events", "settledAt", expire_after_seconds=settings.WEBHOOK_EVENT_RETENTION_SECONDS,
+              required=True, purpose="expire settled webhook payloads"),
+        _spec("webhook_dedup", "createdAt", expire_after_seconds=settings.WEBHOOK_DEDUP_TTL_SECONDS,
+              required=True, purpose="expire claimed message ids"),
+    ]
+
+
+def required_indexes() -> List[IndexSpec]:
+    return [spec for spec in registered_indexes() if spec.required]
+
+
+def _database(database):
+    database = database if database is not None else db.get_db()
+    if database is None:
+        raise RuntimeError("MONGODB_URL is not configured")
+    return database
+
+
+async def _ensure_one(database, spec: IndexSpec) -> Optional[str]:
+    try:
+        await database[spec.collection].create_index(list(spec.keys), **spec.options())
+        metrics.inc("mongo_index_ensure_total", result="ok")
+        return None
+    except Exception as e:
+        # Usually an existing index with the same keys and other options.
+        metrics.inc("mongo_index_ensure_total", result="error")
+        logger.warning(f"Could not ensure index {spec.collection}.{spec.index_name}: {e}")
+        return str(e)
+
+
+async def ensure_indexes(database=None, specs: Optional[Sequence[IndexSpec]] = None) -> dict:
+    """Create every registered index; one failure does not stop the others."""
+    database = _database(database)
+    specs = list(specs) if specs is not None else registered_indexes()
+    with metrics.timer("mongo_index_ensure_ms"):
+        errors = await asyncio.gather(*(_ensure_one(database, spec) for spec in specs))
+    failed = {f"{s.collection}.{s.index_name}": e for s, e in zip(specs, errors) if e}
+    return {"ensured": len(specs) - len(failed), "failed": failed}
+
+
+async def _usage(collection) -> Dict[str, int]:
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception as e:
+        # Not permitted on some shared tiers; report existence only.
+        logger.info(f"$indexStats unavailable for {collection.name}: {e}")
+        return {}
+    return {s["name"]: int(s.get("accesses", {}).get("ops", 0)) for s in stats}
+
+
+async def index_report(database=None, specs: Optional[Sequence[IndexSpec]] = None) -> dict:
+    """Registered indexes that are missing, and unregistered or unused ones.
+
+    Usage counts come from ``$indexStats`` and reset when the server
+    restarts, so "unused" means unused since then.
+    """
+    database = _database(database)
+    specs = list(specs) if specs is not None else registered_indexes()
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    report = {"missing": [], "unregistered": [], "unused": [], "usage": {}}
+    for name, collection_specs in by_collection.items():
+        collection = database[name]
+        existing = await collection.index_information()
+        usage = await _usage(collection)
+        registered = {spec.index_name for spec in collection_specs}
+        for spec in collection_specs:
+            if spec.index_name not in existing:
+                report["missing"].append({
+                    "collection": name, "index": spec.index_name, "purpose": spec.purpose,
+                })
+        for index_name in existing:
+            qualified = f"{name}.{index_name}"
+            if index_name in usage:
+                report["usage"][qualified] = usage[index_name]
+            if index_name == "_id_":
+                continue
+            if index_name not in registered:
+                report["unregistered"].append(qualified)
+            if usage.get(index_name) == 0:
+                report["unused"].append(qualified)
+    metrics.set_gauge("mongo_indexes_missing", len(report["missing"]))
+    return report
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Asyncio token bucket: ``capacity`` tokens, refilled at ``rate`` per second.
+
+    ``rate=None`` means unlimited until ``configure`` is called, so a bucket
+    can be created before the real limit is known.
+    """
+
+    def __init__(self, rate: Optional[float] = None, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else (rate or 0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.rate is not None and self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.limited:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def configure(self, rate: float, capacity: Optional[float] = None):
+        self._refill()
+        first = not self.limited
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity if first else min(self.tokens, self.capacity)
+
+    def sync(self, remaining: float):
+        """Lower the local count to what the server reports as remaining."""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+    def time_until(self, amount: float = 1) -> float:
+        if not self.limited:
+            return 0.0
+        self._refill()
+        # Requests larger than the bucket only wait for a full bucket.
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        if self.time_until(amount) > 0:
+            return False
+        if self.limited:
+            self.tokens -= amount
+        return True
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Wait until ``amount`` tokens are available and take them. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self.time_until(amount)
+            if delay <= 0:
+                if self.limited:
+                    self.tokens -= amount
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
@@ -1,9 +1,17 @@
-
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.core.database import db
+from app.core.indexes import ensure_indexes, index_report, registered_indexes, required_indexes
+from app.core.metrics import metrics
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.dedup import message_dedup
+from app.services.graph_client import graph_client
+from app.services.outbox import outbox
+from app.services.quota import quota_service
+from app.services.webhook_queue import webhook_queue
 from app.routers import auth, shop, products, orders, customers, ai, insights, billing, notifications, whatsapp, knowledge_base, admin, contact
 
 
@@ -12,11 +20,56 @@ from app.core.limiter import limiter
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+async def _requeue_webhook_events():
+    try:
+        await ai.requeue_pending_webhook_events()
+    except Exception as e:
+        print(f"[WARNING] Could not re-queue pending webhook events: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("[INFO] Application starting up...")
+    try:
+        ping_ms = await db.warmup()
+        print(f"[INFO] MongoDB connected (ping {ping_ms:.0f}ms)")
+    except Exception as e:
+        print(f"[WARNING] MongoDB warmup failed, connecting on first use: {e}")
+    graph_client.start()
+    quota_service.start()
+    outbox.start()
+    try:
+        await outbox.requeue_pending()
+    except Exception as e:
+        print(f"[WARNING] Could not re-queue pending outbound messages: {e}")
+    # Required indexes (the webhook_dedup TTL) are ensured even with MONGO_ENSURE_INDEXES off.
+    specs = registered_indexes() if settings.MONGO_ENSURE_INDEXES else required_indexes()
+    try:
+        failed = (await ensure_indexes(specs=specs))["failed"]
+        if failed:
+            print(f"[WARNING] Could not ensure indexes: {', '.join(failed)}")
+    except Exception as e:
+        print(f"[WARNING] Could not ensure indexes: {e}")
+        failed = {f"{spec.collection}.{spec.index_name}" for spec in specs}
+    missing = [f"{spec.collection}.{spec.index_name}" for spec in required_indexes()]
+    missing = [name for name in missing if name in failed]
+    if missing:
+        print(f"[ERROR] Required indexes missing, expired documents will pile up: {', '.join(missing)}")
+    requeue = None
+    if settings.WHATSAPP_WEBHOOK_ASYNC:
+        webhook_queue.start(ai.run_webhook_job)
+        # In the background: re-queued jobs wait for room as the workers drain them.
+        requeue = asyncio.create_task(_requeue_webhook_events())
     yield
     print("[INFO] Application shutting down...")
+    if requeue is not None:
+        requeue.cancel()
+        await asyncio.gather(requeue, return_exceptions=True)
+    await webhook_queue.stop()
+    await conversation_summarizer.stop()
+    await outbox.stop()
+    await graph_client.close()
+    await quota_service.stop()
     try:
         db.close()
     except Exception:
@@ -68,6 +121,18 @@ app.include_router(contact.router, prefix="/api/contact", tags=["Contact"])
 async def health_check():
     return {"status": "ok", "app_name": settings.APP_NAME}
 
+@app.get("/debug/metrics")
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["gauges"]["webhook_queue_depth"] = webhook_queue.depth()
+    snapshot["gauges"]["webhook_duplicate_rate"] = message_dedup.duplicate_rate()
+    snapshot["gauges"]["outbox_queue_depth"] = outbox.depth()
+    return snapshot
+
+@app.get("/debug/indexes")
+async def get_index_report():
+    return await index_report()
+
 @app.get("/debug/routes")
 async def list_routes():
     routes = []
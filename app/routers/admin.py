@@ -11,6 +11,8 @@ from app.core.database import db
 from app.middleware.adminAuth import isAdmin
 from app.core.deps import get_current_user
 from app.models.user import UserInDB
+from app.services.quota import quota_service
+from app.services.shop_cache import shop_cache
 
 router = APIRouter()
 
@@ -98,6 +100,7 @@ async def approve_upgrade_request(request_id: str, admin = Depends(isAdmin)):
         {"_id": ObjectId(upgrade_req["shopId"])},
         {"$set": {"plan": upgrade_req["requested_plan"]}}
     )
+    shop_cache.invalidate(shop_id=upgrade_req["shopId"])
     await db.get_db().upgrade_requests.update_one(
         {"_id": ObjectId(request_id)},
         {"$set": {"status": "approved", "approved_at": datetime.utcnow()}}
@@ -228,7 +231,7 @@ async def get_stats(admin = Depends(isAdmin)):
     active_subscriptions = await db.get_db().shops.count_documents({"plan": {"$ne": "free"}})
     shops = await db.get_db().shops.find({}).to_list(1000)
     total_messages_today = sum(shop.get("messages_today", 0) for shop in shops)
-    total_messages_this_month = sum(shop.get("messages_this_month", 0) for shop in shops)
+    total_messages_this_month = sum(quota_service.usage(shop) for shop in shops)
     plan_breakdown = {p: await db.get_db().shops.count_documents({"plan": p}) for p in ["free", "starter", "growth", "business"]}
     return {
         "total_users": total_users,
@@ -256,7 +259,7 @@ async def get_all_users(admin = Depends(isAdmin)):
             "created_at": user.get("created_at"),
             "shop_name": shop.get("name") if shop else None,
             "plan": shop.get("plan") if shop else None,
-            "messages_this_month": shop.get("messages_this_month") if shop else None,
+            "messages_this_month": quota_service.usage(shop) if shop else None,
             "whatsapp_connected": shop.get("whatsapp_connected") if shop else None,
             "is_active": user.get("is_active", True)
         })
@@ -288,6 +291,7 @@ async def update_user_plan(user_id: str, body: dict = Body(...), admin = Depends
     if not shop:
         raise HTTPException(status_code=404, detail="Shop not found")
     await db.get_db().shops.update_one({"userId": user_id}, {"$set": {"plan": plan}})
+    shop_cache.invalidate(shop_id=shop["_id"])
     updated_shop = await db.get_db().shops.find_one({"userId": user_id})
     updated_shop["_id"] = str(updated_shop["_id"])
     return updated_shop
@@ -312,7 +316,7 @@ async def get_all_shops(admin = Depends(isAdmin)):
             "name": shop.get("name"),
             "owner_phone": shop.get("ownerPhone", shop.get("owner_phone")),
             "plan": shop.get("plan"),
-            "messages_this_month": shop.get("messages_this_month"),
+            "messages_this_month": quota_service.usage(shop),
             "whatsapp_connected": shop.get("whatsapp_connected"),
             "whatsapp_phone_number_id": shop.get("whatsapp_phone_number_id"),
             "created_at": shop.get("created_at")
@@ -338,6 +342,7 @@ async def get_recent_conversations(admin = Depends(isAdmin)):
 async def delete_user(user_id: str, admin = Depends(isAdmin)):
     await db.get_db().users.delete_one({"_id": ObjectId(user_id)})
     await db.get_db().shops.delete_many({"userId": user_id})
+    shop_cache.clear()
     await db.get_db().conversations.delete_many({"shopId": user_id})
     await db.get_db().knowledge_base.delete_many({"shopId": user_id})
     return {"deleted": True, "user_id": user_id}
\ No newline at end of file
@@ -1,27 +1,36 @@
-from typing import List
+from typing import List, Union
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.core.deps import get_current_user
 from app.core.database import db
 from app.core.config import settings
+from app.core.metrics import metrics
 from app.models.user import UserInDB
 from app.models.conversation import ChatRequest, ConversationResponse, ConversationInDB, Message
 from app.services.ai_service import ai_service
+from app.services.catalog_cache import catalog_cache
+from app.services.conversation_store import append_messages, conversation_filter
+from app.services.conversation_summarizer import (
+    HISTORY_PROJECTION,
+    conversation_summarizer,
+    summary_context,
+    unsummarized_messages,
+)
+from app.services.dedup import message_dedup
+from app.services.intent_classifier import CHAT, classify_intent
+from app.services.kb_index import kb_index
+from app.services.outbox import outbox
+from app.services.prompt_budget import SystemPrompt
+from app.services.prompt_cache import prompt_cache
+from app.services.quota import quota_service
+from app.services.shop_cache import shop_cache
+from app.services.webhook_queue import webhook_queue
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 import logging
-import json
-import httpx
 from fastapi import Body
 
-# Plan message limits
-PLAN_LIMITS = {
-    "free": 200,
-    "starter": 1000,
-    "growth": 5000,
-    "business": float('inf')
-}
-
 class _DummyResp:
     class Choice:
         class Message:
@@ -40,84 +49,166 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-async def reset_monthly_if_needed(shop):
-    """Reset monthly counter if new month has started"""
-    last_reset = shop.get("last_reset_date")
-    now = datetime.utcnow()
-    if not last_reset or last_reset.month != now.month or last_reset.year != now.year:
-        await db.get_db().shops.update_one(
-            {"_id": shop["_id"]},
-            {"$set": {
-                "messages_this_month": 0,
-                "last_reset_date": now
-            }}
-        )
-        shop["messages_this_month"] = 0
-    return shop
-
-
-async def check_message_limit(shop) -> tuple[bool, int, int]:
-    """Returns (can_send, used, limit)"""
-    plan = shop.get("plan", "free")
-    limit = PLAN_LIMITS.get(plan, 200)
-    used = shop.get("messages_this_month", 0)
-    if limit == float('inf'):
-        return True, used, -1
-    return used < limit, used, int(limit)
+ORDER_SCHEMA_HINT = """{
+  "type": "order",
+  "items": [
+    {
+      "name": "exact product name customer said",
+      "quantity": 2,
+      "variation": "size/color/variant if mentioned",
+      "special_instructions": "any special notes"
+    }
+  ],
+  "delivery_method": "delivery or pickup",
+  "special_note": "any overall order note"
+}"""
 
 
-async def detect_order_intent(ai_service, incoming_msg: str) -> dict:
+async def detect_order_intent(ai_service, incoming_msg: str, shop_id: str = None, plan: str = None) -> dict:
     """
     Ask AI if message is an order or general chat.
     Returns {"type": "order", "items": [...]} or {"type": "chat"}
     """
-    detection_prompt = """
+    detection_prompt = f"""
 An ORDER means customer wants to BUY something.
 If ORDER detected, return ONLY this JSON:
-{
-  'type': 'order',
-  'items': [
-    {
-      'name': 'exact product name customer said',
-      'quantity': 2,
-      'variation': 'size/color/variant if mentioned',
-      'special_instructions': 'any special notes'
-    }
-  ],
-  'delivery_method': 'delivery or pickup',
-  'special_note': 'any overall order note'
-}
-If NOT an order: {'type': 'chat'}
+{ORDER_SCHEMA_HINT}
+If NOT an order: {{"type": "chat"}}
 IMPORTANT: Respond with JSON only. No explanation. No extra text.
 """
     try:
-        raw = await ai_service.generate_response(
+        return await ai_service.generate_structured(
             shop_context=detection_prompt,
             history=[],
-            user_message=incoming_msg
+            user_message=incoming_msg,
+            purpose="intent",
+            shop_id=shop_id,
+            plan=plan,
         )
-        cleaned = raw.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.split("```")[1]
-            if cleaned.startswith("json"):
-                cleaned = cleaned[4:]
-        cleaned = cleaned.strip()
-        result = json.loads(cleaned.replace("'", '"'))
-        return result
     except Exception as e:
         logger.warning(f"Order detection failed, defaulting to chat: {e}")
         return {"type": "chat"}
 
 
+async def detect_intent_and_reply(
+    ai_service,
+    shop_context: Union[str, SystemPrompt],
+    history: list,
+    incoming_msg: str,
+    shop_id: str = None,
+    plan: str = None,
+) -> dict:
+    """
+    Classify the message and draft the customer reply in one LLM round trip.
+    Returns the detect_order_intent shape plus a "reply" key. Falls back to a
+    plain chat reply if the structured call fails.
+    """
+    prompt = SystemPrompt.of(shop_context).with_suffix(f"""
+
+Decide whether the customer's latest message is an ORDER (they want to BUY
+something) or general CHAT, and write your reply to the customer.
+Respond with ONLY a JSON object.
+If ORDER, use this shape and add a "reply" key with a short acknowledgement:
+{ORDER_SCHEMA_HINT}
+If CHAT: {{"type": "chat", "reply": "your reply to the customer"}}
+The "reply" must follow all the instructions above about tone and language.""")
+    try:
+        result = await ai_service.generate_structured(
+            shop_context=prompt,
+            history=history,
+            user_message=incoming_msg,
+            purpose="intent_reply",
+            shop_id=shop_id,
+            plan=plan,
+        )
+        if result.get("type") not in ("order", "chat"):
+            raise ValueError(f"Unknown intent type: {result.get('type')!r}")
+        if not isinstance(result.get("items", []), list):
+            raise ValueError("Order items must be a list")
+        return result
+    except Exception as e:
+        logger.warning(f"Combined intent/reply call failed, falling back to chat: {e}")
+    reply = await ai_service.generate_response(
+        shop_context=shop_context,
+        history=history,
+        user_message=incoming_msg,
+        shop_id=shop_id,
+        plan=plan,
+    )
+    return {"type": "chat", "reply": reply}
+
+
+async def prefilter_is_chat(shop_id: str, incoming_msg: str) -> bool:
+    """Run the local intent classifier; True means skip LLM intent detection."""
+    if not settings.INTENT_PREFILTER_ENABLED:
+        return False
+    try:
+        # The matcher's token index is built once per catalog load, not per message.
+        product_tokens = (await catalog_cache.get_matcher(shop_id)).token_postings
+    except Exception as e:
+        logger.warning(f"Catalog load failed, classifying without product names: {e}")
+        product_tokens = {}
+    guess = classify_intent(incoming_msg, product_tokens=product_tokens)
+    metrics.inc("intent_prefilter_total", decision=guess.label)
+    if guess.label != CHAT:
+        return False
+    metrics.inc("intent_llm_classifications_saved_total")
+    if not settings.AI_MERGED_INTENT_REPLY:
+        # The separate detect_order_intent round trip is skipped entirely.
+        metrics.inc("llm_calls_saved_total", source="intent_prefilter")
+    return True
+
+
+async def kb_fast_path(shop_id: str, incoming_msg: str):
+    """Return a KBMatch when the message can be answered from the knowledge base."""
+    if not settings.KB_FAST_PATH_ENABLED:
+        return None
+    try:
+        with metrics.timer("webhook_stage_ms", stage="kb_fast_path"):
+            match = await kb_index.fast_answer(shop_id, incoming_msg)
+    except Exception as e:
+        logger.warning(f"KB fast path failed: {e}")
+        return None
+    if match is not None:
+        metrics.inc("llm_calls_saved_total", source="kb_fast_path")
+    return match
+
+
+async def product_context(shop_id: str, incoming_msg: str) -> str:
+    """Prices of catalog products the message seems to mention, for the system prompt."""
+    if settings.PRODUCT_CONTEXT_TOP_K <= 0:
+        return ""
+    try:
+        matcher = await catalog_cache.get_matcher(shop_id)
+        with metrics.timer("product_search_ms"):
+            matches = matcher.search(incoming_msg, settings.PRODUCT_CONTEXT_TOP_K, settings.PRODUCT_CONTEXT_MIN_SCORE)
+    except Exception as e:
+        logger.warning(f"Product lookup failed: {e}")
+        return ""
+    if not matches:
+        return ""
+    lines = "\n".join(
+        f"- {m.product['name']}: Rs.{m.product.get('price', 0)} per {m.product.get('unit') or 'piece'}"
+        for m in matches
+    )
+    return f"\n\nProducts the customer may be asking about:\n{lines}"
+
+
 async def enrich_order_items(items: list, shop_id: str) -> tuple[list, float]:
-    """Match items to products in DB and calculate total"""
+    """Match items to the shop's catalog in memory and calculate total.
+
+    Each item gets the best-scoring product (see product_matcher) and its
+    ``matchConfidence``; items scoring below PRODUCT_MATCH_MIN_SCORE stay
+    unpriced, as before when no product matched.
+    """
+    matcher = await catalog_cache.get_matcher(shop_id)
     enriched = []
     total = 0.0
     for item in items:
-        product = await db.get_db().products.find_one({
-            "shopId": shop_id,
-            "name": {"$regex": item.get("name", ""), "$options": "i"}
-        })
+        with metrics.timer("product_match_ms"):
+            match = matcher.match(str(item.get("name", "")), settings.PRODUCT_MATCH_MIN_SCORE)
+        metrics.inc("product_match_total", result=match.kind if match else "none")
+        product = match.product if match else None
         price = float(product["price"]) if product and "price" in product else 0.0
         qty = int(item.get("quantity", 1))
         enriched.append({
@@ -127,7 +218,8 @@ async def enrich_order_items(items: list, shop_id: str) -> tuple[list, float]:
             "special_instructions": item.get("special_instructions", ""),
             "price": price,
             "productId": str(product["_id"]) if product else "",
-            "unit": product.get("unit", "piece") if product else "piece"
+            "unit": product.get("unit", "piece") if product else "piece",
+            "matchConfidence": round(match.score, 2) if match else 0.0,
         })
         total += price * qty
     return enriched, total
@@ -200,213 +292,178 @@ async def whatsapp_webhook_verify(
     raise HTTPException(status_code=403, detail="Verification failed")
 
 
-@router.post("/webhook/whatsapp")
-async def whatsapp_webhook(request: Request):
-    try:
-        payload = await request.json()
-    except Exception as e:
-        logger.error(f"Failed to parse webhook payload: {e}")
-        return {"status": "error", "message": "Invalid payload"}
+def extract_message_text(message: dict) -> str:
+    """Pull the customer-visible text out of a WhatsApp message object."""
+    msg_type = message.get("type", "")
+    if msg_type == "text":
+        return message.get("text", {}).get("body", "").strip()
+    if msg_type == "button":
+        return message.get("button", {}).get("text", "").strip()
+    if msg_type == "interactive":
+        interactive = message.get("interactive", {})
+        if "button_reply" in interactive:
+            return interactive["button_reply"].get("title", "")
+        if "list_reply" in interactive:
+            return interactive["list_reply"].get("title", "")
+    return ""
 
-    logger.info(f"WhatsApp webhook received: {payload}")
 
-    try:
-        entry = payload.get("entry", [])
-        if not entry:
-            return {"status": "ok"}
-        changes = entry[0].get("changes", [])
-        if not changes:
-            return {"status": "ok"}
-        value = changes[0].get("value", {})
-        messages = value.get("messages", [])
-        metadata = value.get("metadata", {})
-        phone_number_id = metadata.get("phone_number_id", "")
-
-        if not messages:
-            return {"status": "ok"}
-
-        message = messages[0]
-        msg_type = message.get("type", "")
-        sender_phone = message.get("from", "")
-
-        if msg_type == "text":
-            incoming_msg = message.get("text", {}).get("body", "").strip()
-        elif msg_type == "button":
-            incoming_msg = message.get("button", {}).get("text", "").strip()
-        elif msg_type == "interactive":
-            interactive = message.get("interactive", {})
-            if "button_reply" in interactive:
-                incoming_msg = interactive["button_reply"].get("title", "")
-            elif "list_reply" in interactive:
-                incoming_msg = interactive["list_reply"].get("title", "")
-            else:
-                incoming_msg = ""
-        else:
-            incoming_msg = ""
-
-        if not incoming_msg or not sender_phone:
-            return {"status": "ok"}
+async def timed_stage(stage: str, awaitable):
+    """Await one step of the webhook pipeline, recording it under webhook_stage_ms."""
+    with metrics.timer("webhook_stage_ms", stage=stage):
+        return await awaitable
 
-        logger.info(f"Received WhatsApp message from {sender_phone}: {incoming_msg}")
-
-        # ── FIND SHOP ──
-        shop = await db.get_db().shops.find_one({
-            "$or": [
-                {"whatsapp_phone_number_id": phone_number_id},
-                {"whatsappPhoneNumberId": phone_number_id},
-            ]
-        })
-        if not shop:
-            logger.critical(f"Data isolation: No shop found for phone_number_id {phone_number_id}. Message ignored.")
-            return {"status": "ok"}
-
-        # ── MESSAGE LIMIT CHECK ──
-        shop = await reset_monthly_if_needed(shop)
-        can_send, used, limit = await check_message_limit(shop)
-
-        if not can_send:
-            plan = shop.get("plan", "free")
-            limit_msg = (
-                f"Aapki is maah ki {limit} messages ki limit khatam ho gayi hai. "
-                f"Behtar service ke liye apna plan upgrade karein. "
-                f"Abhi upgrade karein: https://shoptalkai.app/billing"
-            )
-            logger.warning(f"Shop {shop.get('name')} exceeded {plan} plan limit ({used}/{limit})")
-
-            access_token = shop.get("whatsapp_access_token") or shop.get("whatsappAccessToken") or settings.WHATSAPP_ACCESS_TOKEN
-            send_phone_id = shop.get("whatsapp_phone_number_id") or shop.get("whatsappPhoneNumberId") or phone_number_id or settings.WHATSAPP_PHONE_NUMBER_ID
-
-            if access_token and send_phone_id:
-                whatsapp_url = f"https://graph.facebook.com/v22.0/{send_phone_id}/messages"
-                headers = {
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                }
-                message_payload = {
-                    "messaging_product": "whatsapp",
-                    "to": sender_phone,
-                    "type": "text",
-                    "text": {"body": limit_msg}
-                }
-                try:
-                    async with httpx.AsyncClient() as client:
-                        await client.post(whatsapp_url, json=message_payload, headers=headers, timeout=30)
-                except Exception as e:
-                    logger.error(f"Failed to send limit message: {e}")
-            return {"status": "ok"}
-        # ── END LIMIT CHECK ──
 
-        # ── BUILD SHOP CONTEXT ──
-        shop_name = shop.get("name", "Our Shop")
-        shop_description = shop.get("description", "")
-        shop_id = str(shop.get("_id", ""))
+def _shop_credentials(shop: dict, phone_number_id: str) -> tuple[str, str]:
+    """Returns (access_token, phone_number_id) to reply with for a shop."""
+    access_token = shop.get("whatsapp_access_token") or shop.get("whatsappAccessToken") or settings.WHATSAPP_ACCESS_TOKEN
+    send_phone_id = shop.get("whatsapp_phone_number_id") or shop.get("whatsappPhoneNumberId") or phone_number_id or settings.WHATSAPP_PHONE_NUMBER_ID
+    return access_token, send_phone_id
 
-        qa_pairs = await db.get_db().knowledge_base.find({
-            "shopId": shop_id,
-            "is_active": True
-        }).to_list(50)
 
-        knowledge_section = "\n".join([
-            f"Q: {qa['question']}\nA: {qa['answer']}" for qa in qa_pairs
-        ]) if qa_pairs else ""
+async def process_whatsapp_message(phone_number_id: str, message: dict, shop: dict = None):
+    """Run the full reply pipeline for one inbound WhatsApp message.
 
-        if knowledge_section:
-            shop_context = f"""You are a helpful WhatsApp assistant for {shop_name}.
-{shop_description}
+    ``shop`` may be passed in when the caller already resolved it for a batch.
+    """
+    sender_phone = message.get("from", "")
+    incoming_msg = extract_message_text(message)
+    if not incoming_msg or not sender_phone:
+        return
 
-IMPORTANT - Use these exact answers for these questions:
-{knowledge_section}
+    logger.info(f"Received WhatsApp message from {sender_phone}: {incoming_msg}")
 
-If customer asks anything matching above questions, use the provided answer exactly.
-For other questions, use your general knowledge about the shop.
+    # ── FIND SHOP ──
+    if shop is None:
+        shop = await shop_cache.resolve(phone_number_id)
+    if not shop:
+        logger.critical(f"Data isolation: No shop found for phone_number_id {phone_number_id}. Message ignored.")
+        return
+
+    # ── MESSAGE LIMIT CHECK ──
+    can_send, used, limit = await quota_service.try_consume(shop)
+
+    if not can_send:
+        plan = shop.get("plan", "free")
+        limit_msg = (
+            f"Aapki is maah ki {limit} messages ki limit khatam ho gayi hai. "
+            f"Behtar service ke liye apna plan upgrade karein. "
+            f"Abhi upgrade karein: https://shoptalkai.app/billing"
+        )
+        logger.warning(f"Shop {shop.get('name')} exceeded {plan} plan limit ({used}/{limit})")
 
-You help customers with:
-- Product inquiries and availability
-- Taking orders
-- Answering questions about the shop
-- Providing pricing information
+        access_token, send_phone_id = _shop_credentials(shop, phone_number_id)
 
-Always be polite, helpful and respond in the same language the customer uses.
-If customer writes in Urdu, respond in Urdu. If in English, respond in English."""
-        else:
-            shop_context = f"""You are a helpful WhatsApp assistant for {shop_name}.
-{shop_description}
-
-You help customers with:
-- Product inquiries and availability
-- Taking orders
-- Answering questions about the shop
-- Providing pricing information
-
-Always be polite, helpful and respond in the same language the customer uses.
-If customer writes in Urdu, respond in Urdu. If in English, respond in English."""
-
-        # ── GET CONVERSATION HISTORY ──
-        conversation = await db.get_db().conversations.find_one({
-            "customerPhone": sender_phone,
-            "shopId": shop_id
-        }) if shop_id else await db.get_db().conversations.find_one({
-            "customerPhone": sender_phone
-        })
-        history = conversation.get("messages", []) if conversation else []
+        if access_token and send_phone_id:
+            await outbox.enqueue(
+                send_phone_id, sender_phone, limit_msg,
+                kind="limit_notice", access_token=access_token, shop_id=str(shop.get("_id", "")),
+            )
+        return
+    # ── END LIMIT CHECK ──
 
+    shop_id = str(shop.get("_id", ""))
+    plan = shop.get("plan", "free")
 
-        # ── 2-STEP ORDER FLOW ──
-        # Step 2: Check for pending_address order
-        pending_order = await db.get_db().orders.find_one({
-            "customerPhone": sender_phone,
-            "shopId": shop_id,
-            "status": "pending_address"
-        })
-        if pending_order:
-            # Treat incoming message as address
-            address = incoming_msg
-            enriched_items = pending_order.get("items", [])
-            delivery_fee = pending_order.get("deliveryFee", 200)
-            total = pending_order.get("totalAmount", 0)
-            items_text = "\n".join([
-                f"- {i['quantity']}x {i['name']}" + (f" ({i.get('variation','')})" if i.get('variation') else "") + f" — Rs.{int(i['price'] * i['quantity'])}"
-                + (f"\n  Note: {i.get('special_instructions','')}" if i.get('special_instructions') else "")
-                for i in enriched_items
-            ])
-            await db.get_db().orders.update_one(
-                {"_id": pending_order["_id"]},
-                {"$set": {
-                    "status": "new",
-                    "deliveryAddress": address,
-                    "updatedAt": datetime.utcnow()
-                },
-                "$push": {"timeline": {
-                    "action": "address_provided",
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "message": f"Delivery address provided: {address}"
-                }}}
-            )
-            response_text = (
-                f"✅ Order confirm ho gaya!\n\n"
-                f"📦 Order Details:\n"
-                f"{items_text}\n\n"
-                f"📍 Address: {address}\n"
-                f"🚚 Delivery Fee: Rs.{delivery_fee}\n"
-                f"💰 Total: Rs.{int(total)}\n"
-                f"⏰ Expected delivery: 45-60 minutes\n\n"
-                f"Hum jald aapko update karenge. Shukriya! 🙏"
-            )
-        else:
-            # Step 1: Order detection
-            intent_data = await detect_order_intent(ai_service, incoming_msg)
-            logger.info(f"Intent detection result: {intent_data}")
-            if intent_data.get("type") == "order":
-                items = intent_data.get("items", [])
-                special_note = intent_data.get("special_note", "")
-                if not items:
-                    # AI said order but no items parsed — fall back to chat
-                    response_text = await ai_service.generate_response(
-                        shop_context=shop_context,
-                        history=history,
-                        user_message=incoming_msg
+    # ── LOAD: knowledge base, catalog, history and pending order are independent ──
+    with metrics.timer("webhook_stage_ms", stage="load"):
+        qa_pairs, products, conversation, pending_order = await asyncio.gather(
+            timed_stage("context", kb_index.top_k(shop_id, incoming_msg, settings.KB_CONTEXT_TOP_K)),
+            timed_stage("products", product_context(shop_id, incoming_msg)),
+            timed_stage("history", db.get_db().conversations.find_one(
+                conversation_filter(sender_phone, shop_id), HISTORY_PROJECTION
+            )),
+            timed_stage("pending_order", db.get_db().orders.find_one({
+                "customerPhone": sender_phone,
+                "shopId": shop_id,
+                "status": "pending_address"
+            })),
+        )
+    # KB pairs are dropped lowest-ranked first if the prompt is over budget.
+    shop_context = SystemPrompt(
+        lambda pairs: prompt_cache.render(shop, pairs) + products,
+        qa_pairs,
+        preview=lambda pairs: prompt_cache.preview(shop, pairs) + products,
+    )
+    history = unsummarized_messages(conversation)
+    if conversation and conversation.get("summary"):
+        shop_context = shop_context.with_suffix(summary_context(conversation))
+        conversation_summarizer.record_savings(shop_id, conversation)
+
+    # ── 2-STEP ORDER FLOW ──
+    # Step 2: a pending_address order means this message is the address
+    kb_match = None if pending_order else await kb_fast_path(shop_id, incoming_msg)
+    if pending_order:
+        # Treat incoming message as address
+        address = incoming_msg
+        enriched_items = pending_order.get("items", [])
+        delivery_fee = pending_order.get("deliveryFee", 200)
+        total = pending_order.get("totalAmount", 0)
+        items_text = "\n".join([
+            f"- {i['quantity']}x {i['name']}" + (f" ({i.get('variation','')})" if i.get('variation') else "") + f" — Rs.{int(i['price'] * i['quantity'])}"
+            + (f"\n  Note: {i.get('special_instructions','')}" if i.get('special_instructions') else "")
+            for i in enriched_items
+        ])
+        await db.get_db().orders.update_one(
+            {"_id": pending_order["_id"]},
+            {"$set": {
+                "status": "new",
+                "deliveryAddress": address,
+                "updatedAt": datetime.utcnow()
+            },
+            "$push": {"timeline": {
+                "action": "address_provided",
+                "timestamp": datetime.utcnow().isoformat(),
+                "message": f"Delivery address provided: {address}"
+            }}}
+        )
+        response_text = (
+            f"✅ Order confirm ho gaya!\n\n"
+            f"📦 Order Details:\n"
+            f"{items_text}\n\n"
+            f"📍 Address: {address}\n"
+            f"🚚 Delivery Fee: Rs.{delivery_fee}\n"
+            f"💰 Total: Rs.{int(total)}\n"
+            f"⏰ Expected delivery: 45-60 minutes\n\n"
+            f"Hum jald aapko update karenge. Shukriya! 🙏"
+        )
+    elif kb_match is not None:
+        # Near-verbatim knowledge base question: answer from the stored pair.
+        logger.info(f"KB fast path ({kb_match.kind}, {kb_match.score:.2f}) answered: {kb_match.entry.question}")
+        response_text = kb_match.entry.answer
+    else:
+        # Step 1: Order detection (and, when merged, the chat reply)
+        try:
+            with metrics.timer("webhook_stage_ms", stage="intent"):
+                if await prefilter_is_chat(shop_id, incoming_msg):
+                    intent_data = {"type": "chat"}
+                elif settings.AI_MERGED_INTENT_REPLY:
+                    intent_data = await detect_intent_and_reply(
+                        ai_service, shop_context, history, incoming_msg, shop_id=shop_id, plan=plan
                     )
                 else:
+                    intent_data = await detect_order_intent(ai_service, incoming_msg, shop_id=shop_id, plan=plan)
+        except Exception as e:
+            logger.error(f"AI error: {e}")
+            intent_data = {"type": "chat", "reply": "Sorry, I'm having trouble right now. Please try again later."}
+        logger.info(f"Intent detection result: {intent_data}")
+        if intent_data.get("type") == "order":
+            items = intent_data.get("items", [])
+            special_note = intent_data.get("special_note", "")
+            if not items:
+                # AI said order but no items parsed — fall back to chat
+                response_text = intent_data.get("reply")
+                if not response_text:
+                    with metrics.timer("webhook_stage_ms", stage="llm_reply"):
+                        response_text = await ai_service.generate_response(
+                            shop_context=shop_context,
+                            history=history,
+                            user_message=incoming_msg,
+                            shop_id=shop_id,
+                            plan=plan,
+                        )
+            else:
+                with metrics.timer("webhook_stage_ms", stage="order"):
                     enriched_items, total = await enrich_order_items(items, shop_id)
                     delivery_fee = 200
                     # Save order to DB with pending_address status
@@ -430,83 +487,287 @@ If customer writes in Urdu, respond in Urdu. If in English, respond in English."
                         "specialNote": special_note
                     }
                     await db.get_db().orders.insert_one(order_doc)
-                    logger.info(f"New order (pending address) saved for {sender_phone} — Total: Rs.{total + delivery_fee}")
-                    items_text = "\n".join([
-                        f"- {i['quantity']}x {i['name']}" + (f" ({i['variation']})" if i.get('variation') else "") + f" — Rs.{int(i['price'] * i['quantity'])}"
-                        + (f"\n  Note: {i['special_instructions']}" if i.get('special_instructions') else "")
-                        for i in enriched_items
-                    ])
-                    response_text = (
-                        f"✅ Aapka order note kar liya!\n\n"
-                        f"📦 Order Details:\n"
-                        f"{items_text}\n"
-                        f"💰 Total: Rs.{int(total + delivery_fee)}\n\n"
-                        f"🏠 Delivery ke liye apna address share karein?\n(Ghar ka address, gali, area, city)"
-                    )
-            else:
-                # ── NORMAL Q&A FLOW ──
-                try:
+                logger.info(f"New order (pending address) saved for {sender_phone} — Total: Rs.{total + delivery_fee}")
+                items_text = "\n".join([
+                    f"- {i['quantity']}x {i['name']}" + (f" ({i['variation']})" if i.get('variation') else "") + f" — Rs.{int(i['price'] * i['quantity'])}"
+                    + (f"\n  Note: {i['special_instructions']}" if i.get('special_instructions') else "")
+                    for i in enriched_items
+                ])
+                response_text = (
+                    f"✅ Aapka order note kar liya!\n\n"
+                    f"📦 Order Details:\n"
+                    f"{items_text}\n"
+                    f"💰 Total: Rs.{int(total + delivery_fee)}\n\n"
+                    f"🏠 Delivery ke liye apna address share karein?\n(Ghar ka address, gali, area, city)"
+                )
+        elif intent_data.get("reply"):
+            response_text = intent_data["reply"]
+        else:
+            # ── NORMAL Q&A FLOW ──
+            try:
+                with metrics.timer("webhook_stage_ms", stage="llm_reply"):
                     response_text = await ai_service.generate_response(
                         shop_context=shop_context,
                         history=history,
-                        user_message=incoming_msg
+                        user_message=incoming_msg,
+                        shop_id=shop_id,
+                        plan=plan,
                     )
+            except Exception as e:
+                logger.error(f"AI error: {e}")
+                response_text = "Sorry, I'm having trouble right now. Please try again later."
+
+    # ── DELIVER: saving the conversation and sending the reply are independent ──
+    access_token, send_phone_id = _shop_credentials(shop, phone_number_id)
+    writes = [timed_stage("save", append_messages(sender_phone, shop_id, [
+        {"role": "user", "content": incoming_msg},
+        {"role": "assistant", "content": response_text},
+    ]))]
+    if access_token and send_phone_id:
+        writes.append(timed_stage("send", outbox.enqueue(
+            send_phone_id, sender_phone, response_text,
+            kind="reply", access_token=access_token, shop_id=shop_id,
+        )))
+    else:
+        logger.warning(f"No WhatsApp credentials, logging reply: {response_text}")
+    with metrics.timer("webhook_stage_ms", stage="deliver"):
+        await asyncio.gather(*writes)
+
+    # Off the reply path; the next message sees the summary and shorter history.
+    conversation_summarizer.maybe_schedule(sender_phone, shop_id, plan, len(history) + 2)
+
+
+def iter_webhook_messages(payload: dict):
+    """Yield (phone_number_id, message) for every usable message in a payload.
+
+    Meta batches several messages, and messages for several business
+    numbers, into one POST, so every entry and change is walked.
+    """
+    for entry in payload.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            value = change.get("value", {}) or {}
+            phone_number_id = (value.get("metadata", {}) or {}).get("phone_number_id", "")
+            for message in value.get("messages", []) or []:
+                if extract_message_text(message) and message.get("from", ""):
+                    yield phone_number_id, message
+
+
+async def ingest_webhook_messages(items: list):
+    """Process a batch of (phone_number_id, message) pairs concurrently.
+
+    Shops are resolved once per distinct phone_number_id. Messages from the
+    same customer to the same shop are kept in one group and handled in
+    order; groups run in parallel up to WEBHOOK_BATCH_CONCURRENCY.
+    """
+    shops = await shop_cache.resolve_many(pid for pid, _ in items)
+
+    groups = {}
+    for phone_number_id, message in items:
+        if phone_number_id not in shops:
+            logger.critical(f"Data isolation: No shop found for phone_number_id {phone_number_id}. Message ignored.")
+            continue
+        groups.setdefault((phone_number_id, message.get("from", "")), []).append(message)
+
+    semaphore = asyncio.Semaphore(max(1, settings.WEBHOOK_BATCH_CONCURRENCY))
+    metrics.observe("webhook_batch_size", len(items))
+
+    async def run_group(phone_number_id: str, group: list):
+        async with semaphore:
+            for message in group:
+                try:
+                    with metrics.timer("webhook_stage_ms", stage="total"):
+                        await process_whatsapp_message(phone_number_id, message, shop=dict(shops[phone_number_id]))
                 except Exception as e:
-                    logger.error(f"AI error: {e}")
-                    response_text = "Sorry, I'm having trouble right now. Please try again later."
-
-        # ── SAVE CONVERSATION ──
-        new_messages = history + [
-            {"role": "user", "content": incoming_msg},
-            {"role": "assistant", "content": response_text}
-        ]
-        await db.get_db().conversations.update_one(
-            {"customerPhone": sender_phone, "shopId": shop_id} if shop_id else {"customerPhone": sender_phone},
-            {"$set": {
-                "customerPhone": sender_phone,
-                "shopId": shop_id,
-                "messages": new_messages[-20:],
-                "updatedAt": datetime.utcnow()
-            }},
-            upsert=True
-        )
+                    logger.error(f"WhatsApp webhook message error: {e}", exc_info=True)
+
+    await asyncio.gather(*(run_group(pid, group) for (pid, _), group in groups.items()))
+
+
+def webhook_jobs(items: list) -> list:
+    """Worker jobs for accepted (phone_number_id, message) pairs.
+
+    ``message_key`` is the WhatsApp message id, or the position in the
+    payload for the rare message without one.
+    """
+    return [
+        {"phone_number_id": phone_number_id, "message": message, "message_key": message.get("id") or str(n)}
+        for n, (phone_number_id, message) in enumerate(items)
+    ]
+
+
+async def _store_webhook_event(payload: dict, jobs: list):
+    """Persist a raw webhook payload and its accepted messages before acknowledging it to Meta.
 
-        # ── INCREMENT MESSAGE COUNTER ──
-        await db.get_db().shops.update_one(
-            {"_id": shop["_id"]},
-            {"$inc": {"messages_this_month": 1}}
+    ``pendingIds`` lists the message keys not processed yet; only those are
+    re-queued after a restart.
+    """
+    result = await db.get_db().webhook_events.insert_one({
+        "payload": payload,
+        "messages": [
+            {"phone_number_id": j["phone_number_id"], "message": j["message"], "message_key": j["message_key"]}
+            for j in jobs
+        ],
+        "pendingIds": [j["message_key"] for j in jobs],
+        "status": "queued",
+        "pending": len(jobs),
+        "receivedAt": datetime.utcnow(),
+    })
+    return result.inserted_id
+
+
+def _queue_key(job: dict) -> str:
+    return f"{job['phone_number_id']}:{job['message'].get('from', '')}"
+
+
+async def _settle_webhook_event(event_id, query: dict, update: dict):
+    """Apply a pendingIds update and mark the event done once nothing is pending.
+
+    ``settledAt`` starts the WEBHOOK_EVENT_RETENTION_SECONDS TTL on the stored payload.
+    """
+    event = await db.get_db().webhook_events.find_one_and_update(
+        {"_id": event_id, **query}, update, return_document=True
+    )
+    if event and not event.get("pendingIds") and event.get("status") == "queued":
+        await db.get_db().webhook_events.update_one(
+            {"_id": event_id},
+            {"$set": {"status": "failed" if event.get("errors") else "processed", "settledAt": datetime.utcnow()}}
         )
 
-        # ── SEND WHATSAPP REPLY ──
-        access_token = shop.get("whatsapp_access_token") or shop.get("whatsappAccessToken") or settings.WHATSAPP_ACCESS_TOKEN
-        send_phone_id = shop.get("whatsapp_phone_number_id") or shop.get("whatsappPhoneNumberId") or phone_number_id or settings.WHATSAPP_PHONE_NUMBER_ID
 
-        if access_token and send_phone_id:
-            whatsapp_url = f"https://graph.facebook.com/v22.0/{send_phone_id}/messages"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            message_payload = {
-                "messaging_product": "whatsapp",
-                "to": sender_phone,
-                "type": "text",
-                "text": {"body": response_text}
-            }
+async def run_webhook_job(job: dict):
+    """Worker entry point for messages queued by the async webhook mode."""
+    error = None
+    try:
+        with metrics.timer("webhook_stage_ms", stage="total"):
+            await process_whatsapp_message(job["phone_number_id"], job["message"])
+    except Exception as e:
+        error = str(e)
+        logger.error(f"WhatsApp webhook job error: {e}", exc_info=True)
+    if job.get("event_id") is None:
+        return
+    key = job["message_key"]
+    update = {"$pull": {"pendingIds": key}, "$inc": {"pending": -1}, "$set": {"processedAt": datetime.utcnow()}}
+    if error:
+        update["$push"] = {"errors": error}
+    # Matching on the key makes a second completion of the same message a no-op.
+    await _settle_webhook_event(job["event_id"], {"pendingIds": key}, update)
+
+
+async def requeue_pending_webhook_events(batch: int = 500) -> int:
+    """Re-enqueue messages that were acknowledged but never processed,
+    e.g. because the process restarted with jobs still in memory.
+
+    Walks every queued event in ``batch``-sized pages, oldest first. A job
+    waits for room on its shard like the live webhook does; one that still
+    does not fit stays pending for the next start and is logged and counted.
+    """
+    requeued = skipped = 0
+    query = {"status": "queued"}
+    while True:
+        events = await db.get_db().webhook_events.find(query).sort(
+            [("receivedAt", 1), ("_id", 1)]
+        ).to_list(batch)
+        for event in events:
+            pending = set(event.get("pendingIds") or ())
+            for job in event.get("messages") or []:
+                if job["message_key"] not in pending:
+                    continue
+                job = {**job, "event_id": event["_id"]}
+                if await webhook_queue.put(_queue_key(job), job, settings.WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS):
+                    requeued += 1
+                else:
+                    skipped += 1
+        if len(events) < batch:
+            break
+        last = events[-1]
+        query = {"status": "queued", "$or": [
+            {"receivedAt": {"$gt": last["receivedAt"]}},
+            {"receivedAt": last["receivedAt"], "_id": {"$gt": last["_id"]}},
+        ]}
+    if requeued:
+        metrics.inc("webhook_requeue_total", requeued, result="queued")
+        logger.info(f"Re-queued {requeued} unprocessed webhook messages")
+    if skipped:
+        metrics.inc("webhook_requeue_total", skipped, result="queue_full")
+        logger.warning(f"Webhook queue full, {skipped} unprocessed webhook messages wait for the next restart")
+    return requeued
+
+
+async def queue_webhook_messages(payload: dict, items: list) -> bool:
+    """Store the payload and queue its messages for the workers.
+
+    A job waits up to WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS for room on its
+    shard. When the shard stays full, that message and the ones after it
+    are taken off the event and their dedup claims released, and False
+    tells the caller to answer 503 so Meta redelivers them. Processing them
+    inline instead would overtake messages already queued for the same
+    customer.
+    """
+    jobs = webhook_jobs(items)
+    try:
+        event_id = await _store_webhook_event(payload, jobs)
+    except Exception:
+        await message_dedup.release([j["message"].get("id") for j in jobs])
+        raise
+    for n, job in enumerate(jobs):
+        job["event_id"] = event_id
+        if await webhook_queue.put(_queue_key(job), job, settings.WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS):
+            continue
+        rejected = jobs[n:]
+        logger.warning(f"Webhook queue full, asking Meta to redeliver {len(rejected)} messages")
+        await message_dedup.release([j["message"].get("id") for j in rejected])
+        keys = [j["message_key"] for j in rejected]
+        await _settle_webhook_event(event_id, {}, {
+            "$pullAll": {"pendingIds": keys}, "$inc": {"pending": -len(keys)},
+        })
+        return False
+    return True
+
+
+async def drop_duplicate_messages(items: list) -> list:
+    """Keep only messages whose WhatsApp id has not been processed before."""
+    claims = await message_dedup.claim_many([message.get("id") for _, message in items])
+    fresh = []
+    for item, claimed in zip(items, claims):
+        if claimed:
+            fresh.append(item)
+        else:
+            logger.info(f"Dropping redelivered WhatsApp message {item[1].get('id')}")
+    return fresh
+
+
+@router.post("/webhook/whatsapp")
+async def whatsapp_webhook(request: Request):
+    try:
+        payload = await request.json()
+    except Exception as e:
+        logger.error(f"Failed to parse webhook payload: {e}")
+        return {"status": "error", "message": "Invalid payload"}
+
+    if not isinstance(payload, dict):
+        return {"status": "error", "message": "Invalid payload"}
+
+    logger.info(f"WhatsApp webhook received: {payload}")
+
+    try:
+        items = await drop_duplicate_messages(list(iter_webhook_messages(payload)))
+        if not items:
+            return {"status": "ok"}
+
+        if settings.WHATSAPP_WEBHOOK_ASYNC and webhook_queue.running:
             try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.post(whatsapp_url, json=message_payload, headers=headers, timeout=30)
-                    if resp.status_code == 200:
-                        logger.info(f"WhatsApp reply sent to {sender_phone}")
-                    else:
-                        logger.error(f"WhatsApp API error: {resp.status_code} - {resp.text}")
+                queued = await queue_webhook_messages(payload, items)
             except Exception as e:
-                logger.error(f"Failed to send WhatsApp reply: {e}")
-        else:
-            logger.warning(f"No WhatsApp credentials, logging reply: {response_text}")
+                # Claims were released, so Meta's retry is processed.
+                logger.error(f"Could not store webhook event: {e}", exc_info=True)
+                return JSONResponse(status_code=503, content={"status": "error", "message": "Try again"})
+            if not queued:
+                return JSONResponse(status_code=503, content={"status": "error", "message": "Queue full"})
+            return {"status": "ok"}
 
+        await ingest_webhook_messages(items)
         return {"status": "ok"}
 
     except Exception as e:
         logger.error(f"WhatsApp webhook error: {e}", exc_info=True)
-        return {"status": "ok"}
\ No newline at end of file
+        return {"status": "ok"}
@@ -17,6 +17,7 @@ from app.core.deps import get_current_user
 from app.core.database import db
 from app.models.user import UserCreate, UserLogin, UserResponse, Token, UserInDB
 from app.core.config import settings
+from app.services.quota import quota_service
 
 import firebase_admin
 from firebase_admin import credentials as firebase_credentials, auth as firebase_auth
@@ -361,7 +362,7 @@ async def read_users_me(current_user: UserInDB = Depends(get_current_user)):
     # Get shop plan
     shop = await db.get_db().shops.find_one({"userId": str(current_user.id)})
     plan = shop.get("plan", "free") if shop else "free"
-    messages_this_month = shop.get("messages_this_month", 0) if shop else 0
+    messages_this_month = quota_service.usage(shop)
     messages_limit = {
         "free": 200,
         "starter": 1000,
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends
 from app.core.deps import get_current_user
 from app.core.database import db
 from app.models.user import UserInDB
+from app.services.quota import quota_service
 from datetime import datetime
 
 router = APIRouter()
@@ -25,7 +26,7 @@ async def get_plan(current_user: UserInDB = Depends(get_current_user)):
     # Plan shops collection se lo — admin wahan update karta hai
     shop = await db.get_db().shops.find_one({"userId": str(current_user.id)})
     plan = shop.get("plan", "free") if shop else "free"
-    messages_used = shop.get("messages_this_month", 0) if shop else 0
+    messages_used = quota_service.usage(shop)
     messages_limit = PLAN_LIMITS.get(plan, 200)
     
     # Upgrade options
@@ -1,3 +1,4 @@
+from collections import Counter
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from app.core.deps import get_current_user
@@ -8,6 +9,57 @@ from app.services.ai_service import ai_service
 
 router = APIRouter()
 
+
+def weekly_stats(orders: list, conversations: list) -> dict:
+    """Sales, top questions, busiest hours and popular products of one week.
+
+    One pass over the messages and one over the orders.
+    """
+    question_freq = Counter()
+    hour_buckets = Counter()
+    for conv in conversations:
+        for msg in conv.get("messages", []):
+            if msg.get("role") == "user":
+                q = msg.get("content") or msg.get("text") or ""
+                if q:
+                    question_freq[q] += 1
+            ts = msg.get("timestamp") or msg.get("createdAt")
+            if ts:
+                if isinstance(ts, str):
+                    try:
+                        ts = datetime.fromisoformat(ts)
+                    except Exception:
+                        continue
+                hour_buckets[f"{ts.hour:02d}:00"] += 1
+
+    total_sales = 0
+    product_freq = Counter()
+    automated_sales = []
+    for o in orders:
+        total_sales += o.get("total", 0)
+        for item in o.get("items", []):
+            name = item.get("name")
+            if name:
+                product_freq[name] += 1
+        if o.get("status") == "completed":
+            automated_sales.append({
+                "customerName": o.get("customerName"),
+                "interaction": o.get("status"),
+                "value": o.get("total", 0)
+            })
+
+    return {
+        "total_sales": total_sales,
+        "top_questions": [{"question": k, "count": v} for k, v in question_freq.most_common(5)],
+        "busiest_hours": [{"label": h, "messages": c} for h, c in hour_buckets.most_common(5)],
+        "popular_products": [
+            {"name": k, "inquiries": v, "demand": "High" if v > 5 else "Medium"}
+            for k, v in product_freq.most_common(5)
+        ],
+        "automated_sales": automated_sales,
+    }
+
+
 @router.get("/weekly", response_model=InsightResponse)
 async def get_weekly_insights(
     current_user: UserInDB = Depends(get_current_user)
@@ -22,60 +74,16 @@ async def get_weekly_insights(
         "shopId": shop_id,
         "createdAt": {"$gte": week_start}
     }).to_list(1000)
-    total_sales = sum(o.get("total", 0) for o in orders)
-    # Top Questions (from conversations)
     conversations = await db.get_db().conversations.find({
         "shopId": shop_id,
         "createdAt": {"$gte": week_start}
     }).to_list(1000)
-    question_freq = {}
-    for conv in conversations:
-        for msg in conv.get("messages", []):
-            if msg.get("role") == "user":
-                q = msg.get("content") or msg.get("text") or ""
-                if q:
-                    question_freq[q] = question_freq.get(q, 0) + 1
-    top_questions = sorted(
-        [{"question": k, "count": v} for k, v in question_freq.items()],
-        key=lambda x: x["count"], reverse=True
-    )[:5]
-    # Busiest Hours
-    hour_buckets = {}
-    for conv in conversations:
-        for msg in conv.get("messages", []):
-            ts = msg.get("timestamp") or msg.get("createdAt")
-            if ts:
-                if isinstance(ts, str):
-                    try:
-                        ts = datetime.fromisoformat(ts)
-                    except Exception:
-                        continue
-                hour = ts.replace(minute=0, second=0, microsecond=0).strftime("%H:00")
-                hour_buckets[hour] = hour_buckets.get(hour, 0) + 1
-    busiest_hours = sorted(
-        [{"label": h, "messages": c} for h, c in hour_buckets.items()],
-        key=lambda x: x["messages"], reverse=True
-    )[:5]
-    # Popular Products (from orders)
-    product_freq = {}
-    for o in orders:
-        for item in o.get("items", []):
-            name = item.get("name")
-            if name:
-                product_freq[name] = product_freq.get(name, 0) + 1
-    popular_products = sorted(
-        [{"name": k, "inquiries": v, "demand": "High" if v > 5 else "Medium"} for k, v in product_freq.items()],
-        key=lambda x: x["inquiries"], reverse=True
-    )[:5]
-    # Automated Sales (from orders)
-    automated_sales = [
-        {
-            "customerName": o.get("customerName"),
-            "interaction": o.get("status"),
-            "value": o.get("total", 0)
-        }
-        for o in orders if o.get("status") == "completed"
-    ]
+    stats = weekly_stats(orders, conversations)
+    total_sales = stats["total_sales"]
+    top_questions = stats["top_questions"]
+    busiest_hours = stats["busiest_hours"]
+    popular_products = stats["popular_products"]
+    automated_sales = stats["automated_sales"]
     # AI Insight
     stats_summary = f"Total sales: {total_sales}. Top questions: {[q['question'] for q in top_questions]}. Busiest hours: {[h['label'] for h in busiest_hours]}."
     aiInsight = ""
@@ -83,7 +91,9 @@ async def get_weekly_insights(
         aiInsight = await ai_service.generate_response(
             shop_context=f"Shop: {shop.get('name', '')}",
             history=[],
-            user_message=f"Generate a weekly insight summary for these stats: {stats_summary}"
+            user_message=f"Generate a weekly insight summary for these stats: {stats_summary}",
+            shop_id=shop_id,
+            plan=shop.get("plan", "free"),
         )
     except Exception as e:
         aiInsight = f"AI insight unavailable: {e}"
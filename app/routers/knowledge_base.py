@@ -8,9 +8,12 @@ import time
 import requests
 from bs4 import BeautifulSoup
 from app.core.database import db
+from app.core.indexes import CASE_INSENSITIVE
 from app.core.deps import get_current_user
 from app.models.user import UserInDB
 from app.services.ai_service import ai_service
+from app.services.kb_index import kb_index
+from app.services.prompt_cache import prompt_cache
 from app.core.config import settings
 from typing import List, Optional
 from datetime import datetime
@@ -21,22 +24,28 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # === Helper: Category Detection ===
+# Checked in order; the first category with a keyword in the text wins.
+CATEGORY_KEYWORDS = [
+    ("Billing", ["price", "cost", "fee", "charges", "rate", "kitna", "payment"]),
+    ("Delivery", ["deliver", "shipping", "courier", "send", "bhejo"]),
+    ("Returns", ["return", "refund", "exchange", "wapas", "cancel"]),
+    ("Timing", ["time", "hour", "open", "close", "timing", "schedule", "waqt"]),
+    ("Products", ["product", "item", "available", "stock", "menu", "dish"]),
+    ("Location", ["location", "address", "where", "kahan", "direction"]),
+    ("Reservations", ["book", "reserve", "reservation", "table"]),
+]
+# One substring alternation per category instead of a generator per keyword.
+_CATEGORY_PATTERNS = [
+    (category, re.compile("|".join(re.escape(k) for k in keywords)))
+    for category, keywords in CATEGORY_KEYWORDS
+]
+
+
 def detect_category(question: str, answer: str) -> str:
     text = f"{question} {answer}".lower()
-    if any(k in text for k in ["price", "cost", "fee", "charges", "rate", "kitna", "payment"]):
-        return "Billing"
-    if any(k in text for k in ["deliver", "shipping", "courier", "send", "bhejo"]):
-        return "Delivery"
-    if any(k in text for k in ["return", "refund", "exchange", "wapas", "cancel"]):
-        return "Returns"
-    if any(k in text for k in ["time", "hour", "open", "close", "timing", "schedule", "waqt"]):
-        return "Timing"
-    if any(k in text for k in ["product", "item", "available", "stock", "menu", "dish"]):
-        return "Products"
-    if any(k in text for k in ["location", "address", "where", "kahan", "direction"]):
-        return "Location"
-    if any(k in text for k in ["book", "reserve", "reservation", "table"]):
-        return "Reservations"
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(text):
+            return category
     return "General"
 
 @router.post("/import-pdf")
@@ -79,6 +88,7 @@ async def import_knowledge_base_pdf(
     try:
         client = AsyncOpenAI(
             api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
         )
         response = await client.chat.completions.create(
             model=settings.OPENAI_MODEL,
@@ -134,11 +144,13 @@ async def import_knowledge_base_pdf(
                 "created_at": datetime.utcnow()
             }
             await db.get_db().knowledge_base.insert_one(doc)
+            kb_index.upsert(shop_id, doc)
             imported += 1
             questions.append(question)
         except Exception:
             continue
 
+    prompt_cache.bump(shop_id)
     return {"imported": imported, "skipped": skipped, "questions": questions}
 
 
@@ -187,14 +199,16 @@ async def add_qa_pair(
     # Check for duplicate (case-insensitive exact match)
     existing = await db.get_db().knowledge_base.find_one({
         "shopId": shop_id,
-        "question": {"$regex": f"^{re.escape(question)}$", "$options": "i"}
-    })
+        "question": question
+    }, collation=CASE_INSENSITIVE)
     if existing:
         # Update answer/category
         await db.get_db().knowledge_base.update_one(
             {"_id": existing["_id"]},
             {"$set": {"answer": answer, "category": category, "updated_at": datetime.utcnow()}}
         )
+        kb_index.upsert(shop_id, {**existing, "answer": answer})
+        prompt_cache.bump(shop_id)
         return {"message": "Q&A updated (duplicate prevented)", "id": str(existing["_id"])}
     # Insert new
     qa_doc = {
@@ -207,6 +221,8 @@ async def add_qa_pair(
     }
     result = await db.get_db().knowledge_base.insert_one(qa_doc)
     qa_doc["_id"] = result.inserted_id
+    kb_index.upsert(shop_id, qa_doc)
+    prompt_cache.bump(shop_id)
     return qa_to_dict(qa_doc)
 
 # === CHANGE 1: Bulk Upsert Endpoint ===
@@ -235,13 +251,14 @@ async def bulk_upsert_qa_pairs(
             category = detect_category(question, answer)
         existing = await db.get_db().knowledge_base.find_one({
             "shopId": shop_id,
-            "question": {"$regex": f"^{re.escape(question)}$", "$options": "i"}
-        })
+            "question": question
+        }, collation=CASE_INSENSITIVE)
         if existing:
             await db.get_db().knowledge_base.update_one(
                 {"_id": existing["_id"]},
                 {"$set": {"answer": answer, "category": category, "updated_at": datetime.utcnow()}}
             )
+            kb_index.upsert(shop_id, {**existing, "answer": answer})
             updated += 1
         else:
             doc = {
@@ -253,8 +270,10 @@ async def bulk_upsert_qa_pairs(
                 "created_at": datetime.utcnow()
             }
             await db.get_db().knowledge_base.insert_one(doc)
+            kb_index.upsert(shop_id, doc)
             inserted += 1
     total = inserted + updated
+    prompt_cache.bump(shop_id)
     return {"inserted": inserted, "updated": updated, "total": total}
 
 # === CHANGE 3: Delete All Endpoint ===
@@ -265,6 +284,8 @@ async def clear_knowledge_base(current_user: UserInDB = Depends(get_current_user
         raise HTTPException(status_code=404, detail="Shop not found")
     shop_id = str(shop["_id"])
     result = await db.get_db().knowledge_base.delete_many({"shopId": shop_id})
+    kb_index.put(shop_id, [])
+    prompt_cache.bump(shop_id)
     return {"message": "Knowledge base cleared", "deleted_count": result.deleted_count}
 
 # === CHANGE 4: Website Scraping Endpoint ===
@@ -414,6 +435,7 @@ Return ONLY valid JSON array:
     try:
         client = AsyncOpenAI(
             api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
         )
         response = await client.chat.completions.create(
             model=settings.OPENAI_MODEL,
@@ -458,13 +480,14 @@ Return ONLY valid JSON array:
             category = detect_category(question, answer)
         existing = await db.get_db().knowledge_base.find_one({
             "shopId": shop_id,
-            "question": {"$regex": f"^{re.escape(question)}$", "$options": "i"}
-        })
+            "question": question
+        }, collation=CASE_INSENSITIVE)
         if existing:
             await db.get_db().knowledge_base.update_one(
                 {"_id": existing["_id"]},
                 {"$set": {"answer": answer, "category": category, "updated_at": datetime.utcnow()}}
             )
+            kb_index.upsert(shop_id, {**existing, "answer": answer})
             updated += 1
         else:
             doc = {
@@ -476,8 +499,10 @@ Return ONLY valid JSON array:
                 "created_at": datetime.utcnow()
             }
             await db.get_db().knowledge_base.insert_one(doc)
+            kb_index.upsert(shop_id, doc)
             inserted += 1
     total = inserted + updated
+    prompt_cache.bump(shop_id)
     return {
         "message": "Website scraped successfully",
         "inserted": inserted,
@@ -509,6 +534,8 @@ async def update_qa_pair(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Q&A pair not found")
     qa = await db.get_db().knowledge_base.find_one({"_id": ObjectId(qa_id)})
+    kb_index.upsert(shop["_id"], qa)
+    prompt_cache.bump(shop["_id"])
     return qa_to_dict(qa)
 
 @router.delete("/{qa_id}", response_model=dict)
@@ -526,4 +553,6 @@ async def delete_qa_pair(
     result = await db.get_db().knowledge_base.delete_one({"_id": ObjectId(qa_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Q&A pair not found")
+    kb_index.remove(shop["_id"], qa_id)
+    prompt_cache.bump(shop["_id"])
     return {"message": "Q&A pair deleted", "id": qa_id}
\ No newline at end of file
@@ -5,6 +5,7 @@ from app.core.deps import get_current_user
 from app.core.database import db
 from app.models.user import UserInDB
 from app.models.order import OrderCreate, OrderUpdateStatus, OrderResponse, OrderInDB, OrderTimeline
+from app.services.outbox import outbox
 from bson import ObjectId
 import logging
 
@@ -13,6 +14,17 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def order_response_doc(doc: dict) -> dict:
+    """Stringify ids so ``doc`` validates as an OrderResponse.
+
+    List routes return these dicts; the response_model validates them once
+    (a model built here would be dumped and validated again by FastAPI).
+    """
+    doc["_id"] = str(doc["_id"])
+    doc["shopId"] = str(doc["shopId"])
+    return doc
+
+
 @router.get("/stats")
 async def get_order_stats(
     current_user: UserInDB = Depends(get_current_user)
@@ -68,13 +80,7 @@ async def list_orders(
     else:
         cursor.sort("createdAt", 1)
 
-    orders = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        doc["shopId"] = str(doc["shopId"])
-        orders.append(OrderResponse(**doc))
-
-    return orders
+    return [order_response_doc(doc) async for doc in cursor]
 
 
 @router.get("/{order_id}", response_model=OrderResponse)
@@ -145,27 +151,10 @@ async def update_order_status(
     polite_status = status_update.status.capitalize()
     msg_body = f"Aapka order #{order_number} ab {polite_status} mein hai. Shukriya!"
     if whatsapp_token and whatsapp_phone_id and customer_phone:
-        whatsapp_url = f"https://graph.facebook.com/v19.0/{whatsapp_phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {whatsapp_token}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": customer_phone,
-            "type": "text",
-            "text": {"body": msg_body}
-        }
-        try:
-            import httpx
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(whatsapp_url, json=payload, headers=headers, timeout=30)
-            if resp.status_code == 200:
-                logger.info(f"WhatsApp notification sent to {customer_phone} for order {order_number} status {status_update.status}")
-            else:
-                logger.error(f"Failed to send WhatsApp notification: {resp.status_code} {resp.text}", extra={"shop_id": shop.get('_id'), "user_id": current_user.id})
-        except Exception as e:
-            logger.error(f"WhatsApp notification error: {e}", extra={"shop_id": shop.get('_id'), "user_id": current_user.id})
+        await outbox.enqueue(
+            whatsapp_phone_id, customer_phone, msg_body,
+            kind="order_status", access_token=whatsapp_token, shop_id=str(shop["_id"]),
+        )
 
     updated_order = await db.get_db().orders.find_one({"_id": ObjectId(order_id)})
     updated_order["_id"] = str(updated_order["_id"])
@@ -9,10 +9,91 @@ from app.core.database import db
 from app.models.user import UserInDB
 from app.models.product import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse, ProductInDB
 from bson import ObjectId
+from app.services.catalog_cache import catalog_cache
 
 router = APIRouter()
 
 
+# Column mapping for product imports (header names are matched case-insensitively)
+IMPORT_COLUMNS = {
+    "name": ["name", "product name", "item"],
+    "price": ["price", "cost", "rate"],
+    "description": ["description", "details", "about"],
+    "stock": ["stock", "quantity", "qty"],
+    "category": ["category", "type"]
+}
+
+
+def read_product_rows(content: bytes, filename: str) -> list:
+    """Rows of an uploaded .csv/.xlsx file as dicts keyed by header."""
+    if filename.endswith(".csv"):
+        decoded = content.decode("utf-8-sig")
+        return list(csv.DictReader(io.StringIO(decoded)))
+    wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+    ws = wb.active
+    headers = [str(cell.value).strip() if cell.value else "" for cell in next(ws.iter_rows(min_row=1, max_row=1))]
+    return [dict(zip(headers, [cell.value for cell in row])) for row in ws.iter_rows(min_row=2)]
+
+
+def resolve_columns(headers) -> dict:
+    """Map each product field to the first matching header, by alias priority."""
+    normalized = {}
+    for col in headers:
+        if col:
+            normalized.setdefault(str(col).strip().lower(), col)
+    resolved = {}
+    for field, aliases in IMPORT_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                resolved[field] = normalized[alias]
+                break
+    return resolved
+
+
+def product_fields(row: dict, columns: dict) -> dict:
+    """Product fields of one import row; raises ValueError without a name.
+
+    ``columns`` caches ``resolve_columns`` per header layout, since every
+    row of a file normally has the same headers.
+    """
+    layout = tuple(row)
+    resolved = columns.get(layout)
+    if resolved is None:
+        resolved = columns[layout] = resolve_columns(layout)
+
+    def get_col(field, default=None):
+        col = resolved.get(field)
+        return row[col] if col is not None else default
+
+    name = get_col("name")
+    if not name:
+        raise ValueError("Missing product name")
+    price = get_col("price")
+    try:
+        price = float(price) if price is not None else 0.0
+    except:
+        price = 0.0
+    stock = get_col("stock", 0)
+    try:
+        stock = int(stock) if stock is not None else 0
+    except:
+        stock = 0
+    return {
+        "name": name,
+        "price": price,
+        "description": get_col("description", "") or "",
+        "stock": stock,
+        "category": get_col("category", "General") or "General",
+    }
+
+
+def product_response_doc(doc: dict) -> dict:
+    """Stringify ids so ``doc`` validates as a ProductResponse (see orders.order_response_doc)."""
+    doc["_id"] = str(doc["_id"])
+    doc["shopId"] = str(doc["shopId"])
+    return doc
+
+
 # --- Products Excel/CSV Import Endpoint ---
 @router.post("/import-excel")
 async def import_products_excel(
@@ -38,70 +119,27 @@ async def import_products_excel(
     imported, updated, errors = 0, 0, []
     total_rows = 0
     try:
-        if filename.endswith(".csv"):
-            decoded = content.decode("utf-8-sig")
-            reader = csv.DictReader(io.StringIO(decoded))
-            rows = list(reader)
-        else:
-            wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
-            ws = wb.active
-            headers = [str(cell.value).strip() if cell.value else "" for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-            rows = [dict(zip(headers, [cell.value for cell in row])) for row in ws.iter_rows(min_row=2)]
+        rows = read_product_rows(content, filename)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse file: {e}")
 
-    # Column mapping (case-insensitive)
-    col_map = {
-        "name": ["name", "product name", "item"],
-        "price": ["price", "cost", "rate"],
-        "description": ["description", "details", "about"],
-        "stock": ["stock", "quantity", "qty"],
-        "category": ["category", "type"]
-    }
-    def get_col(row, keys, default=None):
-        for k in keys:
-            for col in row:
-                if col and str(col).strip().lower() == k:
-                    return row[col]
-        return default
-
+    columns = {}
     for idx, row in enumerate(rows, start=2):
         total_rows += 1
         try:
-            # Flexible column matching
-            name = get_col(row, col_map["name"])
-            price = get_col(row, col_map["price"])
-            description = get_col(row, col_map["description"], "")
-            stock = get_col(row, col_map["stock"], 0)
-            category = get_col(row, col_map["category"], "General")
-            if not name:
-                raise ValueError("Missing product name")
-            try:
-                price = float(price) if price is not None else 0.0
-            except:
-                price = 0.0
-            try:
-                stock = int(stock) if stock is not None else 0
-            except:
-                stock = 0
+            fields = product_fields(row, columns)
             # Upsert by name+shopId
-            existing = await db.get_db().products.find_one({"shopId": shop_id, "name": name})
-            product_data = {
-                "shopId": shop_id,
-                "name": name,
-                "price": price,
-                "description": description or "",
-                "stock": stock,
-                "category": category or "General",
-                "updatedAt": datetime.utcnow(),
-            }
+            existing = await db.get_db().products.find_one({"shopId": shop_id, "name": fields["name"]})
+            product_data = {"shopId": shop_id, **fields, "updatedAt": datetime.utcnow()}
             if existing:
                 await db.get_db().products.update_one({"_id": existing["_id"]}, {"$set": product_data})
+                product_data["_id"] = existing["_id"]
                 updated += 1
             else:
                 product_data["createdAt"] = datetime.utcnow()
                 await db.get_db().products.insert_one(product_data)
                 imported += 1
+            catalog_cache.upsert(shop_id, product_data)
         except Exception as e:
             errors.append(f"Row {idx}: {e}")
 
@@ -145,11 +183,7 @@ async def list_products(
     total = await db.get_db().products.count_documents(query)
     cursor.skip(skip).limit(limit)
     
-    products = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        doc["shopId"] = str(doc["shopId"])
-        products.append(ProductResponse(**doc))
+    products = [product_response_doc(doc) async for doc in cursor]
         
     return {
         "products": products,
@@ -180,6 +214,7 @@ async def create_product(
     
     # Fetch the created product and return it
     created_product = await db.get_db().products.find_one({"_id": result.inserted_id})
+    catalog_cache.upsert(shop_id, created_product)
     created_product["_id"] = str(created_product["_id"])
     created_product["shopId"] = str(created_product["shopId"])
     
@@ -213,6 +248,7 @@ async def update_product(
     )
     
     updated_product = await db.get_db().products.find_one({"_id": ObjectId(product_id)})
+    catalog_cache.upsert(shop["_id"], updated_product)
     updated_product["_id"] = str(updated_product["_id"])
     updated_product["shopId"] = str(updated_product["shopId"])
     return ProductResponse(**updated_product)
@@ -236,4 +272,5 @@ async def delete_product(
         raise HTTPException(status_code=403, detail="Not authorized to delete this product")
 
     await db.get_db().products.delete_one({"_id": ObjectId(product_id)})
+    catalog_cache.remove(shop["_id"], product_id)
     return {"message": "Product deleted successfully"}
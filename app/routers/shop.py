@@ -3,6 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Body
 from app.core.deps import get_current_user
 from app.core.database import db
 from app.models.user import UserInDB
+from app.services.prompt_cache import prompt_cache
+from app.services.shop_cache import shop_cache
 from app.models.shop import ShopCreate, ShopUpdate, ShopResponse, ShopInDB, BusinessHours, DeliverySettings, AIConfig
 from typing import Optional
 
@@ -30,6 +32,8 @@ async def create_or_update_shop_profile(
             {"_id": existing_shop["_id"]},
             {"$set": update_data}
         )
+        shop_cache.invalidate(shop_id=existing_shop["_id"])
+        prompt_cache.bump(existing_shop["_id"])
         existing_shop.update(update_data)
         existing_shop["_id"] = str(existing_shop["_id"])
         return ShopInDB(**existing_shop)
@@ -71,6 +75,8 @@ async def update_business_hours(
     )
     if not result:
         raise HTTPException(status_code=404, detail="Shop not found")
+    shop_cache.invalidate(shop_id=result["_id"])
+    prompt_cache.bump(result["_id"])
     result["_id"] = str(result["_id"])
     return ShopInDB(**result)
 
@@ -86,6 +92,8 @@ async def update_delivery_settings(
     )
     if not result:
         raise HTTPException(status_code=404, detail="Shop not found")
+    shop_cache.invalidate(shop_id=result["_id"])
+    prompt_cache.bump(result["_id"])
     result["_id"] = str(result["_id"])
     return ShopInDB(**result)
 
@@ -101,6 +109,8 @@ async def update_ai_config(
     )
     if not result:
         raise HTTPException(status_code=404, detail="Shop not found")
+    shop_cache.invalidate(shop_id=result["_id"])
+    prompt_cache.bump(result["_id"])
     result["_id"] = str(result["_id"])
     return ShopInDB(**result)
 
@@ -126,5 +136,6 @@ async def shop_onboarding(
         "updatedAt": datetime.utcnow(),
     }
     result = await db.get_db().shops.insert_one(shop_data)
+    shop_cache.invalidate(phone_number_id=whatsapp_phone_number_id)
     shop_data["_id"] = str(result.inserted_id)
     return ShopInDB(**shop_data)
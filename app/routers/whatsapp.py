@@ -1,7 +1,6 @@
 from datetime import datetime
 from typing import Optional
 
-import httpx
 import logging
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -10,6 +9,9 @@ from pydantic import BaseModel, Field
 from app.core.database import db
 from app.core.deps import get_current_user
 from app.models.user import UserInDB
+from app.services.graph_client import graph_client
+from app.services.prompt_cache import prompt_cache
+from app.services.shop_cache import shop_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -81,6 +83,8 @@ async def save_whatsapp_credentials(
         }
 
         await db.get_db().shops.update_one({"_id": shop["_id"]}, {"$set": update_data})
+        shop_cache.invalidate(phone_number_id=creds.phone_number_id, shop_id=shop["_id"])
+        prompt_cache.bump(shop["_id"])
 
         logger.info("WhatsApp credentials saved for shop %s, valid=%s", shop_id, is_valid)
 
@@ -189,6 +193,8 @@ async def disconnect_whatsapp(
                 "whatsapp_setup_method": "",
             }},
         )
+        shop_cache.invalidate(shop_id=shop["_id"])
+        prompt_cache.bump(shop["_id"])
 
         logger.info("WhatsApp disconnected for shop %s", shop_id)
         return {"message": "WhatsApp disconnected successfully", "shop_id": shop_id}
@@ -206,12 +212,8 @@ async def disconnect_whatsapp(
 async def verify_whatsapp_credentials(access_token: str, phone_number_id: str) -> bool:
     """Verify WhatsApp credentials by making a test API call."""
     try:
-        url = f"https://graph.facebook.com/v22.0/{phone_number_id}"
-        headers = {"Authorization": f"Bearer {access_token}"}
-
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=headers, timeout=10)
-            return resp.status_code == 200
+        resp = await graph_client.get_phone_number(phone_number_id, access_token, timeout=10)
+        return resp.status_code == 200
 
     except Exception as e:
         logger.warning("WhatsApp credential verification failed: %s", e)
@@ -1,59 +1,167 @@
 from openai import AsyncOpenAI
+import asyncio
+import ast
+import json
 import logging
+from typing import Union
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.llm_scheduler import llm_scheduler
+from app.services.openai_limiter import RETRYABLE_STATUS, estimate_tokens, openai_limiter
+from app.services.prompt_budget import SystemPrompt, assemble_messages
 
 logger = logging.getLogger(__name__)
 
+
+def parse_json_object(raw: str) -> dict:
+    """Parse a model reply that should be a JSON object.
+
+    Tolerates markdown code fences and Python-style single-quoted dicts,
+    without rewriting quotes inside the values (so "don't" survives).
+    """
+    cleaned = (raw or "").strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("```")[1]
+        if cleaned.startswith("json"):
+            cleaned = cleaned[4:]
+    cleaned = cleaned.strip()
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start != -1 and end > start:
+        cleaned = cleaned[start:end + 1]
+    try:
+        result = json.loads(cleaned)
+    except json.JSONDecodeError:
+        try:
+            result = ast.literal_eval(cleaned)
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"Model reply is not a JSON object: {raw!r}") from e
+    if not isinstance(result, dict):
+        raise ValueError(f"Model reply is not a JSON object: {raw!r}")
+    return result
+
+
 class AIService:
-    def __init__(self):
-        self.client = AsyncOpenAI(
+    def __init__(self, client=None):
+        # Retries are handled by openai_limiter, not the SDK.
+        self.client = client or AsyncOpenAI(
             api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            max_retries=0,
         )
 
-    async def generate_response(self, shop_context: str, history: list, user_message: str):
-        messages = [{"role": "system", "content": shop_context}]
-        # Add history (limit to last 5-10 messages)
-        for msg in history[-10:]:
-            if not isinstance(msg, dict):
-                continue
-            role = msg.get("role") or msg.get("sender") or msg.get("from")
-            if role:
-                role = role.lower()
-                if role in ("customer", "user"):
-                    role = "user"
-                elif role in ("ai", "assistant", "bot", "system"):
-                    role = "assistant"
-                else:
-                    role = "user"
-            else:
-                role = "user"
-            content = msg.get("content") or msg.get("text") or msg.get("message")
-            if content is None:
-                continue
-            messages.append({"role": role, "content": content})
-        messages.append({"role": "user", "content": user_message})
-
-        retries = 3
-        for attempt in range(retries):
+    def build_messages(
+        self, shop_context: Union[str, SystemPrompt], history: list, user_message: str, purpose: str = "reply"
+    ) -> list:
+        """Chat messages within AI_PROMPT_TOKEN_BUDGET (see prompt_budget.assemble_messages)."""
+        prompt = assemble_messages(
+            shop_context,
+            history,
+            user_message,
+            budget=settings.AI_PROMPT_TOKEN_BUDGET,
+            max_history=settings.AI_HISTORY_MAX_MESSAGES,
+            max_user_tokens=settings.AI_MAX_USER_MESSAGE_TOKENS,
+        )
+        metrics.observe("llm_prompt_tokens", prompt.tokens, purpose=purpose)
+        for part in prompt.trimmed:
+            metrics.inc("llm_prompt_trimmed_total", part=part)
+        return prompt.messages
+
+    async def _create(self, **params):
+        """Run one completion; return it with the HTTP response headers when available."""
+        completions = self.client.chat.completions
+        raw_api = getattr(completions, "with_raw_response", None)
+        if raw_api is None:
+            return await completions.create(**params), None
+        raw = await raw_api.create(**params)
+        return raw.parse(), raw.headers
+
+    async def _complete(self, messages: list, purpose: str, shop_id: str = None, plan: str = None, **params):
+        estimated_tokens = estimate_tokens(messages, params.get("max_tokens", 0))
+        attempt = 0
+        while True:
             try:
-                response = await self.client.chat.completions.create(
-                    model=settings.OPENAI_MODEL,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=300
-                )
-                content = response.choices[0].message.content
-                if not content or not isinstance(content, str) or not content.strip():
-                    logger.error("AI returned empty/null response", extra={"shop_context": shop_context})
-                    return "Sorry, I couldn't generate a response right now."
-                return content
+                async with llm_scheduler.slot(shop_id, plan):
+                    await openai_limiter.before_request(estimated_tokens)
+                    metrics.inc("llm_calls_total", purpose=purpose)
+                    with metrics.timer("llm_call_ms", purpose=purpose):
+                        response, headers = await self._create(
+                            model=settings.OPENAI_MODEL,
+                            messages=messages,
+                            **params
+                        )
+                openai_limiter.on_success(headers)
+                return response.choices[0].message.content
             except Exception as e:
-                if hasattr(e, "status_code") and e.status_code in (429, 500) and attempt < retries - 1:
-                    logger.warning(f"Azure OpenAI retry {attempt+1} due to {e}", extra={"shop_context": shop_context})
-                    import asyncio
-                    await asyncio.sleep(2 * (attempt + 1))
-                    continue
-                logger.error(f"Error calling Azure OpenAI: {e}", exc_info=True, extra={"shop_context": shop_context})
+                status = getattr(e, "status_code", None)
+                if status is not None and status not in RETRYABLE_STATUS:
+                    # 400/401/404 are our errors, not throttling; no backoff or retry.
+                    metrics.inc("llm_request_errors_total", status=str(status))
+                elif status is not None:
+                    headers = getattr(getattr(e, "response", None), "headers", None)
+                    delay = openai_limiter.on_error(status, headers, attempt)
+                    if openai_limiter.should_retry(status, attempt, delay):
+                        logger.warning(
+                            f"Azure OpenAI retry {attempt+1} in {delay:.1f}s due to {e}",
+                            extra={"shop_context": messages[0]["content"]},
+                        )
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                logger.error(f"Error calling Azure OpenAI: {e}", exc_info=True, extra={"shop_context": messages[0]["content"]})
                 raise
 
+    async def generate_response(
+        self,
+        shop_context: Union[str, SystemPrompt],
+        history: list,
+        user_message: str,
+        purpose: str = "reply",
+        shop_id: str = None,
+        plan: str = None,
+        max_tokens: int = 300,
+        fallback: str = "Sorry, I couldn't generate a response right now.",
+    ):
+        """Plain-text reply. ``shop_id``/``plan`` place the call in that shop's LLM queue.
+
+        ``shop_context`` may be a SystemPrompt so retrieved context can be
+        trimmed to the prompt token budget. ``fallback`` is returned when the
+        model answers with empty content.
+        """
+        messages = self.build_messages(shop_context, history, user_message, purpose)
+        content = await self._complete(
+            messages, purpose, shop_id=shop_id, plan=plan, temperature=0.7, max_tokens=max_tokens
+        )
+        if not content or not isinstance(content, str) or not content.strip():
+            logger.error("AI returned empty/null response", extra={"shop_context": messages[0]["content"]})
+            return fallback
+        return content
+
+    async def generate_structured(
+        self,
+        shop_context: Union[str, SystemPrompt],
+        history: list,
+        user_message: str,
+        purpose: str = "structured",
+        max_tokens: int = 500,
+        shop_id: str = None,
+        plan: str = None,
+    ) -> dict:
+        """Ask for a JSON object (OpenAI JSON mode) and return it parsed.
+
+        ``shop_context`` must describe the expected JSON; JSON mode requires
+        the word "JSON" to appear in the prompt. Raises ValueError if the
+        reply cannot be parsed.
+        """
+        messages = self.build_messages(shop_context, history, user_message, purpose)
+        content = await self._complete(
+            messages,
+            purpose,
+            shop_id=shop_id,
+            plan=plan,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+        )
+        return parse_json_object(content)
+
 ai_service = AIService()
@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+from app.services.product_matcher import ProductMatcher
+
+# Fields the webhook needs from a product when reading or pricing an order.
+PRODUCT_PROJECTION = {"name": 1, "price": 1, "unit": 1}
+
+
+class CatalogCache:
+    """Per-shop TTL/LRU cache of compact product records.
+
+    Loaded with a single projected query per shop and kept current by the
+    product routes through ``upsert``/``remove`` (which also update the
+    shop's ProductMatcher in place), so the webhook can look at a shop's
+    catalog without a Mongo round trip per message.
+    """
+
+    def __init__(self, max_shops: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_shops = max_shops or settings.CATALOG_CACHE_MAX_SHOPS
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.CATALOG_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def invalidate(self, shop_id):
+        self._entries.pop(str(shop_id), None)
+
+    def upsert(self, shop_id, product: dict):
+        """Apply a created or updated product to a loaded catalog; no-op otherwise."""
+        entry = self._entries.get(str(shop_id))
+        if entry is None:
+            return
+        compact = {"_id": product["_id"], **{k: product[k] for k in PRODUCT_PROJECTION if k in product}}
+        products, positions = entry[1], entry[3]
+        key = str(compact["_id"])
+        index = positions.get(key)
+        if index is None:
+            positions[key] = len(products)
+            products.append(compact)
+        else:
+            products[index] = compact
+        if entry[2] is not None:
+            entry[2].upsert(compact)
+        metrics.inc("catalog_cache_updates_total", op="upsert")
+
+    def remove(self, shop_id, product_id):
+        entry = self._entries.get(str(shop_id))
+        if entry is None:
+            return
+        products, positions = entry[1], entry[3]
+        index = positions.pop(str(product_id), None)
+        if index is not None:
+            # Move the last product into the gap so positions stay valid.
+            last = products.pop()
+            if index < len(products):
+                products[index] = last
+                positions[str(last.get("_id"))] = index
+        if entry[2] is not None:
+            entry[2].remove(product_id)
+        metrics.inc("catalog_cache_updates_total", op="remove")
+
+    def clear(self):
+        self._entries.clear()
+
+    def put(self, shop_id, products: List[dict]):
+        shop_id = str(shop_id)
+        # [expires_at, products, matcher built on first use, str(_id) -> index in products]
+        positions = {str(p.get("_id")): i for i, p in enumerate(products)}
+        self._entries[shop_id] = [time.monotonic() + self.ttl_seconds, products, None, positions]
+        self._entries.move_to_end(shop_id)
+        while len(self._entries) > self.max_shops:
+            self._entries.popitem(last=False)
+
+    async def get_products(self, shop_id) -> List[dict]:
+        shop_id = str(shop_id)
+        entry = self._entries.get(shop_id)
+        if entry is not None and entry[0] >= time.monotonic():
+            self._entries.move_to_end(shop_id)
+            metrics.inc("catalog_cache_hits_total")
+            return entry[1]
+
+        metrics.inc("catalog_cache_misses_total")
+        with metrics.timer("catalog_load_ms"):
+            products = await db.get_db().products.find(
+                {"shopId": shop_id}, PRODUCT_PROJECTION
+            ).to_list(settings.CATALOG_MAX_PRODUCTS)
+        self.put(shop_id, products)
+        return products
+
+    async def get_names(self, shop_id) -> List[str]:
+        return [p["name"] for p in await self.get_products(shop_id) if p.get("name")]
+
+    async def get_matcher(self, shop_id) -> ProductMatcher:
+        """ProductMatcher over the cached catalog, built once per load."""
+        products = await self.get_products(shop_id)
+        entry = self._entries.get(str(shop_id))
+        if entry is None or entry[1] is not products:
+            return ProductMatcher(products)
+        if entry[2] is None:
+            entry[2] = ProductMatcher(products)
+        return entry[2]
+
+
+catalog_cache = CatalogCache()
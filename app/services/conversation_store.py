@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.database import db
+
+
+def conversation_filter(customer_phone: str, shop_id: Optional[str]) -> dict:
+    if shop_id:
+        return {"customerPhone": customer_phone, "shopId": shop_id}
+    return {"customerPhone": customer_phone}
+
+
+async def append_messages(customer_phone: str, shop_id: Optional[str], messages: List[dict]):
+    """Append messages to a conversation atomically.
+
+    Uses ``$push`` with ``$each``/``$slice`` so concurrent replies to the same
+    customer cannot overwrite each other and only the new messages go over
+    the wire. The conversation keeps the last CONVERSATION_WINDOW messages for
+    prompts; with CONVERSATION_ARCHIVE_ENABLED every message is also written
+    to ``conversation_messages`` as unbounded history.
+    """
+    now = datetime.utcnow()
+    stamped = [{**m, "timestamp": m.get("timestamp") or now} for m in messages]
+    await db.get_db().conversations.update_one(
+        conversation_filter(customer_phone, shop_id),
+        {
+            "$push": {"messages": {"$each": stamped, "$slice": -settings.CONVERSATION_WINDOW}},
+            "$set": {"updatedAt": now},
+            "$setOnInsert": {"customerPhone": customer_phone, "shopId": shop_id or "", "createdAt": now},
+        },
+        upsert=True,
+    )
+    if settings.CONVERSATION_ARCHIVE_ENABLED:
+        await db.get_db().conversation_messages.insert_many([
+            {"shopId": shop_id or "", "customerPhone": customer_phone, **m} for m in stamped
+        ])
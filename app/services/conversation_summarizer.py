@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+from app.services.ai_service import ai_service
+from app.services.conversation_store import conversation_filter
+from app.services.prompt_budget import count_tokens, normalize_history
+
+logger = logging.getLogger(__name__)
+
+# Conversation fields the webhook reads to build the prompt history.
+HISTORY_PROJECTION = {
+    "messages": 1, "summary": 1, "summaryUntil": 1, "summaryTokens": 1, "summarySourceTokens": 1,
+}
+
+SUMMARY_PROMPT = """You maintain a running summary of a WhatsApp conversation between a shop
+assistant and a customer. Update the summary with the new messages. Keep
+products, quantities, prices, addresses, preferences and open questions.
+Write at most 5 short lines in the customer's language. Reply with the
+summary only."""
+
+
+def summary_context(conversation: Optional[dict]) -> str:
+    """System prompt suffix carrying the stored summary, or ""."""
+    summary = (conversation or {}).get("summary")
+    if not summary:
+        return ""
+    return f"\n\nSummary of the earlier conversation with this customer:\n{summary}"
+
+
+def unsummarized_messages(conversation: Optional[dict]) -> List[dict]:
+    """Stored messages the summary does not cover yet, oldest first.
+
+    Messages without a timestamp predate every stamped one, so a summary
+    always covers them.
+    """
+    messages = (conversation or {}).get("messages", [])
+    until = (conversation or {}).get("summaryUntil")
+    if until is None:
+        return messages
+    return [m for m in messages if m.get("timestamp") and m["timestamp"] > until]
+
+
+def _transcript(messages: List[dict]) -> str:
+    return "\n".join(
+        f"{'Customer' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in normalize_history(messages)
+    )
+
+
+class ConversationSummarizer:
+    """Folds older conversation turns into a running summary in the background.
+
+    After a reply is saved, ``maybe_schedule`` starts a task once a
+    conversation has more than CONVERSATION_SUMMARY_TRIGGER_MESSAGES
+    unsummarized messages. The task summarizes all but the last
+    CONVERSATION_RECENT_MESSAGES and stores the result as ``summary`` with
+    ``summaryUntil``, the timestamp of the last summarized message. Stored
+    messages are left alone for the conversation views; the prompt carries
+    the summary plus ``unsummarized_messages``. A user message and its reply
+    share a timestamp, so the cut never falls between messages with the
+    same one. The write is conditional on ``summaryUntil`` so two runs
+    cannot apply the same messages twice.
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CONVERSATION_SUMMARY_ENABLED
+
+    def record_savings(self, shop_id: str, conversation: Optional[dict]):
+        """Count the history tokens a prompt saved by sending the summary instead."""
+        if not conversation or not conversation.get("summary"):
+            return
+        saved = conversation.get("summarySourceTokens", 0) - conversation.get("summaryTokens", 0)
+        metrics.inc("conversation_summary_prompts_total", shop=shop_id)
+        if saved > 0:
+            metrics.inc("conversation_summary_tokens_saved_total", saved, shop=shop_id)
+
+    def maybe_schedule(self, customer_phone: str, shop_id: str, plan: Optional[str], message_count: int):
+        if not self.enabled or message_count <= settings.CONVERSATION_SUMMARY_TRIGGER_MESSAGES:
+            return None
+        key = f"{shop_id}:{customer_phone}"
+        if key in self._running:
+            return self._running[key]
+        task = asyncio.create_task(self._run(key, customer_phone, shop_id, plan))
+        self._running[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, key: str, customer_phone: str, shop_id: str, plan: Optional[str]):
+        try:
+            with metrics.timer("conversation_summary_ms"):
+                await self.summarize(customer_phone, shop_id, plan)
+        except Exception as e:
+            metrics.inc("conversation_summary_total", result="error")
+            logger.warning(f"Conversation summary failed for {customer_phone}: {e}")
+        finally:
+            self._running.pop(key, None)
+
+    async def summarize(self, customer_phone: str, shop_id: str, plan: Optional[str] = None) -> bool:
+        conversations = db.get_db().conversations
+        query = conversation_filter(customer_phone, shop_id)
+        conversation = await conversations.find_one(query, {"messages": 1, "summary": 1, "summaryUntil": 1})
+        messages = unsummarized_messages(conversation)
+        cut = max(0, len(messages) - settings.CONVERSATION_RECENT_MESSAGES)
+        while 0 < cut < len(messages) and messages[cut - 1].get("timestamp") == messages[cut].get("timestamp"):
+            cut -= 1
+        older = messages[:cut]
+        if not older:
+            return False
+
+        previous = conversation.get("summary") or ""
+        user_message = (f"Current summary:\n{previous}\n\n" if previous else "") + f"New messages:\n{_transcript(older)}"
+        summary = await ai_service.generate_response(
+            shop_context=SUMMARY_PROMPT,
+            history=[],
+            user_message=user_message,
+            purpose="summary",
+            shop_id=shop_id,
+            plan=plan,
+            max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+            # An apology saved as the summary would replace the turns it covers.
+            fallback="",
+        )
+        summary = summary.strip()
+        if not summary:
+            metrics.inc("conversation_summary_total", result="empty")
+            return False
+
+        # Unstamped messages sort first, so a cut past them all has a stamped last message.
+        until = older[-1].get("timestamp") or datetime(1970, 1, 1)
+        # What the prompt would have carried verbatim without the summary.
+        carried = max(0, settings.AI_HISTORY_MAX_MESSAGES - settings.CONVERSATION_RECENT_MESSAGES)
+        replaced = older[-carried:] if carried else []
+        source_tokens = sum(count_tokens(m["content"]) for m in normalize_history(replaced))
+        result = await conversations.update_one(
+            {**query, "summaryUntil": conversation.get("summaryUntil")},
+            {
+                "$set": {
+                    "summary": summary,
+                    "summaryUntil": until,
+                    "summaryTokens": count_tokens(summary),
+                    "summarySourceTokens": source_tokens,
+                    "summaryUpdatedAt": datetime.utcnow(),
+                },
+            },
+        )
+        applied = getattr(result, "modified_count", 1) > 0
+        metrics.inc("conversation_summary_total", result="ok" if applied else "conflict")
+        return applied
+
+    async def stop(self, timeout: float = 5.0):
+        """Give running summaries a moment to finish, then cancel them."""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+conversation_summarizer = ConversationSummarizer()
@@ -0,0 +1,122 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class MessageDeduplicator:
+    """Drops WhatsApp messages that Meta delivers more than once.
+
+    Message ids are claimed in the ``webhook_dedup`` collection (``_id`` is
+    the message id, expired by a TTL index on ``createdAt``, see app/core/indexes.py), so the check
+    holds across restarts and processes. An in-process LRU of recently seen
+    ids answers most redeliveries without a round trip. If the store is
+    unreachable the message is let through: a rare duplicate reply beats a
+    dropped one.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.WEBHOOK_DEDUP_CACHE_MAX_ENTRIES
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    def clear(self):
+        self._seen.clear()
+
+    def _remember(self, message_id: str):
+        self._seen[message_id] = None
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    async def claim(self, message_id: Optional[str]) -> bool:
+        """Return True the first time ``message_id`` is seen, False for repeats."""
+        return (await self.claim_many([message_id]))[0]
+
+    async def claim_many(self, message_ids: List[Optional[str]]) -> List[bool]:
+        """``claim`` for a batch of ids, with one unordered ``insert_many`` for the ids not in the LRU.
+
+        Duplicates are read from the bulk write's per-document errors.
+        """
+        fresh = [True] * len(message_ids)
+        unseen = {}
+        for n, message_id in enumerate(message_ids):
+            if not message_id:
+                continue
+            if message_id in self._seen or message_id in unseen:
+                if message_id in self._seen:
+                    self._seen.move_to_end(message_id)
+                fresh[n] = False
+                metrics.inc("webhook_dedup_total", result="duplicate_memory")
+                continue
+            unseen[message_id] = n
+        if not unseen:
+            return fresh
+        # Remember before awaiting so a concurrent redelivery stops here.
+        for message_id in unseen:
+            self._remember(message_id)
+
+        ids = list(unseen)
+        now = datetime.utcnow()
+        duplicates, failed = set(), set()
+        try:
+            await db.get_db().webhook_dedup.insert_many(
+                [{"_id": message_id, "createdAt": now} for message_id in ids], ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                target = duplicates if error.get("code") == DUPLICATE_KEY else failed
+                target.add(ids[error["index"]])
+            if failed:
+                logger.warning(f"Dedup store rejected {len(failed)} claims, accepting them")
+        except Exception as e:
+            logger.warning(f"Dedup store unavailable, accepting {len(ids)} messages: {e}")
+            failed.update(ids)
+
+        for message_id in ids:
+            if message_id in duplicates:
+                fresh[unseen[message_id]] = False
+                metrics.inc("webhook_dedup_total", result="duplicate_store")
+            elif message_id in failed:
+                metrics.inc("webhook_dedup_total", result="store_error")
+            else:
+                metrics.inc("webhook_dedup_total", result="new")
+        return fresh
+
+    async def release(self, message_ids: List[Optional[str]]):
+        """Forget claims on messages that were not accepted after all, so Meta's redelivery is processed."""
+        ids = [message_id for message_id in message_ids if message_id]
+        if not ids:
+            return
+        for message_id in ids:
+            self._seen.pop(message_id, None)
+        try:
+            await db.get_db().webhook_dedup.delete_many({"_id": {"$in": ids}})
+        except Exception as e:
+            logger.warning(f"Could not release {len(ids)} dedup claims: {e}")
+        metrics.inc("webhook_dedup_released_total", len(ids))
+
+    @staticmethod
+    def duplicate_rate() -> float:
+        duplicates = (
+            metrics.counter("webhook_dedup_total", result="duplicate_memory")
+            + metrics.counter("webhook_dedup_total", result="duplicate_store")
+        )
+        total = (
+            duplicates
+            + metrics.counter("webhook_dedup_total", result="new")
+            + metrics.counter("webhook_dedup_total", result="store_error")
+        )
+        return duplicates / total if total else 0.0
+
+
+message_dedup = MessageDeduplicator()
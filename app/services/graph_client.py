@@ -0,0 +1,98 @@
+import importlib.util
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class GraphAPIClient:
+    """Shared, pooled HTTP client for the WhatsApp Cloud (Graph) API.
+
+    ``start``/``close`` are called from the app lifespan. Until ``start`` has
+    run (scripts, tests without a lifespan) each call falls back to a
+    short-lived client so callers never have to care.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    def _client_kwargs(self) -> dict:
+        http2 = settings.GRAPH_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("GRAPH_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+        return {
+            "base_url": f"{settings.GRAPH_API_BASE_URL.rstrip('/')}/{settings.GRAPH_API_VERSION}",
+            "http2": http2,
+            "limits": httpx.Limits(
+                max_connections=settings.GRAPH_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GRAPH_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            "timeout": httpx.Timeout(
+                settings.GRAPH_TIMEOUT_SECONDS,
+                connect=settings.GRAPH_CONNECT_TIMEOUT_SECONDS,
+            ),
+        }
+
+    def start(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        if self._client is None:
+            self._client = httpx.AsyncClient(transport=transport, **self._client_kwargs())
+            logger.info("Graph API client started")
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def _request(self, kind: str, method: str, path: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        status = "error"
+        try:
+            if self._client is not None:
+                resp = await self._client.request(method, path, **kwargs)
+            else:
+                async with httpx.AsyncClient(**self._client_kwargs()) as client:
+                    resp = await client.request(method, path, **kwargs)
+            status = str(resp.status_code)
+            return resp
+        finally:
+            metrics.observe("graph_request_ms", (time.perf_counter() - start) * 1000.0, kind=kind)
+            metrics.inc("graph_requests_total", kind=kind, status=status)
+
+    async def send_text(self, phone_number_id: str, access_token: str, to: str, body: str) -> httpx.Response:
+        """Send a plain text WhatsApp message from ``phone_number_id`` to ``to``."""
+        return await self._request(
+            "send",
+            "POST",
+            f"/{phone_number_id}/messages",
+            json={
+                "messaging_product": "whatsapp",
+                "to": to,
+                "type": "text",
+                "text": {"body": body},
+            },
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+
+    async def get_phone_number(self, phone_number_id: str, access_token: str, timeout: float = 10) -> httpx.Response:
+        return await self._request(
+            "verify",
+            "GET",
+            f"/{phone_number_id}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=timeout,
+        )
+
+
+graph_client = GraphAPIClient()
@@ -0,0 +1,155 @@
+"""Zero-cost local pre-classifier for inbound WhatsApp messages.
+
+Most messages are greetings, thanks or questions about timing, location or
+price. They never need the LLM to tell us they are not orders. This module
+scores a message on keyword, quantity and product-name features (Roman
+Urdu, Urdu and English) and only says "chat" when no order signal is
+present. Anything else is "ambiguous" and goes to the model.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Container, Iterable, List, Optional
+
+CHAT = "chat"
+AMBIGUOUS = "ambiguous"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+ORDER_WORDS = {
+    # English
+    "order", "buy", "purchase", "want", "need", "send", "deliver", "add", "book", "take",
+    "get", "checkout", "pack",
+    # Roman Urdu
+    "chahiye", "chahye", "chaiye", "chahie", "chahiyay", "bhej", "bhejo", "bhejdo", "bhejna",
+    "bhejain", "bhejen", "dedo", "dena", "dein", "den", "lena", "leni", "lunga", "lungi",
+    "mangwana", "mangwani", "mangwa", "mangwao", "lagao", "lagado", "likho", "likh",
+    # Urdu
+    "چاہیے", "چاہئے", "بھیج", "بھیجو", "بھیجیں", "آرڈر", "دیں", "دے", "لینا", "منگوانا",
+}
+
+ORDER_PHRASES = (
+    "de do", "dai do", "bhej do", "order karna", "order kar", "laga do", "likh lo", "i'll take",
+    "i will take", "can i get", "can i have", "please send", "دے دو", "بھیج دو", "آرڈر کر",
+)
+
+NUMBER_WORDS = {
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "dozen",
+    "half", "aik", "ek", "teen", "paanch", "panch", "chay", "chhe", "saat", "aath", "nau", "das",
+    "darjan", "adha", "aadha", "ایک", "دو", "تین", "چار", "پانچ", "درجن", "آدھا",
+}
+# Also common words in other senses ("do you", "char"), so they only count
+# next to a product name or a unit.
+WEAK_NUMBER_WORDS = {"do", "char", "chaar"}
+
+UNIT_WORDS = {
+    "kg", "kilo", "kilos", "gram", "grams", "litre", "liter", "ltr", "plate", "plates",
+    "packet", "packets", "pack", "pcs", "pc", "piece", "pieces", "box", "boxes", "bottle",
+    "bottles", "cup", "cups", "dabba", "dabbay", "کلو", "پلیٹ", "پیکٹ",
+}
+
+GREETING_WORDS = {
+    "hi", "hello", "hey", "salam", "salaam", "aoa", "assalam", "assalamualaikum", "asalam",
+    "slam", "walaikum", "السلام", "سلام", "hy",
+}
+THANKS_ACK_WORDS = {
+    "thanks", "thank", "thx", "shukriya", "shukria", "jazakallah", "jzk", "ok", "okay", "okk",
+    "theek", "thik", "acha", "achha", "accha", "ji", "jee", "haan", "han", "great", "nice",
+    "done", "bye", "allah", "hafiz", "شکریہ", "ٹھیک", "اچھا", "جی", "ہاں",
+}
+QUESTION_WORDS = {
+    # timing
+    "kab", "time", "timing", "timings", "open", "close", "closed", "khul", "khulta", "khulti",
+    "band", "waqt", "hours", "today", "aaj", "kal",
+    # location
+    "kahan", "kidhar", "where", "address", "location", "branch", "map", "direction", "directions",
+    # price / info
+    "price", "prices", "kitna", "kitne", "kitni", "rate", "rates", "qeemat", "cost", "menu",
+    "kya", "what", "how", "which", "available", "hai", "hain",
+    # Urdu
+    "کب", "کہاں", "قیمت", "کتنے", "کتنا", "کیا", "وقت",
+}
+
+
+@dataclass
+class IntentGuess:
+    label: str
+    order_score: int = 0
+    chat_score: int = 0
+    features: List[str] = field(default_factory=list)
+
+
+def normalize(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def _is_product_token(tok: str) -> bool:
+    return len(tok) >= 3 and not tok.isdigit()
+
+
+def _product_tokens(product_names: Iterable[str]) -> set:
+    tokens = set()
+    for name in product_names or ():
+        for tok in _TOKEN_RE.findall(name.lower()):
+            if _is_product_token(tok):
+                tokens.add(tok)
+    return tokens
+
+
+def classify_intent(
+    message: str, product_names: Iterable[str] = (), product_tokens: Optional[Container[str]] = None
+) -> IntentGuess:
+    """Return CHAT only when the message carries no order signal at all.
+
+    ``product_tokens`` is any container of lower-cased product-name tokens,
+    such as a shop's ``ProductMatcher.token_postings``; it saves tokenizing
+    ``product_names`` on every message.
+    """
+    text = normalize(message)
+    tokens = text.split()
+    guess = IntentGuess(label=AMBIGUOUS)
+    if not tokens:
+        guess.label = CHAT
+        return guess
+
+    if product_tokens is None:
+        product_tokens = _product_tokens(product_names)
+    product_hits = [i for i, tok in enumerate(tokens) if _is_product_token(tok) and tok in product_tokens]
+    unit_hits = [i for i, tok in enumerate(tokens) if tok in UNIT_WORDS]
+
+    if any(tok in ORDER_WORDS for tok in tokens) or any(p in text for p in ORDER_PHRASES):
+        guess.order_score += 2
+        guess.features.append("order_keyword")
+
+    anchors = set(product_hits) | set(unit_hits)
+    for i, tok in enumerate(tokens):
+        strong = tok.isdigit() or tok in NUMBER_WORDS
+        weak = tok in WEAK_NUMBER_WORDS and ({i - 1, i + 1} & anchors)
+        if strong or weak:
+            guess.order_score += 1
+            guess.features.append("quantity")
+            break
+
+    if unit_hits:
+        guess.order_score += 1
+        guess.features.append("unit")
+    if product_hits:
+        guess.order_score += 1
+        guess.features.append("product_name")
+
+    if any(tok in GREETING_WORDS for tok in tokens[:3]):
+        guess.chat_score += 1
+        guess.features.append("greeting")
+    if any(tok in THANKS_ACK_WORDS for tok in tokens):
+        guess.chat_score += 1
+        guess.features.append("thanks_ack")
+    if "?" in (message or "") or "؟" in (message or "") or any(tok in QUESTION_WORDS for tok in tokens):
+        guess.chat_score += 1
+        guess.features.append("question")
+
+    only_product_mention = guess.features and set(guess.features) - {"greeting", "thanks_ack", "question"} == {"product_name"}
+    if guess.order_score == 0:
+        guess.label = CHAT
+    elif only_product_mention and "question" in guess.features:
+        # "zinger ka price kya hai?" names a product but asks about it.
+        guess.label = CHAT
+    return guess
@@ -0,0 +1,250 @@
+import heapq
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+# Words too common in Roman Urdu / English customer questions to help ranking.
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "am", "do", "does", "you", "your", "we", "i", "me", "my",
+    "of", "to", "in", "on", "for", "and", "or", "it", "this", "that", "can", "please",
+    "hai", "hain", "ka", "ki", "ke", "ko", "se", "me", "mein", "main", "aap", "ap", "apka",
+    "apki", "aapka", "aapki", "kya", "ye", "yeh", "wo", "woh", "bhi", "ho", "hota", "hoti", "g", "ji",
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def index_terms(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+@dataclass
+class KBEntry:
+    id: str
+    question: str
+    answer: str
+    norm_question: str
+    tokens: frozenset
+
+
+@dataclass
+class KBMatch:
+    entry: KBEntry
+    score: float
+    kind: str  # "exact", "fuzzy" or "bm25"
+
+
+class ShopKnowledge:
+    """Active Q&A pairs of one shop.
+
+    Keeps a normalised-question map for exact matches and a BM25 inverted
+    index over question + answer text. Both are maintained incrementally by
+    ``upsert`` and ``remove`` so a single KB edit never rebuilds the shop.
+    """
+
+    def __init__(self, docs: List[dict] = ()):
+        self.entries: Dict[str, KBEntry] = {}
+        self.exact: Dict[str, str] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.total_len = 0
+        for doc in docs:
+            self.upsert(doc)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, doc: dict):
+        """Add or replace one knowledge_base document; inactive ones are removed."""
+        entry_id = str(doc.get("_id", ""))
+        self.remove(entry_id)
+        question, answer = doc.get("question"), doc.get("answer")
+        if not question or not answer or doc.get("is_active", True) is False:
+            return
+        norm = normalize_question(question)
+        entry = KBEntry(
+            id=entry_id,
+            question=question,
+            answer=answer,
+            norm_question=norm,
+            tokens=frozenset(norm.split()),
+        )
+        self.entries[entry_id] = entry
+        self.exact.setdefault(norm, entry_id)
+
+        terms = index_terms(question) + index_terms(answer)
+        for term in terms:
+            self.postings.setdefault(term, {})
+            self.postings[term][entry_id] = self.postings[term].get(entry_id, 0) + 1
+        self.doc_len[entry_id] = len(terms)
+        self.total_len += len(terms)
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(str(entry_id), None)
+        if entry is None:
+            return
+        if self.exact.get(entry.norm_question) == entry.id:
+            del self.exact[entry.norm_question]
+            for other in self.entries.values():
+                if other.norm_question == entry.norm_question:
+                    self.exact[entry.norm_question] = other.id
+                    break
+        for term in set(index_terms(entry.question) + index_terms(entry.answer)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(entry.id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(entry.id, 0)
+
+    def match(self, message: str) -> Optional[KBMatch]:
+        norm = normalize_question(message)
+        if not norm:
+            return None
+        entry_id = self.exact.get(norm)
+        if entry_id is not None:
+            return KBMatch(self.entries[entry_id], 1.0, "exact")
+
+        tokens = set(norm.split())
+        best, best_score = None, 0.0
+        for entry in self.entries.values():
+            if not tokens & entry.tokens:
+                continue
+            matcher = SequenceMatcher(None, norm, entry.norm_question)
+            if matcher.real_quick_ratio() <= best_score or matcher.quick_ratio() <= best_score:
+                continue
+            score = matcher.ratio()
+            if score > best_score:
+                best, best_score = entry, score
+        if best is None:
+            return None
+        return KBMatch(best, best_score, "fuzzy")
+
+    def search(self, query: str, k: int) -> List[KBMatch]:
+        """Rank entries against ``query`` with Okapi BM25; return the top k."""
+        n = len(self.entries)
+        if not n:
+            return []
+        avgdl = self.total_len / n if self.total_len else 1.0
+        scores: Dict[str, float] = {}
+        for term in set(index_terms(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for entry_id, tf in docs.items():
+                norm_len = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[entry_id] / avgdl)
+                scores[entry_id] = scores.get(entry_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm_len)
+        ranked = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [KBMatch(self.entries[entry_id], score, "bm25") for entry_id, score in ranked]
+
+
+class KnowledgeBaseIndex:
+    """Per-shop in-memory view of the knowledge_base collection.
+
+    Loaded lazily with one query per shop. The knowledge base routes apply
+    their writes through ``upsert``/``remove`` so the index stays current
+    without a reload; a TTL backs that up.
+    """
+
+    def __init__(self, max_shops: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_shops = max_shops or settings.KB_INDEX_MAX_SHOPS
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.KB_INDEX_TTL_SECONDS
+        self._shops: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def invalidate(self, shop_id):
+        self._shops.pop(str(shop_id), None)
+
+    def clear(self):
+        self._shops.clear()
+
+    def put(self, shop_id, docs: List[dict]) -> ShopKnowledge:
+        shop_id = str(shop_id)
+        knowledge = ShopKnowledge(docs)
+        self._shops[shop_id] = (time.monotonic() + self.ttl_seconds, knowledge)
+        self._shops.move_to_end(shop_id)
+        while len(self._shops) > self.max_shops:
+            self._shops.popitem(last=False)
+        return knowledge
+
+    async def get(self, shop_id) -> ShopKnowledge:
+        shop_id = str(shop_id)
+        cached = self._shops.get(shop_id)
+        if cached is not None and cached[0] >= time.monotonic():
+            self._shops.move_to_end(shop_id)
+            return cached[1]
+        with metrics.timer("kb_load_ms"):
+            docs = await db.get_db().knowledge_base.find(
+                {"shopId": shop_id, "is_active": True},
+                {"question": 1, "answer": 1, "is_active": 1},
+            ).to_list(settings.KB_INDEX_MAX_ENTRIES)
+        return self.put(shop_id, docs)
+
+    def _loaded(self, shop_id) -> Optional[ShopKnowledge]:
+        cached = self._shops.get(str(shop_id))
+        return cached[1] if cached is not None else None
+
+    def upsert(self, shop_id, doc: dict):
+        """Apply one written knowledge_base document to a loaded shop index.
+
+        Shops that are not loaded are left alone; they load fresh on next use.
+        """
+        knowledge = self._loaded(shop_id)
+        if knowledge is not None:
+            knowledge.upsert(doc)
+
+    def remove(self, shop_id, qa_id):
+        knowledge = self._loaded(shop_id)
+        if knowledge is not None:
+            knowledge.remove(qa_id)
+
+    async def top_k(self, shop_id, message: str, k: int) -> List[KBEntry]:
+        """Return the k pairs most relevant to ``message`` for the prompt.
+
+        Small knowledge bases (k entries or fewer) are returned whole.
+        """
+        knowledge = await self.get(shop_id)
+        if len(knowledge) <= k:
+            return list(knowledge.entries.values())
+        with metrics.timer("kb_search_ms"):
+            return [match.entry for match in knowledge.search(message, k)]
+
+    async def fast_answer(self, shop_id, message: str) -> Optional[KBMatch]:
+        """Return a stored answer when the message is confidently a KB question."""
+        knowledge = await self.get(shop_id)
+        if not knowledge.entries:
+            return None
+        with metrics.timer("kb_match_ms"):
+            match = knowledge.match(message)
+        if match is not None and match.score >= settings.KB_FAST_PATH_THRESHOLD:
+            metrics.inc("kb_fast_path_total", shop=str(shop_id), result="hit")
+            return match
+        metrics.inc("kb_fast_path_total", shop=str(shop_id), result="miss")
+        return None
+
+    @staticmethod
+    def hit_rate(shop_id) -> float:
+        hits = metrics.counter("kb_fast_path_total", shop=str(shop_id), result="hit")
+        misses = metrics.counter("kb_fast_path_total", shop=str(shop_id), result="miss")
+        total = hits + misses
+        return hits / total if total else 0.0
+
+
+kb_index = KnowledgeBaseIndex()
@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.quota import PLAN_LIMITS
+
+# Requests without a shop (dashboard insights, the test chat endpoint).
+UNATTRIBUTED = "_none"
+
+
+def plan_weight(plan: Optional[str]) -> float:
+    """Scheduling weight of a plan, log-scaled from its monthly message limit.
+
+    free = 1, starter ~3.3, growth ~5.6; unlimited plans count as twice the
+    largest finite limit.
+    """
+    finite = [v for v in PLAN_LIMITS.values() if v != float('inf')]
+    limit = PLAN_LIMITS.get(plan or "free", PLAN_LIMITS["free"])
+    if limit == float('inf'):
+        limit = 2 * max(finite)
+    return 1 + math.log2(max(limit, min(finite)) / min(finite))
+
+
+class _Waiter:
+    __slots__ = ("start_tag", "seq", "shop_id", "future", "enqueued_at")
+
+    def __init__(self, start_tag: float, seq: int, shop_id: str, future: asyncio.Future):
+        self.start_tag = start_tag
+        self.seq = seq
+        self.shop_id = shop_id
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class LLMScheduler:
+    """Weighted fair queueing of LLM calls across shops.
+
+    Start-time fair queueing: each request gets a start tag of
+    max(virtual time, the shop's previous finish tag) and a finish tag
+    1/weight later, and free slots go to the lowest start tag. A shop that
+    floods the queue only pushes its own tags forward, so other shops keep
+    getting their share. At most ``max_concurrency`` calls run at once and
+    at most ``per_shop_limit`` for any one shop.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, per_shop_limit: Optional[int] = None):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.per_shop_limit = per_shop_limit or settings.LLM_PER_SHOP_CONCURRENCY
+        self._active = 0
+        self._inflight: Dict[str, int] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._waiting: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def depth(self) -> int:
+        return len(self._waiting)
+
+    def set_capacity(self, max_concurrency: int):
+        """Change the global cap; calls already running are not interrupted."""
+        self.max_concurrency = max(1, max_concurrency)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._waiting:
+            eligible = [w for w in self._waiting if self._inflight.get(w.shop_id, 0) < self.per_shop_limit]
+            if not eligible:
+                break
+            waiter = min(eligible, key=lambda w: (w.start_tag, w.seq))
+            self._waiting.remove(waiter)
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._grant(waiter.shop_id)
+            metrics.observe(
+                "llm_queue_wait_ms", (time.perf_counter() - waiter.enqueued_at) * 1000, shop=waiter.shop_id
+            )
+            waiter.future.set_result(None)
+        metrics.set_gauge("llm_queue_depth", len(self._waiting))
+
+    def _grant(self, shop_id: str):
+        self._active += 1
+        self._inflight[shop_id] = self._inflight.get(shop_id, 0) + 1
+        metrics.set_gauge("llm_inflight", self._active)
+
+    def release(self, shop_id: str):
+        self._active -= 1
+        remaining = self._inflight.get(shop_id, 1) - 1
+        if remaining:
+            self._inflight[shop_id] = remaining
+        else:
+            self._inflight.pop(shop_id, None)
+            if not any(w.shop_id == shop_id for w in self._waiting):
+                # An idle shop restarts at the current virtual time.
+                self._finish_tags.pop(shop_id, None)
+        metrics.set_gauge("llm_inflight", self._active)
+        self._dispatch()
+
+    async def acquire(self, shop_id: Optional[str] = None, plan: Optional[str] = None):
+        shop_id = str(shop_id) if shop_id else UNATTRIBUTED
+        start_tag = max(self._virtual_time, self._finish_tags.get(shop_id, 0.0))
+        self._finish_tags[shop_id] = start_tag + 1 / plan_weight(plan)
+        waiter = _Waiter(start_tag, next(self._seq), shop_id, asyncio.get_running_loop().create_future())
+        self._waiting.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(shop_id)
+            elif waiter in self._waiting:
+                self._waiting.remove(waiter)
+                metrics.set_gauge("llm_queue_depth", len(self._waiting))
+            raise
+        return shop_id
+
+    @asynccontextmanager
+    async def slot(self, shop_id: Optional[str] = None, plan: Optional[str] = None):
+        """Hold one LLM call slot for ``shop_id`` for the duration of the block."""
+        key = await self.acquire(shop_id, plan)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+
+llm_scheduler = LLMScheduler()
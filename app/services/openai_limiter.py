@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from typing import Mapping, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.token_bucket import TokenBucket
+from app.services.llm_scheduler import llm_scheduler
+from app.services.prompt_budget import message_tokens
+
+logger = logging.getLogger(__name__)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "20ms", "1s" or "6m0s" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Server retry hint in seconds, from retry-after-ms or retry-after."""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    seconds = headers.get("retry-after")
+    if seconds:
+        try:
+            return float(seconds)
+        except ValueError:
+            return None
+    return None
+
+
+def estimate_tokens(messages: list, max_tokens: int = 0) -> int:
+    """Prompt + completion token estimate, as counted against the tokens-per-minute limit."""
+    return message_tokens(messages) + max_tokens
+
+
+class AdaptiveRateController:
+    """Keeps OpenAI traffic inside the account's rate limits.
+
+    Reads the ``x-ratelimit-*`` headers of every response into two token
+    buckets (requests and tokens per minute), so calls wait locally instead
+    of collecting 429s. Concurrency is adjusted AIMD-style through the LLM
+    scheduler's global cap: +1/limit per success, halved on a throttle. A
+    throttle also pauses all callers for the server's retry hint plus jitter.
+    """
+
+    def __init__(self):
+        self.min_concurrency = settings.LLM_ADAPTIVE_MIN_CONCURRENCY
+        self.max_concurrency = settings.LLM_MAX_CONCURRENCY
+        self.limit = float(self.max_concurrency)
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.paused_until = 0.0
+
+    def reset(self):
+        self.__init__()
+        llm_scheduler.set_capacity(self.max_concurrency)
+
+    def _apply_limit(self):
+        metrics.set_gauge("llm_concurrency_limit", self.limit)
+        llm_scheduler.set_capacity(max(self.min_concurrency, int(self.limit)))
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]):
+        if not headers:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit = _int_header(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _int_header(headers, f"x-ratelimit-remaining-{kind}")
+            if limit:
+                per_second = limit / 60
+                if bucket.rate != per_second:
+                    bucket.configure(per_second, capacity=limit)
+            if remaining is not None:
+                bucket.sync(remaining)
+                metrics.set_gauge(f"llm_ratelimit_remaining_{kind}", remaining)
+
+    async def before_request(self, estimated_tokens: int = 0):
+        """Wait out any throttle pause and for room in both buckets."""
+        started = time.perf_counter()
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+        waited_ms = (time.perf_counter() - started) * 1000
+        if waited_ms >= 1:
+            metrics.observe("llm_ratelimit_wait_ms", waited_ms)
+
+    def on_success(self, headers: Optional[Mapping[str, str]] = None):
+        self.observe_headers(headers)
+        if self.limit < self.max_concurrency:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._apply_limit()
+
+    def on_error(self, status: Optional[int], headers: Optional[Mapping[str, str]], attempt: int) -> float:
+        """Record a throttled or retryable (RETRYABLE_STATUS) call and return how long to back off.
+
+        Other statuses are client errors, not throttling; callers do not pass them here.
+        """
+        self.observe_headers(headers)
+        hint = retry_after(headers)
+        if status == 429:
+            metrics.inc("llm_throttled_total", kind="429")
+            self.limit = max(float(self.min_concurrency), self.limit * settings.LLM_ADAPTIVE_DECREASE_FACTOR)
+            self._apply_limit()
+            if hint is None and headers:
+                resets = [parse_duration(headers.get(f"x-ratelimit-reset-{k}")) for k in ("requests", "tokens")]
+                resets = [r for r in resets if r]
+                hint = max(resets) if resets else None
+        else:
+            metrics.inc("llm_throttled_total", kind="5xx")
+
+        base = settings.LLM_RETRY_BASE_SECONDS * (2 ** attempt)
+        delay = (hint if hint is not None else base) + random.uniform(0, base / 2)
+        if status == 429:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        metrics.observe("llm_retry_delay_ms", delay * 1000)
+        return delay
+
+    def should_retry(self, status: Optional[int], attempt: int, delay: float) -> bool:
+        """Skip retries that cannot succeed soon or that pile onto a saturated queue."""
+        if status not in RETRYABLE_STATUS or attempt >= settings.LLM_MAX_RETRIES:
+            return False
+        if delay > settings.LLM_RETRY_MAX_DELAY_SECONDS:
+            metrics.inc("llm_retries_skipped_total", reason="delay")
+            return False
+        if llm_scheduler.depth() > settings.LLM_RETRY_MAX_QUEUE:
+            metrics.inc("llm_retries_skipped_total", reason="saturated")
+            return False
+        return True
+
+
+openai_limiter = AdaptiveRateController()
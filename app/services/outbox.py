@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+from app.core.token_bucket import TokenBucket
+from app.services.graph_client import graph_client
+from app.services.openai_limiter import retry_after
+from app.services.shop_cache import shop_cache
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+
+
+class Outbox:
+    """Durable queue of outbound WhatsApp text messages.
+
+    ``enqueue`` records the message in ``outbound_messages`` and hands it to
+    an in-memory dispatcher, so callers return without waiting on Meta.
+    Workers pace each phone_number_id with its own token bucket, retry 429
+    and 5xx responses with backoff and move messages that keep failing (or
+    fail permanently) to status "dead". Pending documents are picked up
+    again on startup; sent and dead ones expire by TTL (see app/core/indexes.py). Without a running dispatcher (scripts, tests) messages
+    are delivered inline with a single attempt and left pending on failure.
+
+    Access tokens are never written to Mongo; recovered messages resolve
+    them from the shop of their phone_number_id.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.OUTBOX_WORKERS
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._timers: Dict[object, asyncio.TimerHandle] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def depth(self) -> int:
+        """Messages waiting for a worker, including those parked for a retry or rate limit."""
+        return (self._queue.qsize() if self._queue is not None else 0) + len(self._timers)
+
+    def _bucket(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_number_id)
+        if bucket is None:
+            bucket = TokenBucket(settings.OUTBOX_RATE_PER_SECOND, settings.OUTBOX_BURST)
+            self._buckets[phone_number_id] = bucket
+        return bucket
+
+    async def enqueue(
+        self,
+        phone_number_id: str,
+        to: str,
+        body: str,
+        kind: str = "reply",
+        access_token: Optional[str] = None,
+        shop_id: Optional[str] = None,
+    ):
+        now = datetime.utcnow()
+        doc = {
+            "phone_number_id": phone_number_id,
+            "to": to,
+            "body": body,
+            "kind": kind,
+            "shopId": shop_id,
+            "status": PENDING,
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "createdAt": now,
+        }
+        try:
+            await db.get_db().outbound_messages.insert_one(doc)
+        except Exception as e:
+            # Still deliver; only durability across a restart is lost.
+            logger.warning(f"Could not persist outbound message to {to}: {e}")
+        job = {**doc, "access_token": access_token}
+        metrics.inc("outbox_enqueued_total", kind=kind)
+        if self.running:
+            self._queue.put_nowait(job)
+            metrics.set_gauge("outbox_queue_depth", self._queue.qsize())
+        else:
+            await self._deliver(job)
+        return doc.get("_id")
+
+    async def _update(self, job: dict, fields: dict):
+        if job.get("_id") is None:
+            return
+        try:
+            await db.get_db().outbound_messages.update_one({"_id": job["_id"]}, {"$set": fields})
+        except Exception as e:
+            logger.warning(f"Could not update outbound message {job['_id']}: {e}")
+
+    async def _access_token(self, job: dict) -> Optional[str]:
+        if job.get("access_token"):
+            return job["access_token"]
+        shop = await shop_cache.resolve(job["phone_number_id"])
+        if shop:
+            token = shop.get("whatsapp_access_token") or shop.get("whatsappAccessToken")
+            if token:
+                return token
+        return settings.WHATSAPP_ACCESS_TOKEN or None
+
+    async def _deliver(self, job: dict):
+        """Send one message and record the outcome; schedules a retry if needed."""
+        token = await self._access_token(job)
+        if not token:
+            await self._dead(job, "No WhatsApp access token")
+            return
+        status, headers, error = None, None, None
+        try:
+            resp = await graph_client.send_text(job["phone_number_id"], token, job["to"], job["body"])
+            status, headers = resp.status_code, resp.headers
+            if status != 200:
+                error = f"{status} - {resp.text}"
+        except Exception as e:
+            error = str(e)
+
+        attempts = job.get("attempts", 0) + 1
+        job["attempts"] = attempts
+        if status == 200:
+            lag_ms = (datetime.utcnow() - job["createdAt"]).total_seconds() * 1000
+            metrics.observe("outbox_delivery_lag_ms", lag_ms, kind=job["kind"])
+            metrics.inc("outbox_sent_total", kind=job["kind"])
+            await self._update(job, {"status": SENT, "attempts": attempts, "sentAt": datetime.utcnow()})
+            logger.info(f"WhatsApp {job['kind']} sent to {job['to']}")
+            return
+
+        retryable = status is None or status == 429 or status >= 500
+        if not retryable or attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            await self._dead(job, error)
+            return
+
+        base = settings.OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        hint = retry_after(headers)
+        delay = (hint if hint is not None else base) + random.uniform(0, base / 2)
+        if status == 429:
+            # Meta is throttling this number: drain its bucket as well.
+            self._bucket(job["phone_number_id"]).sync(0)
+        metrics.inc("outbox_retries_total", status=str(status or "error"))
+        logger.warning(f"WhatsApp send to {job['to']} failed ({error}), retry {attempts} in {delay:.1f}s")
+        await self._update(job, {
+            "attempts": attempts,
+            "lastError": error,
+            "nextAttemptAt": datetime.utcnow() + timedelta(seconds=delay),
+        })
+        if self.running:
+            self._schedule(job, delay)
+
+    async def _dead(self, job: dict, error: Optional[str]):
+        metrics.inc("outbox_dead_total", kind=job["kind"])
+        logger.error(f"WhatsApp {job['kind']} to {job['to']} dead-lettered: {error}")
+        await self._update(job, {
+            "status": DEAD, "attempts": job.get("attempts", 0), "lastError": error, "deadAt": datetime.utcnow(),
+        })
+
+    def _schedule(self, job: dict, delay: float):
+        key = object()
+
+        def put():
+            self._timers.pop(key, None)
+            if self._queue is not None:
+                self._queue.put_nowait(job)
+
+        self._timers[key] = asyncio.get_running_loop().call_later(max(0.0, delay), put)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            metrics.set_gauge("outbox_queue_depth", self._queue.qsize())
+            try:
+                wait = self._bucket(job["phone_number_id"]).time_until(1)
+                if wait > 0:
+                    # Park it instead of blocking other numbers behind it.
+                    self._schedule(job, wait)
+                    continue
+                self._bucket(job["phone_number_id"]).try_acquire(1)
+                with metrics.timer("outbox_send_ms"):
+                    await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Outbox started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop dispatching. Undelivered messages stay pending in Mongo for the next start."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def requeue_pending(self, limit: int = 1000) -> int:
+        docs = await db.get_db().outbound_messages.find({"status": PENDING}).sort("createdAt", 1).to_list(limit)
+        now = datetime.utcnow()
+        for doc in docs:
+            delay = max(0.0, (doc.get("nextAttemptAt", now) - now).total_seconds())
+            self._schedule({**doc, "access_token": None}, delay)
+        if docs:
+            logger.info(f"Re-queued {len(docs)} pending outbound WhatsApp messages")
+        return len(docs)
+
+
+outbox = Outbox()
@@ -0,0 +1,257 @@
+"""In-memory matching of product names against a shop's catalog.
+
+Replaces one ``$regex`` query per ordered item: the catalog is loaded once
+(from ``catalog_cache``) and candidates are scored by the strongest of
+exact, prefix, substring, token-overlap and edit-distance similarity.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+EXACT = 1.0
+PREFIX = 0.9
+SUBSTRING = 0.85
+# Token overlap and edit distance are scaled into these ranges.
+TOKEN_MAX = 0.8
+EDIT_MAX = 0.8
+# Candidates re-ranked per lookup.
+CANDIDATE_LIMIT = 50
+SEARCH_CANDIDATES_PER_RESULT = 5
+# Words of a message that ``search`` looks at; product mentions come early.
+SEARCH_MAX_WORDS = 64
+
+
+def normalize_name(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or ``limit + 1`` as soon as it must exceed ``limit``.
+
+    Only the diagonal band of width ``2 * limit + 1`` is computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            value = previous[j - 1] if ca == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+@dataclass
+class ProductMatch:
+    product: dict
+    score: float
+    kind: str  # "exact", "prefix", "substring", "tokens" or "edit"
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of each token, padded so short names still index."""
+    grams = set()
+    for token in text.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _Entry:
+    __slots__ = ("product", "key", "norm", "words", "tokens", "grams")
+
+    def __init__(self, product: dict):
+        self.product = product
+        self.key = str(product.get("_id", id(product)))
+        self.norm = normalize_name(product.get("name", ""))
+        self.words = len(self.norm.split())
+        self.tokens = frozenset(self.norm.split())
+        self.grams = frozenset(trigrams(self.norm))
+
+
+class ProductMatcher:
+    """Fuzzy product-name index for one shop.
+
+    Token and character-trigram postings pick a short list of candidates,
+    which ``score`` re-ranks (exact, prefix, substring, token overlap, edit
+    distance), so misspelled Roman Urdu / English names still match without
+    scoring the whole catalog. ``upsert``/``remove`` keep it current as
+    products change.
+    """
+
+    def __init__(self, products: List[dict] = ()):
+        self.entries: Dict[str, _Entry] = {}
+        self.exact: Dict[str, set] = {}
+        self.token_postings: Dict[str, set] = {}
+        self.gram_postings: Dict[str, set] = {}
+        # Entries per name length in words; bounds the windows ``search`` tries.
+        self.name_words: Counter = Counter()
+        self.max_words = 0
+        for product in products:
+            self.upsert(product)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, product: dict):
+        entry = _Entry(product)
+        self.remove(entry.key)
+        if not entry.norm:
+            return
+        self.entries[entry.key] = entry
+        self.exact.setdefault(entry.norm, set()).add(entry.key)
+        self.name_words[entry.words] += 1
+        self.max_words = max(self.max_words, entry.words)
+        for token in entry.tokens:
+            self.token_postings.setdefault(token, set()).add(entry.key)
+        for gram in entry.grams:
+            self.gram_postings.setdefault(gram, set()).add(entry.key)
+
+    def remove(self, product_id):
+        entry = self.entries.pop(str(product_id), None)
+        if entry is None:
+            return
+        self.name_words[entry.words] -= 1
+        if not self.name_words[entry.words]:
+            del self.name_words[entry.words]
+            if entry.words == self.max_words:
+                self.max_words = max(self.name_words, default=0)
+        for index, keys in (
+            (self.exact, (entry.norm,)),
+            (self.token_postings, entry.tokens),
+            (self.gram_postings, entry.grams),
+        ):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(entry.key)
+                    if not ids:
+                        del index[key]
+
+    def candidates(self, query: str, limit: Optional[int] = None) -> List["_Entry"]:
+        """Entries sharing the most trigrams (tokens count double) with ``query``."""
+        hits: Counter = Counter()
+        for gram in trigrams(query):
+            hits.update(self.gram_postings.get(gram, ()))
+        for token in set(query.split()):
+            postings = self.token_postings.get(token, ())
+            hits.update(postings)
+            hits.update(postings)
+        return [self.entries[key] for key, _ in hits.most_common(limit or CANDIDATE_LIMIT)]
+
+    def score(
+        self, query: str, entry: "_Entry", whole_words: bool = False, floor: float = 0.0
+    ) -> Optional[ProductMatch]:
+        """Score ``query`` against one entry; ``whole_words`` stops "ka" matching inside "karahi".
+
+        Edit distance is only computed as far as it could still beat ``floor``.
+        """
+        if not query or not entry.norm:
+            return None
+        if query == entry.norm:
+            return ProductMatch(entry.product, EXACT, "exact")
+        name = f" {entry.norm} " if whole_words else entry.norm
+        needle = f" {query} " if whole_words else query
+        if name.startswith(needle) or (not whole_words and query.startswith(entry.norm)):
+            return ProductMatch(entry.product, PREFIX, "prefix")
+        if needle in name:
+            return ProductMatch(entry.product, SUBSTRING, "substring")
+
+        best = None
+        query_tokens = set(query.split())
+        shared = query_tokens & entry.tokens
+        if shared:
+            overlap = len(shared) / len(query_tokens | entry.tokens)
+            best = ProductMatch(entry.product, TOKEN_MAX * overlap, "tokens")
+
+        longest = max(len(query), len(entry.norm))
+        limit = max(1, longest // 3)
+        if floor > 0:
+            limit = min(limit, int(longest * (1 - floor / EDIT_MAX)))
+        if limit < 0:
+            return best
+        distance = edit_distance(query, entry.norm, limit)
+        if distance <= limit:
+            similarity = EDIT_MAX * (1 - distance / longest)
+            if best is None or similarity > best.score:
+                best = ProductMatch(entry.product, similarity, "edit")
+        return best
+
+    def _best(self, query: str, entries, min_score: float = 0.0) -> Optional[ProductMatch]:
+        best, best_key = None, None
+        for entry in entries:
+            candidate = self.score(query, entry, floor=best.score if best else min_score)
+            if candidate is None:
+                continue
+            # Equal scores prefer the name closest in length ("zinger" over "zinger deal").
+            key = (candidate.score, -abs(len(entry.norm) - len(query)))
+            if best is None or key > best_key:
+                best, best_key = candidate, key
+        return best
+
+    def match(self, name: str, min_score: float = 0.0) -> Optional[ProductMatch]:
+        """Best product for an item name, or None below ``min_score``."""
+        query = normalize_name(name)
+        if not query:
+            return None
+        exact = self.exact.get(query)
+        if exact:
+            return ProductMatch(self.entries[min(exact)].product, EXACT, "exact")
+        best = self._best(query, self.candidates(query), min_score)
+        if best is None or best.score < min_score:
+            return None
+        return best
+
+    def search(self, text: str, k: int = 3, min_score: float = 0.75) -> List[ProductMatch]:
+        """Products mentioned anywhere in a free-text message ("zinger ka price?").
+
+        Windows of the message that are exact product names are looked up
+        directly; the best few candidates are then scored against the
+        windows with about as many words as their name. Only the first
+        ``SEARCH_MAX_WORDS`` words are read and no window is longer than the
+        longest product name, so long messages cost linear time.
+        """
+        words = normalize_name(text).split()[:SEARCH_MAX_WORDS]
+        if not words:
+            return []
+        found: Dict[str, ProductMatch] = {}
+        for n in range(1, min(len(words), self.max_words) + 1):
+            for i in range(len(words) - n + 1):
+                for key in self.exact.get(" ".join(words[i:i + n]), ()):
+                    found[key] = ProductMatch(self.entries[key].product, EXACT, "exact")
+        for entry in self.candidates(" ".join(words), limit=k * SEARCH_CANDIDATES_PER_RESULT):
+            if entry.key in found:
+                continue
+            size = len(entry.tokens) or 1
+            windows = {
+                " ".join(words[i:i + n])
+                for n in range(max(1, size - 1), size + 2)
+                for i in range(max(1, len(words) - n + 1))
+            }
+            best = None
+            for window in windows:
+                floor = best.score if best else min_score
+                candidate = self.score(window, entry, whole_words=True, floor=floor)
+                if candidate is not None and (best is None or candidate.score > best.score):
+                    best = candidate
+            if best is not None and best.score >= min_score:
+                found[entry.key] = best
+        return sorted(found.values(), key=lambda m: m.score, reverse=True)[:k]
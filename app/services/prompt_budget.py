@@ -0,0 +1,215 @@
+"""Token estimation and token-budgeted prompt assembly.
+
+``count_tokens`` is an offline estimate (no tokenizer download) tuned to
+err slightly high for English and Roman Urdu; ``assemble_messages`` fits
+the system prompt, retrieved context, history and the user message into a
+budget, dropping the least important parts first.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Union
+
+# Words, digit groups (the tokenizer splits numbers into up to 3 digits),
+# single non-ASCII characters (Urdu script, emoji) and punctuation.
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\x00-\x7f]|[^\sA-Za-z\d]")
+# Chat format overhead per message and for priming the reply.
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# Most recent history messages kept ahead of retrieved context.
+RECENT_HISTORY = 2
+_TRUNCATED = "\n[...]"
+
+
+def _piece_tokens(piece: str) -> int:
+    # Short words are usually one token; longer ones split about every 4 letters.
+    return 1 if len(piece) <= 5 else (len(piece) + 3) // 4
+
+
+def count_tokens(text: Optional[str]) -> int:
+    return sum(_piece_tokens(piece) for piece in _PIECE_RE.findall(text or ""))
+
+
+def message_tokens(messages: Sequence[dict]) -> int:
+    return sum(count_tokens(m.get("content")) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the start of ``text`` within ``max_tokens`` (marking the cut)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(_TRUNCATED))
+    used = 0
+    for match in _PIECE_RE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > budget:
+            return text[:match.start()].rstrip() + _TRUNCATED
+    return text
+
+
+class SystemPrompt:
+    """A system prompt built from ranked context items that may be trimmed.
+
+    ``render(items)`` returns the system text with the given (most relevant
+    first) context items; ``render([])`` is the part that is always sent.
+    ``suffix`` follows the rendered text and is never trimmed, so output
+    instructions (e.g. "respond with JSON") survive a tight budget.
+    ``preview`` renders the same text without side effects such as caching
+    and is used for the trial prefixes that are measured and discarded.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[list], str],
+        context: Sequence = (),
+        suffix: str = "",
+        preview: Optional[Callable[[list], str]] = None,
+    ):
+        self.render = render
+        self.context = list(context)
+        self.suffix = suffix
+        self.preview = preview or render
+
+    @classmethod
+    def of(cls, prompt: Union[str, "SystemPrompt"]) -> "SystemPrompt":
+        if isinstance(prompt, SystemPrompt):
+            return prompt
+        return cls(lambda _: prompt)
+
+    def with_suffix(self, suffix: str) -> "SystemPrompt":
+        return SystemPrompt(self.render, self.context, self.suffix + suffix, self.preview)
+
+
+@dataclass
+class AssembledPrompt:
+    messages: List[dict]
+    tokens: int
+    context_used: int = 0
+    history_used: int = 0
+    trimmed: List[str] = field(default_factory=list)  # parts that were cut: "context", "history", "system", "user"
+
+    @property
+    def system(self) -> str:
+        return self.messages[0]["content"]
+
+
+def _normalize_message(msg) -> Optional[dict]:
+    if not isinstance(msg, dict):
+        return None
+    role = msg.get("role") or msg.get("sender") or msg.get("from")
+    if role:
+        role = role.lower()
+        if role in ("customer", "user"):
+            role = "user"
+        elif role in ("ai", "assistant", "bot", "system"):
+            role = "assistant"
+        else:
+            role = "user"
+    else:
+        role = "user"
+    content = msg.get("content") or msg.get("text") or msg.get("message")
+    if content is None:
+        return None
+    return {"role": role, "content": content}
+
+
+def normalize_history(history: Sequence, limit: Optional[int] = None) -> List[dict]:
+    """Map stored conversation messages onto chat roles, skipping unusable ones.
+
+    With ``limit``, only the last ``limit`` usable messages are returned and
+    older messages are never looked at.
+    """
+    if limit is None:
+        return [m for m in map(_normalize_message, history) if m is not None]
+    messages = []
+    for msg in reversed(history):
+        if len(messages) >= limit:
+            break
+        normalized = _normalize_message(msg)
+        if normalized is not None:
+            messages.append(normalized)
+    messages.reverse()
+    return messages
+
+
+def assemble_messages(
+    system: Union[str, SystemPrompt],
+    history: Sequence,
+    user_message: str,
+    budget: int,
+    max_history: int = 10,
+    max_user_tokens: Optional[int] = None,
+) -> AssembledPrompt:
+    """Build chat messages that fit ``budget`` prompt tokens.
+
+    Priority, highest first: the system prompt's suffix (never cut), the
+    fixed system prompt and the user message (both truncated only if they
+    cannot fit on their own), the last
+    RECENT_HISTORY messages, retrieved context items in rank order, then
+    older history, newest first.
+    """
+    system = SystemPrompt.of(system)
+    trimmed = []
+    available = budget - REPLY_OVERHEAD - 2 * MESSAGE_OVERHEAD
+
+    if max_user_tokens is not None and count_tokens(user_message) > max_user_tokens:
+        user_message = truncate_to_tokens(user_message, max_user_tokens)
+        trimmed.append("user")
+    available -= count_tokens(user_message)
+
+    suffix = system.suffix
+    available -= count_tokens(suffix)
+    base = system.render([])
+    base_tokens = count_tokens(base)
+    if base_tokens > available:
+        base = truncate_to_tokens(base, max(0, available))
+        base_tokens = count_tokens(base)
+        trimmed.append("system")
+        system = SystemPrompt(lambda _: base)
+    available -= base_tokens
+
+    turns = normalize_history(history, max_history) if max_history > 0 else []
+    costs = [count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in turns]
+    kept = 0
+
+    def take_history(limit):
+        nonlocal kept, available
+        while kept < min(limit, len(turns)) and costs[-1 - kept] <= available:
+            available -= costs[-1 - kept]
+            kept += 1
+
+    take_history(RECENT_HISTORY)
+
+    # The first n context items that fit; rendered text is measured, so
+    # headers the renderer adds around the items are counted too. Usually
+    # everything fits; otherwise longer prefixes never render shorter, so
+    # the largest n is found by bisection. Trials use ``preview`` and only
+    # the chosen prefix is rendered (and cached) with ``render``.
+    used, system_text = 0, base
+    low, high = 1, len(system.context)
+    if high:
+        text = system.preview(system.context)
+        if count_tokens(text) - base_tokens <= available:
+            used, system_text, low = high, text, high + 1
+        high -= 1
+    while low <= high:
+        n = (low + high) // 2
+        text = system.preview(system.context[:n])
+        if count_tokens(text) - base_tokens <= available:
+            used, system_text = n, text
+            low = n + 1
+        else:
+            high = n - 1
+    if used:
+        system_text = system.render(system.context[:used])
+    available -= count_tokens(system_text) - base_tokens
+    if used < len(system.context):
+        trimmed.append("context")
+
+    take_history(len(turns))
+    if kept < len(turns):
+        trimmed.append("history")
+
+    messages = [{"role": "system", "content": system_text + suffix}]
+    messages.extend(turns[len(turns) - kept:])
+    messages.append({"role": "user", "content": user_message})
+    return AssembledPrompt(messages, message_tokens(messages), used, kept, trimmed)
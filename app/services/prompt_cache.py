@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+_ROLE = """You help customers with:
+- Product inquiries and availability
+- Taking orders
+- Answering questions about the shop
+- Providing pricing information
+
+Always be polite, helpful and respond in the same language the customer uses.
+If customer writes in Urdu, respond in Urdu. If in English, respond in English."""
+
+_KB_HEADER = "IMPORTANT - Use these exact answers for these questions:\n"
+
+_KB_FOOTER = """
+
+If customer asks anything matching above questions, use the provided answer exactly.
+For other questions, use your general knowledge about the shop.
+
+"""
+
+
+class CompiledPrompt:
+    """System prompt of one shop at one version.
+
+    The shop-level text is formatted once; each distinct set of retrieved
+    knowledge base pairs is rendered once and kept in a small LRU.
+    """
+
+    def __init__(self, version: int, name: str, description: str, max_variants: int):
+        self.version = version
+        self.name = name
+        self.description = description
+        self.max_variants = max_variants
+        self.head = f"You are a helpful WhatsApp assistant for {name}.\n{description}\n\n"
+        self.plain = self.head + _ROLE
+        self.variants: "OrderedDict[tuple, str]" = OrderedDict()
+        self.size = len(self.plain)
+
+    def matches(self, version: int, name: str, description: str) -> bool:
+        return self.version == version and self.name == name and self.description == description
+
+    def _compose(self, qa_pairs: List) -> str:
+        knowledge_section = "\n".join(f"Q: {qa.question}\nA: {qa.answer}" for qa in qa_pairs)
+        return self.head + _KB_HEADER + knowledge_section + _KB_FOOTER + _ROLE
+
+    def preview(self, qa_pairs: List) -> str:
+        """``render`` without storing a new variant, for prompts that may be discarded."""
+        if not qa_pairs:
+            return self.plain
+        prompt = self.variants.get(tuple(qa.id for qa in qa_pairs))
+        return prompt if prompt is not None else self._compose(qa_pairs)
+
+    def render(self, qa_pairs: List) -> str:
+        if not qa_pairs:
+            return self.plain
+        key = tuple(qa.id for qa in qa_pairs)
+        prompt = self.variants.get(key)
+        if prompt is not None:
+            self.variants.move_to_end(key)
+            return prompt
+
+        prompt = self._compose(qa_pairs)
+        self.variants[key] = prompt
+        self.size += len(prompt)
+        while len(self.variants) > self.max_variants:
+            _, dropped = self.variants.popitem(last=False)
+            self.size -= len(dropped)
+        return prompt
+
+
+class PromptCache:
+    """Per-shop compiled system prompts, invalidated by a version counter.
+
+    Routers that change what goes into a prompt (shop profile, knowledge
+    base, WhatsApp connection) call ``bump``. The total length of cached text
+    is kept under ``max_chars`` by evicting least recently used shops.
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, max_variants: Optional[int] = None):
+        self.max_chars = max_chars or settings.PROMPT_CACHE_MAX_CHARS
+        self.max_variants = max_variants or settings.PROMPT_CACHE_MAX_VARIANTS
+        self._versions: Dict[str, int] = {}
+        self._prompts: "OrderedDict[str, CompiledPrompt]" = OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def version(self, shop_id) -> int:
+        return self._versions.get(str(shop_id), 0)
+
+    def bump(self, shop_id):
+        shop_id = str(shop_id)
+        self._versions[shop_id] = self._versions.get(shop_id, 0) + 1
+        self._drop(shop_id)
+
+    def clear(self):
+        self._versions.clear()
+        self._prompts.clear()
+        self._size = 0
+        metrics.set_gauge("prompt_cache_chars", 0)
+
+    def _drop(self, shop_id: str):
+        compiled = self._prompts.pop(shop_id, None)
+        if compiled is not None:
+            self._size -= compiled.size
+
+    def get(self, shop: dict) -> CompiledPrompt:
+        shop_id = str(shop.get("_id", ""))
+        version = self.version(shop_id)
+        name = shop.get("name", "Our Shop")
+        description = shop.get("description", "")
+
+        compiled = self._prompts.get(shop_id)
+        if compiled is not None and compiled.matches(version, name, description):
+            self._prompts.move_to_end(shop_id)
+            metrics.inc("prompt_cache_total", result="hit")
+            return compiled
+
+        metrics.inc("prompt_cache_total", result="miss")
+        self._drop(shop_id)
+        compiled = CompiledPrompt(version, name, description, self.max_variants)
+        self._prompts[shop_id] = compiled
+        self._size += compiled.size
+        return compiled
+
+    def preview(self, shop: dict, qa_pairs: List) -> str:
+        """What ``render`` would return, without caching anything or counting a lookup.
+
+        Used for the trial context prefixes ``assemble_messages`` measures.
+        """
+        shop_id = str(shop.get("_id", ""))
+        name = shop.get("name", "Our Shop")
+        description = shop.get("description", "")
+        compiled = self._prompts.get(shop_id)
+        if compiled is None or not compiled.matches(self.version(shop_id), name, description):
+            compiled = CompiledPrompt(self.version(shop_id), name, description, self.max_variants)
+        return compiled.preview(qa_pairs)
+
+    def render(self, shop: dict, qa_pairs: List) -> str:
+        """Return the system prompt for ``shop`` with the given KB pairs."""
+        compiled = self.get(shop)
+        before = compiled.size
+        prompt = compiled.render(qa_pairs)
+        self._size += compiled.size - before
+        self._evict()
+        return prompt
+
+    def _evict(self):
+        while self._size > self.max_chars and len(self._prompts) > 1:
+            _, compiled = self._prompts.popitem(last=False)
+            self._size -= compiled.size
+            metrics.inc("prompt_cache_evictions_total")
+        metrics.set_gauge("prompt_cache_chars", self._size)
+
+
+prompt_cache = PromptCache()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PLAN_LIMITS = {
+    "free": 200,
+    "starter": 1000,
+    "growth": 5000,
+    "business": float('inf')
+}
+
+# Shop fields that hold the monthly message counter.
+QUOTA_PROJECTION = {"messages_this_month": 1, "quota_month": 1, "last_reset_date": 1}
+
+
+def month_key(now: Optional[datetime] = None) -> str:
+    now = now or datetime.utcnow()
+    return f"{now.year:04d}-{now.month:02d}"
+
+
+def stored_usage(shop: Optional[dict], month: Optional[str] = None) -> int:
+    """Messages a shop document has recorded for ``month`` (default: this month).
+
+    Counters left over from an earlier month read as 0. Documents written
+    before ``quota_month`` existed fall back to ``last_reset_date``.
+    """
+    if not shop:
+        return 0
+    month = month or month_key()
+    stored_month = shop.get("quota_month")
+    if stored_month is None and isinstance(shop.get("last_reset_date"), datetime):
+        stored_month = month_key(shop["last_reset_date"])
+    if stored_month != month:
+        return 0
+    return shop.get("messages_this_month", 0) or 0
+
+
+class _Usage:
+    __slots__ = ("shop_ref", "month", "stored", "pending")
+
+    def __init__(self, shop_ref, month: str, stored: int):
+        self.shop_ref = shop_ref
+        self.month = month
+        self.stored = stored
+        self.pending = 0
+
+    @property
+    def used(self) -> int:
+        return self.stored + self.pending
+
+
+class QuotaService:
+    """Monthly message quotas, enforced in memory and written behind to Mongo.
+
+    The first message of a shop in a process reads its stored counter once.
+    After that each message reserves against the in-memory count, so the
+    limit is checked without a round trip and a burst cannot overshoot it.
+    A background loop flushes pending counts every QUOTA_FLUSH_INTERVAL_SECONDS
+    with a conditional update that also rolls the month over. When the
+    loop is not running (tests, scripts) every reservation is written through.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = flush_interval or settings.QUOTA_FLUSH_INTERVAL_SECONDS
+        self._usage: Dict[str, _Usage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def clear(self):
+        self._usage.clear()
+
+    async def _entry(self, shop: dict) -> _Usage:
+        shop_id = str(shop["_id"])
+        month = month_key()
+        entry = self._usage.get(shop_id)
+        if entry is not None and entry.month == month:
+            return entry
+        if entry is not None and entry.pending:
+            await self._flush_entry(entry)
+        stored = await db.get_db().shops.find_one({"_id": shop["_id"]}, QUOTA_PROJECTION)
+        current = self._usage.get(shop_id)
+        if current is not None and current.month == month:
+            # A concurrent message seeded it while we were reading.
+            return current
+        entry = _Usage(shop["_id"], month, stored_usage(stored, month))
+        self._usage[shop_id] = entry
+        return entry
+
+    async def try_consume(self, shop: dict) -> Tuple[bool, int, int]:
+        """Reserve one message for ``shop``. Returns (allowed, used, limit); limit -1 is unlimited."""
+        plan = shop.get("plan", "free")
+        limit = PLAN_LIMITS.get(plan, 200)
+        entry = await self._entry(shop)
+        if entry.used >= limit:
+            metrics.inc("quota_rejected_total", plan=plan)
+            return False, entry.used, int(limit)
+        entry.pending += 1
+        if not self.running:
+            await self._flush_entry(entry)
+        return True, entry.used, -1 if limit == float('inf') else int(limit)
+
+    def usage(self, shop: Optional[dict]) -> int:
+        """This month's count for a freshly read shop document, including unflushed messages."""
+        if not shop:
+            return 0
+        entry = self._usage.get(str(shop["_id"]))
+        stored = stored_usage(shop)
+        if entry is None or entry.month != month_key():
+            return stored
+        return max(stored, entry.stored) + entry.pending
+
+    async def _flush_entry(self, entry: _Usage):
+        amount, entry.pending = entry.pending, 0
+        if not amount:
+            return
+        shops = db.get_db().shops
+        now = datetime.utcnow()
+        increment = {"$inc": {"messages_this_month": amount}}
+        attempts = [
+            ({"quota_month": entry.month}, {**increment, "$set": {"last_reset_date": now}}),
+            # Counter from before quota_month existed, already reset this month.
+            (
+                {"quota_month": {"$exists": False}, "last_reset_date": {"$gte": datetime.strptime(entry.month, "%Y-%m")}},
+                {**increment, "$set": {"quota_month": entry.month, "last_reset_date": now}},
+            ),
+            # First write of the month starts the counter over.
+            (
+                {"$or": [{"quota_month": {"$exists": False}}, {"quota_month": {"$lt": entry.month}}]},
+                {"$set": {"quota_month": entry.month, "messages_this_month": amount, "last_reset_date": now}},
+            ),
+            # Another process rolled the month over first.
+            ({"quota_month": entry.month}, increment),
+        ]
+        doc = None
+        try:
+            for query, update in attempts:
+                doc = await shops.find_one_and_update(
+                    {"_id": entry.shop_ref, **query},
+                    update,
+                    projection=QUOTA_PROJECTION,
+                    return_document=True,
+                )
+                if doc is not None:
+                    break
+        except Exception as e:
+            entry.pending += amount
+            logger.error(f"Failed to flush message quota for shop {entry.shop_ref}: {e}")
+            return
+        metrics.inc("quota_flushed_messages_total", amount)
+        if doc is not None:
+            # Pick up messages counted by other processes.
+            entry.stored = stored_usage(doc, entry.month)
+        else:
+            entry.stored += amount
+
+    async def flush(self):
+        for entry in list(self._usage.values()):
+            if entry.pending:
+                await self._flush_entry(entry)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+quota_service = QuotaService()
@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.metrics import metrics
+
+# Fields the webhook pipeline needs from a shop document. Everything else
+# (business hours, delivery settings, ...) stays in Mongo.
+SHOP_PROJECTION = {
+    "name": 1,
+    "description": 1,
+    "plan": 1,
+    "aiConfig": 1,
+    "whatsapp_phone_number_id": 1,
+    "whatsappPhoneNumberId": 1,
+    "whatsapp_access_token": 1,
+    "whatsappAccessToken": 1,
+}
+
+_MISSING = object()
+
+
+class ShopCache:
+    """Bounded TTL/LRU cache from WhatsApp phone_number_id to a compact shop record.
+
+    Lookups that find no shop are cached too, so a misconfigured number does
+    not hit Mongo on every message. Routers that write shop documents call
+    ``invalidate`` so edits are visible on the next message.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries or settings.SHOP_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.SHOP_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, phone_number_id: str):
+        entry = self._entries.get(phone_number_id)
+        if entry is None:
+            return _MISSING
+        expires_at, shop = entry
+        if expires_at < time.monotonic():
+            del self._entries[phone_number_id]
+            return _MISSING
+        self._entries.move_to_end(phone_number_id)
+        return shop
+
+    def put(self, phone_number_id: str, shop: Optional[dict]):
+        self._entries[phone_number_id] = (time.monotonic() + self.ttl_seconds, shop)
+        self._entries.move_to_end(phone_number_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.inc("shop_cache_evictions_total")
+
+    def invalidate(self, phone_number_id: Optional[str] = None, shop_id=None):
+        """Drop entries by phone_number_id and/or by shop id."""
+        if phone_number_id:
+            self._entries.pop(phone_number_id, None)
+        if shop_id is not None:
+            shop_id = str(shop_id)
+            stale = [
+                pid for pid, (_, shop) in self._entries.items()
+                if shop is not None and str(shop.get("_id")) == shop_id
+            ]
+            for pid in stale:
+                del self._entries[pid]
+
+    def clear(self):
+        self._entries.clear()
+
+    async def resolve(self, phone_number_id: str) -> Optional[dict]:
+        resolved = await self.resolve_many([phone_number_id])
+        return resolved.get(phone_number_id)
+
+    async def resolve_many(self, phone_number_ids: Iterable[str]) -> dict:
+        """Return {phone_number_id: shop copy} for the ids that have a shop.
+
+        Cache misses are fetched from Mongo in a single query.
+        """
+        resolved, missing = {}, []
+        for pid in set(phone_number_ids):
+            if not pid:
+                continue
+            shop = self._get(pid)
+            if shop is _MISSING:
+                missing.append(pid)
+                continue
+            metrics.inc("shop_cache_hits_total")
+            if shop is not None:
+                resolved[pid] = dict(shop)
+
+        if not missing:
+            return resolved
+
+        metrics.inc("shop_cache_misses_total", len(missing))
+        with metrics.timer("webhook_stage_ms", stage="shop_lookup"):
+            shops = await db.get_db().shops.find(
+                {"$or": [
+                    {"whatsapp_phone_number_id": {"$in": missing}},
+                    {"whatsappPhoneNumberId": {"$in": missing}},
+                ]},
+                SHOP_PROJECTION,
+            ).to_list(len(missing) * 2)
+
+        found = {}
+        for shop in shops:
+            for key in ("whatsapp_phone_number_id", "whatsappPhoneNumberId"):
+                pid = shop.get(key)
+                if pid in missing and pid not in found:
+                    found[pid] = shop
+        for pid in missing:
+            shop = found.get(pid)
+            self.put(pid, shop)
+            if shop is not None:
+                resolved[pid] = dict(shop)
+        return resolved
+
+
+shop_cache = ShopCache()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+
+class WebhookQueue:
+    """Sharded asyncio worker pool for inbound WhatsApp messages.
+
+    Every job carries an ordering key (shop phone_number_id + customer
+    phone). Jobs with the same key always hash to the same shard, and each
+    shard is drained by exactly one worker, so one customer's messages to
+    one shop are handled in arrival order while different conversations
+    run in parallel.
+    """
+
+    def __init__(self, workers: Optional[int] = None, maxsize: Optional[int] = None):
+        self.workers = workers or settings.WEBHOOK_WORKERS
+        self.maxsize = maxsize if maxsize is not None else settings.WEBHOOK_QUEUE_MAXSIZE
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._handler: Optional[JobHandler] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def start(self, handler: JobHandler):
+        if self.running:
+            return
+        self._handler = handler
+        self._queues = [asyncio.Queue(maxsize=self.maxsize) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Webhook queue started with %s workers", self.workers)
+
+    async def stop(self, timeout: float = 10.0):
+        """Let workers drain what is already queued, then cancel them."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook queue stopped with %s jobs still pending", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+
+    def _shard(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self._queues)
+
+    def enqueue(self, key: str, job: dict) -> bool:
+        """Queue a job without blocking. Returns False if not running or full."""
+        if not self.running:
+            return False
+        job["_enqueued_at"] = time.perf_counter()
+        try:
+            self._queues[self._shard(key)].put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("webhook_queue_rejected_total")
+            return False
+        self._enqueued()
+        return True
+
+    async def put(self, key: str, job: dict, timeout: float) -> bool:
+        """Queue a job, waiting up to ``timeout`` seconds for room on its shard.
+
+        Returns False if not running or still full. Waiting callers are let
+        in first come first served, so per-key order holds.
+        """
+        if not self.running:
+            return False
+        job["_enqueued_at"] = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._queues[self._shard(key)].put(job), timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("webhook_queue_rejected_total")
+            return False
+        self._enqueued()
+        return True
+
+    def _enqueued(self):
+        metrics.inc("webhook_queue_enqueued_total")
+        metrics.set_gauge("webhook_queue_depth", self.depth())
+
+    async def _worker(self, index: int):
+        queue = self._queues[index]
+        while True:
+            job = await queue.get()
+            metrics.set_gauge("webhook_queue_depth", self.depth())
+            metrics.observe("webhook_queue_wait_ms", (time.perf_counter() - job.pop("_enqueued_at")) * 1000.0)
+            try:
+                with metrics.timer("webhook_job_ms"):
+                    await self._handler(job)
+            except Exception as e:
+                metrics.inc("webhook_job_failed_total")
+                logger.error(f"Webhook worker {index} job failed: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+
+webhook_queue = WebhookQueue()
@@ -0,0 +1,57 @@
+"""Create the registered MongoDB indexes and report on index health.
+
+Uses MONGODB_URL like the app. The registry lives in app/core/indexes.py.
+
+    python -m scripts.ensure_indexes            # create missing indexes, then report
+    python -m scripts.ensure_indexes --report   # report only
+    python -m scripts.ensure_indexes --list     # print the registry
+
+Exits with status 1 when an index could not be created, or with --report
+when a registered index is missing.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import List, Optional
+
+from app.core.database import db
+from app.core.indexes import ensure_indexes, index_report, registered_indexes
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--report", action="store_true", help="only report, do not create indexes")
+    parser.add_argument("--list", action="store_true", help="print the registered indexes and exit")
+    return parser.parse_args(argv)
+
+
+async def run(args) -> int:
+    if args.list:
+        for spec in registered_indexes():
+            print(f"{spec.collection}.{spec.index_name:<40} {json.dumps(spec.options())}  # {spec.purpose}")
+        return 0
+    status = 0
+    if not args.report:
+        result = await ensure_indexes()
+        print(json.dumps(result, indent=2))
+        status = 1 if result["failed"] else 0
+    report = await index_report()
+    print(json.dumps(report, indent=2))
+    if args.report and report["missing"]:
+        status = 1
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Stand-ins for Mongo, OpenAI and the Graph API.
+
+In-process fakes for the load harness, plus ``openai_server`` and
+``graph_server`` that run as local HTTP servers.
+"""
@@ -0,0 +1,73 @@
+"""Scripted chat completions for offline runs.
+
+``scripted_reply`` answers like the production prompts expect: a JSON
+intent object when JSON mode is requested, otherwise a short reply.
+``FakeChatClient`` exposes it through the ``client.chat.completions.create``
+shape that AIService calls.
+"""
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+from typing import Callable, Optional, Union
+
+_ORDER_RE = re.compile(r"\b(\d+)\s*(?:x\s*)?([a-z][a-z ]{2,40}?)(?:\s+(?:chahiye|bhej|order|de do|dedo)|$)", re.I)
+_ORDER_WORDS = ("chahiye", "order", "bhej", "de do", "dedo")
+
+
+def scripted_reply(params: dict) -> str:
+    messages = params.get("messages") or []
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    json_mode = (params.get("response_format") or {}).get("type") == "json_object"
+    system = (messages[0].get("content") or "") if messages else ""
+    if not json_mode:
+        if "running summary" in system:
+            return "Customer asked about products and prices."
+        return f"Ji zaroor! Aapke sawal \"{user[:60]}\" ka jawab: hamari delivery 45 minute mein hoti hai."
+    lowered = user.lower()
+    if any(word in lowered for word in _ORDER_WORDS):
+        match = _ORDER_RE.search(lowered)
+        quantity, name = (int(match.group(1)), match.group(2).strip()) if match else (1, lowered[:30])
+        return json.dumps({
+            "type": "order",
+            "items": [{"name": name, "quantity": quantity, "variation": "", "special_instructions": ""}],
+            "delivery_method": "delivery",
+            "special_note": "",
+            "reply": "Order note kar liya!",
+        })
+    return json.dumps({"type": "chat", "reply": "Ji, hum 12 baje se raat 12 baje tak khule hain."})
+
+
+def completion(content: str, model: str = "gpt-4o-mini") -> dict:
+    """A chat.completion response body in the OpenAI wire format."""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class FakeChatClient:
+    """In-process replacement for AsyncOpenAI's ``chat.completions.create``.
+
+    ``latency`` is seconds or a callable returning seconds; ``reply`` can
+    replace ``scripted_reply``.
+    """
+
+    def __init__(self, latency: Union[float, Callable[[], float], None] = None,
+                 reply: Optional[Callable[[dict], str]] = None):
+        self.latency = latency
+        self.reply = reply or scripted_reply
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **params):
+        self.requests += 1
+        delay = self.latency() if callable(self.latency) else (self.latency or 0)
+        if delay:
+            await asyncio.sleep(delay)
+        content = self.reply(params)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
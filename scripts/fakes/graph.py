@@ -0,0 +1,30 @@
+"""In-process stand-in for the Graph API ``/{phone_number_id}/messages`` endpoint."""
+import asyncio
+import json
+import time
+from typing import Callable, List, Optional, Union
+
+import httpx
+
+
+class GraphRecorder:
+    """Records every sent message; pass ``transport()`` to ``graph_client.start``."""
+
+    def __init__(self, latency: Union[float, Callable[[], float], None] = None):
+        self.latency = latency
+        self.sent: List[dict] = []
+        self.on_send: Optional[Callable[[str, float], None]] = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        delay = self.latency() if callable(self.latency) else (self.latency or 0)
+        if delay:
+            await asyncio.sleep(delay)
+        body = json.loads(request.content or b"{}")
+        now = time.perf_counter()
+        self.sent.append(body)
+        if self.on_send is not None:
+            self.on_send(body.get("to", ""), now)
+        return httpx.Response(200, json={"messages": [{"id": f"wamid.fake{len(self.sent)}"}]})
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return httpx.MockTransport(self.handle)
@@ -0,0 +1,63 @@
+"""Local stand-in for the WhatsApp Cloud (Graph) API.
+
+    python -m scripts.fakes.graph_server --port 8802 --latency uniform:50:250 --error-rate 0.01
+    GRAPH_API_BASE_URL=http://127.0.0.1:8802 uvicorn app.main:app
+
+Serves ``POST /{version}/{phone_number_id}/messages`` and the
+``GET /{version}/{phone_number_id}`` lookup used when a shop connects its
+number. Sent messages are recorded (``GET /_fake/requests``); rate limits
+and injected errors use Graph's error body and codes.
+"""
+from typing import Optional
+
+from fastapi import FastAPI, Request
+
+from scripts.fakes.server import FakeServerState, control_router, respond, serve
+
+
+def error_body(status: int, message: str) -> dict:
+    # 130429: Cloud API throughput reached; 131000: something went wrong.
+    code = 130429 if status == 429 else 131000
+    return {"error": {"message": message, "type": "OAuthException", "code": code, "fbtrace_id": "fake"}}
+
+
+def create_app(state: Optional[FakeServerState] = None) -> FastAPI:
+    state = state or FakeServerState()
+    app = FastAPI(title="Fake Graph API")
+    app.state.fake = state
+    app.include_router(control_router(state))
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        entry = await state.record(request)
+        outcome = await state.intercept(error_body)
+        if outcome is None:
+            sent = sum(1 for r in state.requests if r["path"].endswith("/messages"))
+            to = (entry["json"] or {}).get("to", "")
+            outcome = {"body": {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": to, "wa_id": to}],
+                "messages": [{"id": f"wamid.fake{sent}"}],
+            }}
+        return respond(outcome)
+
+    @app.get("/{version}/{phone_number_id}")
+    async def phone_number(version: str, phone_number_id: str, request: Request):
+        await state.record(request)
+        outcome = await state.intercept(error_body)
+        if outcome is None:
+            outcome = {"body": {
+                "id": phone_number_id,
+                "display_phone_number": "+92 300 0000000",
+                "verified_name": "Fake Shop",
+                "quality_rating": "GREEN",
+            }}
+        return respond(outcome)
+
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    serve(create_app, "Fake WhatsApp Cloud (Graph) API server", 8802)
@@ -0,0 +1,346 @@
+"""In-memory stand-in for the Motor database used by the load harness.
+
+Implements the subset of the Motor collection API (and of the query and
+update languages) that the webhook pipeline uses, with an optional
+per-operation latency so runs can model a remote Atlas cluster.
+"""
+import asyncio
+import copy
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _compare(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+                continue
+            if op == "$in":
+                if not any(_equals(value, a) for a in arg):
+                    return False
+                continue
+            if op == "$nin":
+                if any(_equals(value, a) for a in arg):
+                    return False
+                continue
+            if op == "$ne":
+                if _equals(value, arg):
+                    return False
+                continue
+            if op == "$regex":
+                flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                if not isinstance(value, str) or not re.search(arg, value, flags):
+                    return False
+                continue
+            if op == "$options":
+                continue
+            if value is _MISSING or value is None:
+                return False
+            try:
+                ok = {
+                    "$lt": value < arg, "$lte": value <= arg,
+                    "$gt": value > arg, "$gte": value >= arg,
+                }[op]
+            except TypeError:
+                return False
+            if not ok:
+                return False
+        return True
+    return _equals(value, condition)
+
+
+def _equals(value, expected) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif not _compare(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _set(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, copy.deepcopy(value))
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$unset":
+                parent = _get(doc, path.rsplit(".", 1)[0]) if "." in path else doc
+                if isinstance(parent, dict):
+                    parent.pop(path.rsplit(".", 1)[-1], None)
+            elif op == "$push":
+                current = _get(doc, path)
+                items = current if isinstance(current, list) else []
+                if isinstance(value, dict) and "$each" in value:
+                    items = items + copy.deepcopy(value["$each"])
+                    if "$slice" in value:
+                        n = value["$slice"]
+                        items = items[n:] if n < 0 else items[:n]
+                else:
+                    items = items + [copy.deepcopy(value)]
+                _set(doc, path, items)
+            elif op == "$pull":
+                current = _get(doc, path)
+                if isinstance(current, list):
+                    if isinstance(value, dict):
+                        kept = [v for v in current if not (isinstance(v, dict) and matches(v, value))]
+                    else:
+                        kept = [v for v in current if v != value]
+                    _set(doc, path, kept)
+            elif op == "$pullAll":
+                current = _get(doc, path)
+                if isinstance(current, list):
+                    _set(doc, path, [v for v in current if v not in value])
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported")
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = {k for k, v in projection.items() if v}
+    if included:
+        return {k: v for k, v in doc.items() if k in included or (k == "_id" and projection.get("_id", 1))}
+    return {k: v for k, v in doc.items() if k not in projection}
+
+
+def _sort_key(value):
+    # Missing fields sort first ascending, like null in Mongo.
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: dict, projection: Optional[dict]):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _results(self) -> List[dict]:
+        docs = [d for d in self.collection.docs.values() if matches(d, self.query)]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key(_get(d, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self.projection) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None):
+        await self.collection.pause()
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in await self.to_list(None):
+                yield doc
+        return iterate()
+
+
+class MemoryCollection:
+    def __init__(self, name: str, database: "MemoryDatabase"):
+        self.name = name
+        self.database = database
+        self.docs: Dict[Any, dict] = {}
+        self.indexes: Dict[str, dict] = {"_id_": {"key": [("_id", 1)]}}
+        self.ops = 0
+
+    async def pause(self):
+        self.ops += 1
+        latency = self.database.latency()
+        if latency:
+            await asyncio.sleep(latency)
+
+    def _insert(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return doc["_id"]
+
+    async def insert_one(self, doc: dict):
+        await self.pause()
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        await self.pause()
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                inserted.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        return MemoryCursor(self, query or {}, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        results = await MemoryCursor(self, query or {}, projection).limit(1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, query: dict):
+        await self.pause()
+        return sum(1 for d in self.docs.values() if matches(d, query))
+
+    def _upsert_doc(self, query: dict) -> dict:
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        doc.setdefault("_id", ObjectId())
+        return doc
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self.pause()
+        for doc in self.docs.values():
+            if matches(doc, query):
+                apply_update(doc, update)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            self.docs[doc["_id"]] = doc
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict):
+        await self.pause()
+        count = 0
+        for doc in self.docs.values():
+            if matches(doc, query):
+                apply_update(doc, update)
+                count += 1
+        return SimpleNamespace(matched_count=count, modified_count=count)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection=None,
+                                  return_document=False, upsert: bool = False, **kwargs):
+        await self.pause()
+        for doc in self.docs.values():
+            if matches(doc, query):
+                before = _project(doc, projection)
+                apply_update(doc, update)
+                return _project(doc, projection) if return_document else before
+        if upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            self.docs[doc["_id"]] = doc
+            return _project(doc, projection) if return_document else None
+        return None
+
+    async def delete_one(self, query: dict):
+        await self.pause()
+        for key, doc in list(self.docs.items()):
+            if matches(doc, query):
+                del self.docs[key]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query: dict):
+        await self.pause()
+        keys = [k for k, d in self.docs.items() if matches(d, query)]
+        for key in keys:
+            del self.docs[key]
+        return SimpleNamespace(deleted_count=len(keys))
+
+    async def create_index(self, keys, **kwargs):
+        keys = keys if isinstance(keys, list) else [(keys, 1)]
+        name = kwargs.pop("name", None) or "_".join(f"{k}_{v}" for k, v in keys)
+        self.indexes[name] = {"key": list(keys), **kwargs}
+        return name
+
+    async def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+
+class MemoryDatabase:
+    """Collections are created on first access, like a Motor database."""
+
+    def __init__(self, latency=None):
+        # ``latency`` is None, a number of seconds or a callable returning one.
+        self._latency = latency
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def latency(self) -> float:
+        if callable(self._latency):
+            return self._latency()
+        return self._latency or 0.0
+
+    async def warmup(self) -> float:
+        """Stands in for ``Database.warmup``; returns the ping in ms."""
+        return self.latency() * 1000.0
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self)
+        return self._collections[name]
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return getattr(self, name)
+
+    def operation_counts(self) -> Dict[str, int]:
+        return {name: c.ops for name, c in self._collections.items() if c.ops}
@@ -0,0 +1,49 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+    python -m scripts.fakes.openai_server --port 8801 --latency lognormal:400 --rpm 600
+    OPENAI_BASE_URL=http://127.0.0.1:8801/v1 uvicorn app.main:app
+
+Replies come from ``scripted_reply`` unless a scripted entry is queued via
+``POST /_fake/script``; an entry is either an error (``status``, ``body``,
+``headers``) or ``{"content": "..."}`` for a successful completion. Every
+response carries x-ratelimit headers when ``--rpm`` is set and 429s carry
+retry-after, so openai_limiter sees what production sends.
+"""
+from typing import Optional
+
+from fastapi import FastAPI, Request
+
+from scripts.fakes.chat_completions import completion, scripted_reply
+from scripts.fakes.server import FakeServerState, control_router, respond, serve
+
+
+def error_body(status: int, message: str) -> dict:
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return {"error": {"message": message, "type": kind, "code": kind}}
+
+
+def create_app(state: Optional[FakeServerState] = None) -> FastAPI:
+    state = state or FakeServerState()
+    app = FastAPI(title="Fake OpenAI")
+    app.state.fake = state
+    app.include_router(control_router(state))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        entry = await state.record(request)
+        params = entry["json"] or {}
+        outcome = await state.intercept(error_body)
+        model = params.get("model", "gpt-4o-mini")
+        if outcome is None:
+            outcome = {"body": completion(scripted_reply(params), model)}
+        elif "content" in outcome:
+            outcome = {**outcome, "body": completion(outcome["content"], model)}
+        return respond(outcome, state.rate_limit_headers())
+
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    serve(create_app, "Fake OpenAI chat completions server", 8801)
@@ -0,0 +1,178 @@
+"""Shared behaviour of the fake OpenAI and Graph API servers.
+
+Each fake keeps a FakeServerState: a latency distribution, a requests per
+minute limit that answers 429 like the real API, a random error rate, a
+queue of scripted responses that take precedence over everything else,
+and a record of every request. The ``/_fake`` routes change all of it at
+runtime:
+
+    POST /_fake/config    {"latency": "lognormal:400", "rpm": 60, "error_rate": 0.05}
+    POST /_fake/script    [{"status": 429, "headers": {"retry-after-ms": "200"}}, {"content": "..."}]
+    GET  /_fake/requests
+    POST /_fake/reset
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from fastapi import APIRouter, Body, Request
+from fastapi.responses import JSONResponse
+
+from app.core.token_bucket import TokenBucket
+
+
+def parse_latency(spec: Optional[str], rng: Optional[random.Random] = None) -> Optional[Callable[[], float]]:
+    """Latency sampler in seconds from a spec in milliseconds.
+
+    "0" or empty: none; "50" or "fixed:50"; "uniform:20:200";
+    "lognormal:400" or "lognormal:400:0.8" (median, sigma).
+    """
+    if not spec or spec == "0":
+        return None
+    rng = rng or random.Random()
+    kind, _, rest = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(v) for v in rest.split(":") if v]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        low, high = values
+        return lambda: rng.uniform(low, high) / 1000
+    if kind == "lognormal":
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda: rng.lognormvariate(0, sigma) * median / 1000
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+class FakeServerState:
+    def __init__(self, latency: Optional[str] = None, rpm: Optional[int] = None,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.requests: List[dict] = []
+        self.script: deque = deque()
+        self.configure(latency=latency, rpm=rpm, error_rate=error_rate)
+
+    def configure(self, latency: Optional[str] = None, rpm: Optional[int] = None, error_rate: float = 0.0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency, self.rng)
+        self.rpm = rpm
+        self.bucket = TokenBucket(rpm / 60, rpm) if rpm else TokenBucket()
+        self.error_rate = error_rate
+
+    def reset(self):
+        self.requests.clear()
+        self.script.clear()
+        self.configure()
+
+    def status(self) -> dict:
+        return {
+            "latency": self.latency_spec,
+            "rpm": self.rpm,
+            "error_rate": self.error_rate,
+            "scripted": len(self.script),
+            "requests": len(self.requests),
+        }
+
+    async def record(self, request: Request) -> dict:
+        try:
+            body = await request.json()
+        except Exception:
+            body = None
+        entry = {"method": request.method, "path": request.url.path, "json": body, "at": time.time()}
+        self.requests.append(entry)
+        return entry
+
+    async def intercept(self, error_body: Callable[[int, str], dict]) -> Optional[dict]:
+        """Apply latency and decide the outcome of a request before the normal reply.
+
+        Returns a scripted entry, an injected error ({"status", "body",
+        "headers"}) or None for the normal reply.
+        """
+        scripted = self.script.popleft() if self.script else None
+        delay = scripted.get("delay_ms", 0) / 1000 if scripted and "delay_ms" in scripted else (
+            self.latency() if self.latency else 0
+        )
+        if delay:
+            await asyncio.sleep(delay)
+        if scripted is not None:
+            return scripted
+        if self.bucket.limited and not self.bucket.try_acquire(1):
+            wait = self.bucket.time_until(1)
+            return {
+                "status": 429,
+                "body": error_body(429, "Rate limit reached"),
+                "headers": {"retry-after-ms": str(int(wait * 1000) + 1), "retry-after": str(int(wait) + 1)},
+            }
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return {"status": 500, "body": error_body(500, "Injected server error"), "headers": {}}
+        return None
+
+    def rate_limit_headers(self) -> dict:
+        if not self.bucket.limited:
+            return {}
+        remaining = int(max(0, self.bucket.tokens))
+        reset = (self.bucket.capacity - self.bucket.tokens) / self.bucket.rate
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{max(0.0, reset):.3f}s",
+        }
+
+
+def respond(entry: dict, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse(
+        entry.get("body") or {},
+        status_code=entry.get("status", 200),
+        headers={**(headers or {}), **(entry.get("headers") or {})},
+    )
+
+
+def control_router(state: FakeServerState) -> APIRouter:
+    router = APIRouter(prefix="/_fake")
+
+    @router.post("/config")
+    async def configure(config: dict = Body(...)):
+        state.configure(
+            latency=config.get("latency"),
+            rpm=config.get("rpm"),
+            error_rate=float(config.get("error_rate", 0.0)),
+        )
+        return state.status()
+
+    @router.post("/script")
+    async def script(entries: list = Body(...)):
+        state.script.extend(entries)
+        return state.status()
+
+    @router.get("/requests")
+    async def requests():
+        return state.requests
+
+    @router.post("/reset")
+    async def reset():
+        state.reset()
+        return state.status()
+
+    @router.get("/status")
+    async def status():
+        return state.status()
+
+    return router
+
+
+def serve(create_app: Callable[[FakeServerState], object], description: str, default_port: int):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--latency", help='e.g. "50", "uniform:20:200", "lognormal:400:0.5" (ms)')
+    parser.add_argument("--rpm", type=int, help="requests per minute before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    state = FakeServerState(args.latency, args.rpm, args.error_rate, args.seed)
+    uvicorn.run(create_app(state), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,342 @@
+"""Load and replay harness for the WhatsApp webhook.
+
+Replays webhook payloads against the app in-process at a target rate,
+with stand-ins for Mongo (scripts/fakes/memory_mongo.py), OpenAI and the
+Graph API, and reports throughput, HTTP and end-to-end (webhook received
+to reply sent) latency percentiles, event-loop lag and RSS.
+
+    python -m scripts.webhook_loadtest --rate 50 --duration 20
+    python -m scripts.webhook_loadtest --corpus payloads.jsonl --rate 20 --async-webhook
+    python -m scripts.webhook_loadtest --max-p99-ms 1500 --min-throughput 45 --json report.json
+
+A corpus is a JSONL file with one recorded webhook POST body per line.
+Shops are seeded for every phone_number_id it contains, message ids are
+made unique per replay, and the corpus is looped until the run ends.
+Without a corpus, synthetic chat, price, KB and order messages are used.
+Exits with status 1 when a --max-*/--min-* gate fails, so it can guard
+performance regressions in CI.
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "loadtest-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "loadtest-jwt-secret")
+
+import httpx
+
+from app.core.config import settings
+from app.core.database import db
+from app.main import app
+from app.routers.ai import iter_webhook_messages
+from app.services.ai_service import ai_service
+from app.services.graph_client import graph_client
+from scripts.fakes.chat_completions import FakeChatClient
+from scripts.fakes.graph import GraphRecorder
+from scripts.fakes.memory_mongo import MemoryDatabase
+
+WEBHOOK_PATH = "/api/ai/webhook/whatsapp"
+
+SYNTHETIC_MESSAGES = [
+    "salam",
+    "aap kab tak khule hain?",
+    "zinger burger ka price kya hai?",
+    "delivery charges kitne hain?",
+    "2 zinger burger chahiye",
+    "chicken biryani full plate available hai?",
+    "1 chicken karahi order karna hai",
+    "kya aap card payment lete hain?",
+    "mango shake kitne ka hai",
+    "shukriya",
+]
+PRODUCT_NAMES = [
+    "Zinger Burger", "Zinger Burger Deal", "Chicken Biryani (Full)", "Chicken Biryani (Half)",
+    "Chicken Karahi", "Mutton Karahi", "Mango Shake", "Coke 1.5L", "Fries (Large)", "Chicken Shawarma",
+]
+KB_PAIRS = [
+    ("Aap kab tak khule hain?", "Hum rozana 12 baje se raat 12 baje tak khule hain."),
+    ("Delivery charges kitne hain?", "Delivery Rs.200 hai, Rs.3000 se upar free."),
+    ("Kya aap card payment lete hain?", "Ji, delivery par card machine available hai."),
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 2),
+        "p95": round(percentile(samples, 95), 2),
+        "p99": round(percentile(samples, 99), 2),
+        "max": round(max(samples), 2) if samples else 0.0,
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_sampler(mean_ms: float, jitter: float = 0.5):
+    """Seconds of latency drawn around ``mean_ms`` (log-normal-ish, never negative)."""
+    if mean_ms <= 0:
+        return None
+    return lambda: max(0.0, random.lognormvariate(0, jitter) * mean_ms / 1000)
+
+
+def load_corpus(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_payload(phone_number_id: str, sender: str, text: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"phone_number_id": phone_number_id},
+            "messages": [{"from": sender, "id": "", "type": "text", "text": {"body": text}}],
+        }}]}],
+    }
+
+
+def seed(database: MemoryDatabase, phone_number_ids: List[str]):
+    """One shop per business number, each with a small catalog and knowledge base."""
+    for i, phone_number_id in enumerate(sorted(set(phone_number_ids))):
+        shop_id = f"shop{i}"
+        database.shops.docs[shop_id] = {
+            "_id": shop_id,
+            "userId": f"user{i}",
+            "name": f"Loadtest Shop {i}",
+            "description": "Fast food, biryani and karahi. Delivery across the city.",
+            "plan": "business",
+            "whatsapp_phone_number_id": phone_number_id,
+            "whatsapp_access_token": "loadtest-token",
+        }
+        for j, name in enumerate(PRODUCT_NAMES):
+            database.products.docs[f"{shop_id}-p{j}"] = {
+                "_id": f"{shop_id}-p{j}", "shopId": shop_id, "name": name,
+                "price": 200 + 150 * j, "unit": "piece", "stock": 100,
+            }
+        for j, (question, answer) in enumerate(KB_PAIRS):
+            database.knowledge_base.docs[f"{shop_id}-q{j}"] = {
+                "_id": f"{shop_id}-q{j}", "shopId": shop_id, "question": question,
+                "answer": answer, "is_active": True,
+            }
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.database = MemoryDatabase(latency_sampler(args.mongo_latency_ms))
+        self.graph = GraphRecorder(latency_sampler(args.graph_latency_ms))
+        self.chat = FakeChatClient(latency_sampler(args.openai_latency_ms))
+        self.http_ms: List[float] = []
+        self.e2e_ms: List[float] = []
+        self.loop_lag_ms: List[float] = []
+        self.rss_samples: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        # Receive times of messages still waiting for a reply, per customer.
+        self.outstanding: Dict[str, deque] = defaultdict(deque)
+        self._replied = asyncio.Event()
+
+    def payloads(self):
+        """Endless stream of payloads with unique message ids."""
+        counter = itertools.count()
+        if self.args.corpus:
+            corpus = load_corpus(self.args.corpus)
+            for payload in itertools.cycle(corpus):
+                payload = copy.deepcopy(payload)
+                for _, message in iter_webhook_messages(payload):
+                    message["id"] = f"wamid.loadtest{next(counter)}"
+                yield payload
+        rng = random.Random(self.args.seed)
+        numbers = [str(100000 + i) for i in range(self.args.shops)]
+        while True:
+            payload = synthetic_payload(
+                rng.choice(numbers),
+                f"92300{rng.randrange(self.args.customers):07d}",
+                rng.choice(SYNTHETIC_MESSAGES),
+            )
+            for _, message in iter_webhook_messages(payload):
+                message["id"] = f"wamid.loadtest{next(counter)}"
+            yield payload
+
+    def phone_number_ids(self) -> List[str]:
+        if self.args.corpus:
+            return [pid for payload in load_corpus(self.args.corpus) for pid, _ in iter_webhook_messages(payload)]
+        return [str(100000 + i) for i in range(self.args.shops)]
+
+    def on_reply(self, to: str, sent_at: float):
+        waiting = self.outstanding.get(to)
+        if waiting:
+            self.e2e_ms.append((sent_at - waiting.popleft()) * 1000)
+        self._replied.set()
+
+    async def monitor(self, stop: asyncio.Event, interval: float = 0.01):
+        """Sample event-loop lag (oversleep of a short timer) and RSS."""
+        last_rss = 0.0
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag_ms.append(max(0.0, (time.perf_counter() - started - interval) * 1000))
+            if started - last_rss >= 0.5:
+                self.rss_samples.append(rss_mb())
+                last_rss = started
+
+    async def post(self, client: httpx.AsyncClient, payload: dict):
+        received = time.perf_counter()
+        for _, message in iter_webhook_messages(payload):
+            self.outstanding[message.get("from", "")].append(received)
+        try:
+            response = await client.post(WEBHOOK_PATH, json=payload)
+            if response.status_code != 200:
+                self.errors[f"http_{response.status_code}"] += 1
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        self.http_ms.append((time.perf_counter() - received) * 1000)
+
+    async def drain(self, timeout: float):
+        """Wait until every message has been answered or ``timeout`` passes."""
+        deadline = time.perf_counter() + timeout
+        while any(self.outstanding.values()) and time.perf_counter() < deadline:
+            self._replied.clear()
+            try:
+                await asyncio.wait_for(self._replied.wait(), timeout=max(0.01, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                break
+
+    async def run(self) -> dict:
+        args = self.args
+        settings.WHATSAPP_WEBHOOK_ASYNC = args.async_webhook
+        db.get_db = lambda: self.database
+        # Keep the lifespan from pinging a real MONGODB_URL.
+        db.warmup = self.database.warmup
+        ai_service.client = self.chat
+        seed(self.database, self.phone_number_ids())
+        self.graph.on_send = self.on_reply
+        graph_client.start(transport=self.graph.transport())
+
+        stop = asyncio.Event()
+        async with app.router.lifespan_context(app):
+            monitor = asyncio.create_task(self.monitor(stop))
+            rss_before = rss_mb()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                started = time.perf_counter()
+                total = int(args.rate * args.duration)
+                tasks = []
+                payloads = self.payloads()
+                for i in range(total):
+                    delay = started + i / args.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(self.post(client, next(payloads))))
+                await asyncio.gather(*tasks)
+                await self.drain(args.drain_timeout)
+                elapsed = time.perf_counter() - started
+            stop.set()
+            await monitor
+
+        answered = len(self.e2e_ms)
+        unanswered = sum(len(q) for q in self.outstanding.values())
+        return {
+            "config": {
+                "rate": args.rate, "duration_s": args.duration, "async_webhook": args.async_webhook,
+                "corpus": args.corpus, "mongo_latency_ms": args.mongo_latency_ms,
+                "openai_latency_ms": args.openai_latency_ms, "graph_latency_ms": args.graph_latency_ms,
+            },
+            "requests": len(self.http_ms),
+            "replies": answered,
+            "unanswered": unanswered,
+            "errors": dict(self.errors),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(answered / elapsed, 2) if elapsed else 0.0,
+            "http_ms": summarize(self.http_ms),
+            "e2e_ms": summarize(self.e2e_ms),
+            "loop_lag_ms": summarize(self.loop_lag_ms),
+            "rss_mb": {
+                "before": round(rss_before, 1),
+                "peak": round(max(self.rss_samples, default=rss_before), 1),
+                "after": round(rss_mb(), 1),
+            },
+            "openai_requests": self.chat.requests,
+            "mongo_ops": self.database.operation_counts(),
+        }
+
+
+def check_gates(report: dict, args) -> List[str]:
+    failures = []
+    if args.max_p99_ms is not None and report["e2e_ms"]["p99"] > args.max_p99_ms:
+        failures.append(f"e2e p99 {report['e2e_ms']['p99']}ms > {args.max_p99_ms}ms")
+    if args.min_throughput is not None and report["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']}/s < {args.min_throughput}/s")
+    if args.max_loop_lag_ms is not None and report["loop_lag_ms"]["p99"] > args.max_loop_lag_ms:
+        failures.append(f"event-loop lag p99 {report['loop_lag_ms']['p99']}ms > {args.max_loop_lag_ms}ms")
+    if args.max_rss_mb is not None and report["rss_mb"]["peak"] > args.max_rss_mb:
+        failures.append(f"peak RSS {report['rss_mb']['peak']}MB > {args.max_rss_mb}MB")
+    if report["unanswered"] or report["errors"]:
+        failures.append(f"{report['unanswered']} unanswered messages, errors: {report['errors']}")
+    return failures
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=20, help="webhook POSTs per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--corpus", help="JSONL file of recorded webhook payloads")
+    parser.add_argument("--shops", type=int, default=5, help="synthetic shops")
+    parser.add_argument("--customers", type=int, default=200, help="synthetic customers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--async-webhook", action="store_true", help="acknowledge first, process in the queue")
+    parser.add_argument("--mongo-latency-ms", type=float, default=2)
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--graph-latency-ms", type=float, default=80)
+    parser.add_argument("--drain-timeout", type=float, default=30, help="seconds to wait for the last replies")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if end-to-end p99 is higher")
+    parser.add_argument("--min-throughput", type=float, help="fail if replies per second are lower")
+    parser.add_argument("--max-loop-lag-ms", type=float, help="fail if event-loop lag p99 is higher")
+    parser.add_argument("--max-rss-mb", type=float, help="fail if peak RSS is higher")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(LoadTest(args).run())
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    failures = check_gates(report, args)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
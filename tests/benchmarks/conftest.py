@@ -0,0 +1,81 @@
+"""Timing fixture and stored baseline for the benchmark suite.
+
+Benchmarks are skipped unless RUN_BENCHMARKS=1. Each measurement is the
+median per-call time over a few rounds and is compared with
+``baseline.json``: a result slower than BENCH_THRESHOLD (default 1.75) times
+its baseline fails the test. Baselines are machine dependent; refresh them
+on the reference machine with BENCH_UPDATE_BASELINE=1.
+
+    RUN_BENCHMARKS=1 python -m pytest -q tests/benchmarks
+    RUN_BENCHMARKS=1 BENCH_UPDATE_BASELINE=1 python -m pytest -q tests/benchmarks
+"""
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+import pytest
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+ROUNDS = 5
+# Calls per round are raised until a round takes at least this long.
+MIN_ROUND_SECONDS = 0.02
+
+_results = {}
+
+
+def measure(fn) -> float:
+    """Median milliseconds per call of ``fn``."""
+    started = time.perf_counter()
+    fn()
+    once = time.perf_counter() - started
+    calls = max(1, int(MIN_ROUND_SECONDS / once)) if once > 0 else 1000
+    rounds = ROUNDS if once * calls < 1 else 3
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        samples.append((time.perf_counter() - started) * 1000 / calls)
+    return statistics.median(samples)
+
+
+@pytest.fixture(scope="session")
+def baseline() -> dict:
+    if BASELINE_PATH.exists():
+        return json.loads(BASELINE_PATH.read_text())
+    return {}
+
+
+@pytest.fixture
+def bench(baseline):
+    """``bench(name, size, fn)`` times ``fn`` and checks it against the baseline."""
+    threshold = float(os.environ.get("BENCH_THRESHOLD", "1.75"))
+    updating = os.environ.get("BENCH_UPDATE_BASELINE") == "1"
+
+    def run(name: str, size: int, fn) -> float:
+        key = f"{name}[{size}]"
+        ms = measure(fn)
+        _results[key] = ms
+        expected = baseline.get(key)
+        if expected and not updating and ms > expected * threshold:
+            pytest.fail(f"{key} regressed: {ms:.4f}ms vs baseline {expected:.4f}ms (threshold x{threshold})")
+        return ms
+
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    terminalreporter.write_sep("-", "benchmarks (ms per call)")
+    for key in sorted(_results):
+        expected = baseline.get(key)
+        ratio = f"  x{_results[key] / expected:.2f}" if expected else "  (no baseline)"
+        terminalreporter.write_line(f"{key:<40} {_results[key]:>12.4f}{ratio}")
+    if os.environ.get("BENCH_UPDATE_BASELINE") == "1":
+        baseline.update({k: round(v, 4) for k, v in _results.items()})
+        BASELINE_PATH.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + "\n")
+        terminalreporter.write_line(f"baseline written to {BASELINE_PATH}")
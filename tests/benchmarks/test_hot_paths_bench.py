@@ -0,0 +1,194 @@
+"""Request hot-path benchmarks on 10, 1k and 100k item datasets.
+
+See conftest.py for running them and for the baseline check.
+"""
+import asyncio
+import csv
+import io
+import os
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import pytest
+from pydantic import TypeAdapter
+
+from app.models.order import OrderResponse
+from app.models.product import ProductResponse
+from app.routers.ai import enrich_order_items, product_context
+from app.routers.insights import weekly_stats
+from app.routers.knowledge_base import detect_category
+from app.routers.orders import order_response_doc
+from app.routers.products import product_fields, product_response_doc, read_product_rows
+from app.services.ai_service import ai_service
+from app.services.catalog_cache import catalog_cache
+from app.services.kb_index import kb_index
+from app.services.prompt_budget import SystemPrompt
+from app.services.prompt_cache import prompt_cache
+
+pytestmark = pytest.mark.skipif(os.environ.get("RUN_BENCHMARKS") != "1", reason="set RUN_BENCHMARKS=1")
+
+SIZES = [10, 1_000, 100_000]
+SHOP = {"_id": "bench-shop", "name": "Bench Biryani House", "description": "Biryani, karahi and BBQ since 1998."}
+
+ITEMS = ["zinger", "biryani", "karahi", "nihari", "burger", "shawarma", "paratha", "tikka", "pulao", "haleem"]
+SIZE_WORDS = ["small", "medium", "large", "full", "half", "1kg", "500g", "deal", "combo", "family"]
+QUESTIONS = [
+    ("delivery kitne time mein hoti hai", "45 minute mein delivery ho jati hai."),
+    ("aap ka address kya hai", "Main Boulevard, Gulberg, Lahore."),
+    ("kya refund milta hai", "Galat order par refund ya exchange milta hai."),
+    ("shop kab khulti hai", "Roz 12 baje se raat 12 baje tak."),
+    ("biryani available hai", "Ji haan, chicken aur beef biryani dono."),
+    ("table book ho sakti hai", "Ji, 4 log tak ki reservation hoti hai."),
+    ("aap ka naam kya hai", "Bench Biryani House."),
+]
+
+
+def _products(size: int, rng: random.Random) -> List[dict]:
+    return [
+        {
+            "_id": f"p{i}",
+            "shopId": SHOP["_id"],
+            "name": f"{rng.choice(ITEMS)} {rng.choice(SIZE_WORDS)} {i}",
+            "price": float(rng.randint(50, 3000)),
+            "category": "Food",
+            "description": "",
+            "inStock": True,
+            "created_at": datetime(2026, 1, 1),
+            "updated_at": datetime(2026, 1, 1),
+        }
+        for i in range(size)
+    ]
+
+
+def _kb(size: int) -> List[dict]:
+    return [
+        {"_id": f"kb{i}", "question": f"{q} {i}", "answer": a, "is_active": True}
+        for i, (q, a) in zip(range(size), QUESTIONS * (size // len(QUESTIONS) + 1))
+    ]
+
+
+def _messages(size: int, start: datetime) -> List[dict]:
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": QUESTIONS[i % len(QUESTIONS)][i % 2],
+            "timestamp": start + timedelta(minutes=7 * i),
+        }
+        for i in range(size)
+    ]
+
+
+def _orders(size: int, rng: random.Random) -> List[dict]:
+    return [
+        {
+            "_id": f"o{i}",
+            "shopId": SHOP["_id"],
+            "customerId": f"c{i % 500}",
+            "customerName": f"Customer {i % 500}",
+            "customerPhone": f"92300{i % 500:07d}",
+            "items": [{"productId": f"p{j}", "name": rng.choice(ITEMS), "quantity": 2, "price": 450.0} for j in range(3)],
+            "totalAmount": 2700.0,
+            "total": 2700.0,
+            "status": rng.choice(["new", "processing", "completed"]),
+            "timeline": [],
+            "createdAt": datetime(2026, 1, 1) + timedelta(minutes=i),
+            "updatedAt": datetime(2026, 1, 1) + timedelta(minutes=i),
+        }
+        for i in range(size)
+    ]
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+    catalog_cache.clear()
+    kb_index.clear()
+    prompt_cache.clear()
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_build_messages(bench, size):
+    # ``size`` stored messages; retrieved context is capped like KB_CONTEXT_TOP_K would be.
+    history = _messages(size, datetime(2026, 1, 1))
+    pairs = list(kb_index.put(SHOP["_id"], _kb(min(size, 100))).entries.values())
+    system = SystemPrompt(lambda items: prompt_cache.render(SHOP, items), pairs)
+    bench("build_messages", size, lambda: ai_service.build_messages(system, history, "biryani ka rate kya hai?"))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_shop_context(bench, loop, size):
+    # ``size`` KB pairs and ``size`` catalog products behind one webhook message.
+    kb_index.put(SHOP["_id"], _kb(size))
+    catalog_cache.put(SHOP["_id"], _products(size, random.Random(1)))
+    message = "biryani large ka rate kya hai aur delivery kitne time mein hoti hai"
+
+    async def build():
+        pairs = await kb_index.top_k(SHOP["_id"], message, 5)
+        products = await product_context(SHOP["_id"], message)
+        return SystemPrompt(lambda items: prompt_cache.render(SHOP, items) + products, pairs).render(pairs)
+
+    loop.run_until_complete(build())
+    bench("shop_context", size, lambda: loop.run_until_complete(build()))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_enrich_order_items(bench, loop, size):
+    products = _products(size, random.Random(2))
+    catalog_cache.put(SHOP["_id"], products)
+    rng = random.Random(3)
+    items = [{"name": p["name"][:-1], "quantity": 2} for p in rng.sample(products, min(size, 5))]
+    loop.run_until_complete(catalog_cache.get_matcher(SHOP["_id"]))
+    bench("enrich_order_items", size, lambda: loop.run_until_complete(enrich_order_items(items, SHOP["_id"])))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_detect_category(bench, size):
+    pairs = [(d["question"], d["answer"]) for d in _kb(size)]
+    bench("detect_category", size, lambda: [detect_category(q, a) for q, a in pairs])
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_import_rows(bench, size):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Product Name", "Price", "Details", "Qty", "Category"])
+    for p in _products(size, random.Random(4)):
+        writer.writerow([p["name"], p["price"], "fresh", 10, "Food"])
+    content = out.getvalue().encode("utf-8")
+
+    def parse():
+        columns = {}
+        return [product_fields(row, columns) for row in read_product_rows(content, "products.csv")]
+
+    assert len(parse()) == size
+    bench("import_rows", size, parse)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_weekly_stats(bench, size):
+    # ``size`` orders and ``size`` messages spread over conversations of 10.
+    orders = _orders(size, random.Random(5))
+    start = datetime(2026, 1, 1)
+    conversations = [{"messages": _messages(10, start + timedelta(hours=i))} for i in range(max(1, size // 10))]
+    bench("weekly_stats", size, lambda: weekly_stats(orders, conversations))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_list_responses(bench, size):
+    # What list_orders/list_products return plus the response_model validation FastAPI applies.
+    orders, products = _orders(size, random.Random(6)), _products(size, random.Random(7))
+    order_list, product_list = TypeAdapter(List[OrderResponse]), TypeAdapter(List[ProductResponse])
+
+    def build():
+        order_list.dump_python(order_list.validate_python([order_response_doc(d) for d in orders]), by_alias=True)
+        product_list.dump_python(
+            product_list.validate_python([product_response_doc(d) for d in products]), by_alias=True
+        )
+
+    bench("list_responses", size, build)
@@ -0,0 +1,79 @@
+"""Product index benchmarks on a 10k-product catalog.
+
+Skipped by default; run with ``RUN_BENCHMARKS=1 python -m pytest -q -s tests/benchmarks``.
+"""
+import os
+import random
+import statistics
+import time
+
+import pytest
+
+from app.services.product_matcher import ProductMatcher
+
+pytestmark = pytest.mark.skipif(os.environ.get("RUN_BENCHMARKS") != "1", reason="set RUN_BENCHMARKS=1")
+
+CATALOG_SIZE = 10_000
+LOOKUPS = 500
+
+ADJECTIVES = ["special", "masala", "crispy", "family", "mini", "double", "spicy", "classic", "desi", "cheese"]
+ITEMS = ["zinger", "biryani", "karahi", "nihari", "burger", "shawarma", "paratha", "tikka", "pulao", "haleem",
+         "samosa", "kulfi", "lassi", "chai", "daal", "qeema", "sajji", "broast", "pizza", "roll"]
+SIZES = ["small", "medium", "large", "full", "half", "1kg", "500g", "1.5l", "deal", "combo"]
+
+
+def _catalog(rng):
+    names = set()
+    while len(names) < CATALOG_SIZE:
+        names.add(f"{rng.choice(ADJECTIVES)} {rng.choice(ITEMS)} {rng.choice(SIZES)} {rng.randint(1, 60)}")
+    return [{"_id": f"p{i}", "name": name, "price": rng.randint(50, 3000)} for i, name in enumerate(sorted(names))]
+
+
+def _typo(rng, name):
+    i = rng.randrange(len(name))
+    return name[:i] + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i] + name[i:]
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"\n{label}: p50={statistics.median(samples):.3f}ms p95={p95:.3f}ms n={len(samples)}")
+    return p95
+
+
+def test_build_and_lookup_10k():
+    rng = random.Random(7)
+    products = _catalog(rng)
+
+    started = time.perf_counter()
+    matcher = ProductMatcher(products)
+    print(f"\nbuild {CATALOG_SIZE} products: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    hits, samples = 0, []
+    for product in rng.sample(products, LOOKUPS):
+        query = _typo(rng, product["name"])
+        started = time.perf_counter()
+        match = matcher.match(query, min_score=0.6)
+        samples.append((time.perf_counter() - started) * 1000)
+        hits += bool(match and match.product["_id"] == product["_id"])
+    _report("match with one typo", samples)
+    print(f"typo recall: {hits / LOOKUPS:.2%}")
+
+    found, samples = 0, []
+    for product in rng.sample(products, LOOKUPS):
+        message = f"bhai {_typo(rng, product['name'])} ka price kya hai"
+        started = time.perf_counter()
+        matches = matcher.search(message)
+        samples.append((time.perf_counter() - started) * 1000)
+        found += any(m.product["_id"] == product["_id"] for m in matches)
+    _report("free-text search with one typo", samples)
+    print(f"search recall: {found / LOOKUPS:.2%}")
+
+    samples = []
+    for product in rng.sample(products, LOOKUPS):
+        started = time.perf_counter()
+        matcher.upsert({**product, "name": product["name"] + " new"})
+        samples.append((time.perf_counter() - started) * 1000)
+    _report("upsert", samples)
+
+    assert hits / LOOKUPS > 0.9
@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import pytest
+
+from app.routers.ai import detect_intent_and_reply
+from app.services.ai_service import parse_json_object
+
+
+class FakeAIService:
+    def __init__(self, structured=None, structured_error=None, reply="plain reply"):
+        self.structured = structured
+        self.structured_error = structured_error
+        self.reply = reply
+        self.calls = []
+
+    async def generate_structured(self, shop_context, history, user_message, purpose="structured", max_tokens=500, **owner):
+        self.calls.append(purpose)
+        if self.structured_error:
+            raise self.structured_error
+        return self.structured
+
+    async def generate_response(self, shop_context, history, user_message, purpose="reply", **owner):
+        self.calls.append(purpose)
+        return self.reply
+
+
+def test_parse_json_object_handles_fences_and_apostrophes():
+    raw = '```json\n{"type": "chat", "reply": "We don\'t deliver on Sunday"}\n```'
+    assert parse_json_object(raw) == {"type": "chat", "reply": "We don't deliver on Sunday"}
+
+
+def test_parse_json_object_accepts_single_quoted_dicts():
+    assert parse_json_object("{'type': 'order', 'items': []}") == {"type": "order", "items": []}
+
+
+def test_parse_json_object_rejects_prose():
+    with pytest.raises(ValueError):
+        parse_json_object("This is a mocked AI response.")
+
+
+def test_chat_intent_and_reply_use_a_single_call():
+    service = FakeAIService(structured={"type": "chat", "reply": "Ji, hum 9 baje khulte hain"})
+
+    result = asyncio.run(detect_intent_and_reply(service, "ctx", [], "kab khulte ho?"))
+
+    assert result["reply"] == "Ji, hum 9 baje khulte hain"
+    assert service.calls == ["intent_reply"]
+
+
+def test_order_intent_keeps_items():
+    items = [{"name": "Zinger Burger", "quantity": 2}]
+    service = FakeAIService(structured={"type": "order", "items": items, "reply": "Noted"})
+
+    result = asyncio.run(detect_intent_and_reply(service, "ctx", [], "2 zinger burger"))
+
+    assert result["type"] == "order"
+    assert result["items"] == items
+
+
+def test_invalid_structured_reply_falls_back_to_chat():
+    service = FakeAIService(structured_error=ValueError("bad json"))
+
+    result = asyncio.run(detect_intent_and_reply(service, "ctx", [], "hello"))
+
+    assert result == {"type": "chat", "reply": "plain reply"}
+    assert service.calls == ["intent_reply", "reply"]
@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.config import settings
+from app.services import conversation_store
+
+
+class FakeCollection:
+    def __init__(self):
+        self.updates = []
+        self.inserted = []
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update, upsert))
+
+    async def insert_many(self, docs):
+        self.inserted.extend(docs)
+
+
+class FakeDB:
+    def __init__(self):
+        self.conversations = FakeCollection()
+        self.conversation_messages = FakeCollection()
+
+
+def test_append_pushes_only_new_messages_with_timestamps(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(conversation_store.db, "get_db", lambda: fake_db)
+    monkeypatch.setattr(settings, "CONVERSATION_ARCHIVE_ENABLED", False)
+
+    asyncio.run(conversation_store.append_messages("923001234567", "shop-1", [
+        {"role": "user", "content": "salam"},
+        {"role": "assistant", "content": "Walaikum salam!"},
+    ]))
+
+    query, update, upsert = fake_db.conversations.updates[0]
+    assert query == {"customerPhone": "923001234567", "shopId": "shop-1"}
+    assert upsert is True
+    push = update["$push"]["messages"]
+    assert push["$slice"] == -settings.CONVERSATION_WINDOW
+    assert [m["content"] for m in push["$each"]] == ["salam", "Walaikum salam!"]
+    assert all(m["timestamp"] for m in push["$each"])
+    assert "messages" not in update["$set"]
+    assert "createdAt" in update["$setOnInsert"]
+    assert fake_db.conversation_messages.inserted == []
+
+
+def test_archive_keeps_every_message(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(conversation_store.db, "get_db", lambda: fake_db)
+    monkeypatch.setattr(settings, "CONVERSATION_ARCHIVE_ENABLED", True)
+
+    asyncio.run(conversation_store.append_messages("923001234567", None, [{"role": "user", "content": "hi"}]))
+
+    assert fake_db.conversations.updates[0][0] == {"customerPhone": "923001234567"}
+    assert fake_db.conversation_messages.inserted[0]["content"] == "hi"
+    assert fake_db.conversation_messages.inserted[0]["shopId"] == ""
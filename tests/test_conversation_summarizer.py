@@ -0,0 +1,167 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services import conversation_summarizer as summarizer_module
+from app.services.ai_service import AIService
+from app.services.conversation_summarizer import ConversationSummarizer, summary_context, unsummarized_messages
+from scripts.fakes.chat_completions import FakeChatClient
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+class FakeResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class FakeConversations:
+    def __init__(self, doc):
+        self.doc = doc
+        self.updates = []
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc)
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+        if query.get("summaryUntil") != self.doc.get("summaryUntil"):
+            return FakeResult(0)
+        self.doc.update(update["$set"])
+        return FakeResult(1)
+
+
+class FakeDB:
+    def __init__(self, doc):
+        self.conversations = FakeConversations(doc)
+
+
+class FakeAIService:
+    def __init__(self):
+        self.calls = []
+
+    async def generate_response(self, shop_context, history, user_message, purpose="reply", **params):
+        self.calls.append((purpose, user_message, params))
+        return "Customer ne 2 zinger burger order kiye, address DHA Phase 5.\n"
+
+
+def _messages(n):
+    messages = [{"role": "user", "content": "legacy message without a timestamp"}]
+    for i in range(1, n):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"message {i}", "timestamp": START + timedelta(minutes=i)})
+    return messages
+
+
+def _setup(monkeypatch, doc):
+    fake_db, fake_ai = FakeDB(doc), FakeAIService()
+    monkeypatch.setattr(summarizer_module.db, "get_db", lambda: fake_db)
+    monkeypatch.setattr(summarizer_module, "ai_service", fake_ai)
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_TRIGGER_MESSAGES", 10)
+    monkeypatch.setattr(settings, "CONVERSATION_RECENT_MESSAGES", 4)
+    return fake_db, fake_ai
+
+
+def test_summary_covers_older_turns_and_keeps_history(monkeypatch):
+    fake_db, fake_ai = _setup(monkeypatch, {"messages": _messages(12)})
+    summarizer = ConversationSummarizer()
+
+    assert asyncio.run(summarizer.summarize("923001234567", "shop-1", "starter")) is True
+
+    doc = fake_db.conversations.doc
+    assert doc["summary"] == "Customer ne 2 zinger burger order kiye, address DHA Phase 5."
+    assert len(doc["messages"]) == 12
+    assert [m["content"] for m in unsummarized_messages(doc)] == ["message 8", "message 9", "message 10", "message 11"]
+    assert doc["summaryUntil"] == START + timedelta(minutes=7)
+    assert doc["summaryTokens"] > 0 and doc["summarySourceTokens"] > 0
+    purpose, transcript, params = fake_ai.calls[0]
+    assert purpose == "summary" and params["max_tokens"] == settings.CONVERSATION_SUMMARY_MAX_TOKENS
+    assert "Customer: legacy message without a timestamp" in transcript
+    assert "Assistant: message 7" in transcript and "message 8" not in transcript
+    query, update = fake_db.conversations.updates[0]
+    assert query == {"customerPhone": "923001234567", "shopId": "shop-1", "summaryUntil": None}
+    assert list(update) == ["$set"]
+
+    # The next run folds the old summary into the new one.
+    doc["messages"] += [{**m, "timestamp": m["timestamp"] + timedelta(hours=1)} for m in _messages(8)[1:]]
+    assert asyncio.run(summarizer.summarize("923001234567", "shop-1")) is True
+    assert fake_ai.calls[1][1].startswith("Current summary:\nCustomer ne 2 zinger")
+
+
+def test_schedules_one_background_run_past_the_trigger(monkeypatch):
+    fake_db, fake_ai = _setup(monkeypatch, {"messages": _messages(12)})
+    summarizer = ConversationSummarizer()
+
+    async def scenario():
+        assert summarizer.maybe_schedule("923001234567", "shop-1", "free", 10) is None
+        first = summarizer.maybe_schedule("923001234567", "shop-1", "free", 12)
+        second = summarizer.maybe_schedule("923001234567", "shop-1", "free", 12)
+        assert first is second
+        await summarizer.stop()
+
+    asyncio.run(scenario())
+
+    assert len(fake_ai.calls) == 1
+    assert len(unsummarized_messages(fake_db.conversations.doc)) == 4
+
+
+def test_cut_keeps_a_reply_with_its_message(monkeypatch):
+    # append_messages stamps a user message and its reply with the same time.
+    messages = []
+    for turn in range(6):
+        stamp = START + timedelta(minutes=turn)
+        messages += [
+            {"role": "user", "content": f"question {turn}", "timestamp": stamp},
+            {"role": "assistant", "content": f"answer {turn}", "timestamp": stamp},
+        ]
+    fake_db, fake_ai = _setup(monkeypatch, {"messages": messages})
+    monkeypatch.setattr(settings, "CONVERSATION_RECENT_MESSAGES", 3)
+
+    assert asyncio.run(ConversationSummarizer().summarize("923001234567", "shop-1")) is True
+
+    doc = fake_db.conversations.doc
+    assert doc["summaryUntil"] == START + timedelta(minutes=3)
+    assert [m["content"] for m in unsummarized_messages(doc)] == ["question 4", "answer 4", "question 5", "answer 5"]
+    assert "answer 3" in fake_ai.calls[0][1] and "question 4" not in fake_ai.calls[0][1]
+
+
+def test_empty_model_reply_keeps_the_previous_summary(monkeypatch):
+    metrics.reset()
+    until = START + timedelta(minutes=1)
+    fake_db, _ = _setup(monkeypatch, {"messages": _messages(12), "summary": "Wants 2 zinger", "summaryUntil": until})
+    monkeypatch.setattr(summarizer_module, "ai_service", AIService(client=FakeChatClient(reply=lambda params: "")))
+
+    assert asyncio.run(ConversationSummarizer().summarize("923001234567", "shop-1")) is False
+
+    doc = fake_db.conversations.doc
+    assert (doc["summary"], doc["summaryUntil"]) == ("Wants 2 zinger", until)
+    assert fake_db.conversations.updates == []
+    assert metrics.counter("conversation_summary_total", result="empty") == 1
+
+
+def test_no_source_tokens_when_recent_turns_fill_the_history(monkeypatch):
+    fake_db, _ = _setup(monkeypatch, {"messages": _messages(12)})
+    monkeypatch.setattr(settings, "AI_HISTORY_MAX_MESSAGES", 4)
+
+    assert asyncio.run(ConversationSummarizer().summarize("923001234567", "shop-1")) is True
+
+    assert fake_db.conversations.doc["summarySourceTokens"] == 0
+
+
+def test_prompt_uses_summary_and_counts_savings():
+    metrics.reset()
+    conversation = {"summary": "Wants 2 zinger", "summaryTokens": 5, "summarySourceTokens": 120}
+
+    ConversationSummarizer().record_savings("shop-1", conversation)
+    ConversationSummarizer().record_savings("shop-1", {"messages": []})
+
+    assert summary_context(conversation).endswith("\nWants 2 zinger")
+    assert summary_context(None) == ""
+    assert metrics.counter("conversation_summary_tokens_saved_total", shop="shop-1") == 115
+    assert metrics.counter("conversation_summary_prompts_total", shop="shop-1") == 1
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import threading
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import pytest
+from pymongo import monitoring
+
+from app.core.config import settings
+from app.core.database import Database, PoolMetrics, database_name
+from app.core.metrics import metrics
+
+ADDRESS = ("cluster0-shard-00-00.example.net", 27017)
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_database_name_from_url():
+    assert database_name("mongodb+srv://u:p@cluster0.example.net/shoptalk?retryWrites=true") == "shoptalk"
+    assert database_name("mongodb+srv://u:p@cluster0.example.net/?retryWrites=true") is None
+    assert database_name(None) is None
+
+
+def test_pool_metrics_track_checkouts_and_saturation():
+    pool = PoolMetrics(max_pool_size=4)
+    for n in range(3):
+        pool.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, n))
+        pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, n))
+
+    assert metrics.gauge("mongo_pool_in_use") == 3
+    assert metrics.gauge("mongo_pool_saturation") == 0.75
+    assert metrics.histogram("mongo_pool_checkout_ms").count == 3
+
+    # Another thread waits for a connection and times out.
+    def wait():
+        pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        assert metrics.gauge("mongo_pool_waiting") == 1
+        pool.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(
+            ADDRESS, monitoring.ConnectionCheckOutFailedReason.TIMEOUT
+        ))
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    thread.join()
+    pool.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 0))
+    pool.connection_closed(monitoring.ConnectionClosedEvent(ADDRESS, 0, "idle"))
+
+    assert metrics.counter("mongo_pool_checkout_failed_total", reason="timeout") == 1
+    assert metrics.gauge("mongo_pool_waiting") == 0
+    assert metrics.gauge("mongo_pool_in_use") == 2
+    assert metrics.gauge("mongo_pool_connections") == 2
+
+
+def test_get_db_caches_one_handle_with_pool_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MONGODB_URL", "mongodb://127.0.0.1:1/shoptalk?directConnection=true")
+    monkeypatch.setattr(settings, "MONGO_MAX_POOL_SIZE", 25)
+    monkeypatch.setattr(settings, "MONGO_WAIT_QUEUE_TIMEOUT_MS", 1500)
+    database = Database()
+
+    async def scenario():
+        # Motor binds the client to the running loop, as in the app.
+        first = database.get_db()
+        client = database.client
+        assert database.get_db() is first and database.client is client
+        return first
+
+    try:
+        handle = asyncio.run(scenario())
+        assert handle.name == "shoptalk"
+        options = database.client.options.pool_options
+        assert options.max_pool_size == 25 and options.wait_queue_timeout == 1.5
+    finally:
+        database.close()
+    assert database.client is None and database.database is None
+
+
+def test_warmup_without_url_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "MONGODB_URL", None)
+    database = Database()
+    assert database.get_db() is None
+    with pytest.raises(RuntimeError):
+        asyncio.run(database.warmup())
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import random
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.ai_service import AIService
+from app.services.graph_client import GraphAPIClient
+from app.services.openai_limiter import openai_limiter
+from scripts.fakes import graph_server, openai_server
+from scripts.fakes.server import FakeServerState, parse_latency
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter():
+    metrics.reset()
+    openai_limiter.reset()
+    yield
+    openai_limiter.reset()
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert parse_latency("0") is None and parse_latency(None) is None
+    assert parse_latency("50")() == parse_latency("fixed:50")() == 0.05
+    assert all(0.02 <= parse_latency("uniform:20:200", rng)() <= 0.2 for _ in range(100))
+    samples = sorted(parse_latency("lognormal:400:0.5", rng)() for _ in range(1001))
+    assert 0.3 < samples[500] < 0.5
+    with pytest.raises(ValueError):
+        parse_latency("gamma:3")
+
+
+def test_openai_base_url_setting(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", "http://127.0.0.1:8801/v1")
+    assert str(AIService().client.base_url) == "http://127.0.0.1:8801/v1/"
+
+
+def test_ai_service_retries_scripted_429_from_fake_openai(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_SECONDS", 0.001)
+    state = FakeServerState(rpm=600)
+    state.script.append({"status": 429, "body": openai_server.error_body(429, "slow down"),
+                         "headers": {"retry-after-ms": "20"}})
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-openai.local/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=openai_server.create_app(state))),
+    )
+
+    reply = asyncio.run(AIService(client=client).generate_response("ctx", [], "delivery hoti hai?"))
+
+    assert "delivery hoti hai?" in reply
+    assert [r["path"] for r in state.requests] == ["/v1/chat/completions"] * 2
+    assert state.requests[1]["json"]["messages"][-1]["content"] == "delivery hoti hai?"
+    assert metrics.counter("llm_throttled_total", kind="429") == 1
+    # The x-ratelimit headers of the successful reply reach the limiter.
+    assert openai_limiter.requests.rate == 10
+
+
+def test_fake_openai_rate_limit_and_control_routes():
+    client = TestClient(openai_server.create_app())
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}],
+            "response_format": {"type": "json_object"}}
+
+    assert client.post("/_fake/config", json={"rpm": 1}).json()["rpm"] == 1
+    first = client.post("/v1/chat/completions", json=body)
+    assert first.status_code == 200
+    assert first.json()["choices"][0]["message"]["content"].startswith('{"type": "chat"')
+    assert first.headers["x-ratelimit-remaining-requests"] == "0"
+
+    limited = client.post("/v1/chat/completions", json=body)
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after-ms"]) > 0
+    assert limited.json()["error"]["code"] == "rate_limit_exceeded"
+
+    client.post("/_fake/script", json=[{"content": "scripted"}])
+    assert client.post("/v1/chat/completions", json=body).json()["choices"][0]["message"]["content"] == "scripted"
+    assert len(client.get("/_fake/requests").json()) == 3
+    assert client.post("/_fake/reset").json() == {
+        "latency": None, "rpm": None, "error_rate": 0.0, "scripted": 0, "requests": 0,
+    }
+
+
+def test_graph_client_against_fake_graph_server():
+    state = FakeServerState()
+    app = graph_server.create_app(state)
+
+    async def scenario():
+        client = GraphAPIClient()
+        client.start(transport=httpx.ASGITransport(app=app))
+        ok = await client.send_text("111", "token", "923001234567", "Order confirm ho gaya")
+        lookup = await client.get_phone_number("111", "token")
+        state.configure(error_rate=1.0)
+        failed = await client.send_text("111", "token", "923001234567", "again")
+        await client.close()
+        return ok, lookup, failed
+
+    ok, lookup, failed = asyncio.run(scenario())
+
+    assert ok.json()["messages"][0]["id"] == "wamid.fake1"
+    assert lookup.json()["id"] == "111"
+    assert failed.status_code == 500 and failed.json()["error"]["code"] == 131000
+    sent = state.requests[0]
+    assert sent["path"] == f"/{settings.GRAPH_API_VERSION}/111/messages"
+    assert sent["json"]["text"] == {"body": "Order confirm ho gaya"}
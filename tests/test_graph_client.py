@@ -0,0 +1,39 @@
+import asyncio
+import json
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import httpx
+
+from app.core.metrics import metrics
+from app.services.graph_client import GraphAPIClient
+
+
+def test_send_text_reuses_one_pooled_client():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+    async def scenario():
+        client = GraphAPIClient()
+        client.start(transport=httpx.MockTransport(handler))
+        pooled = client._client
+        for n in range(3):
+            resp = await client.send_text("111", "token-abc", "923001234567", f"hello {n}")
+            assert resp.status_code == 200
+        assert client._client is pooled
+        await client.close()
+        assert not client.started
+
+    before = metrics.histogram("graph_request_ms", kind="send").count
+    asyncio.run(scenario())
+
+    assert len(requests) == 3
+    assert requests[0].url.path == "/v22.0/111/messages"
+    assert requests[0].headers["Authorization"] == "Bearer token-abc"
+    assert json.loads(requests[2].content)["text"] == {"body": "hello 2"}
+    assert metrics.histogram("graph_request_ms", kind="send").count == before + 3
@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.indexes import CASE_INSENSITIVE, ensure_indexes, index_report, registered_indexes, required_indexes
+from app.main import app
+from scripts.fakes.memory_mongo import MemoryDatabase
+
+
+class _Stats:
+    def __init__(self, stats):
+        self.stats = stats
+
+    async def to_list(self, length=None):
+        return self.stats
+
+
+def test_registry_covers_hot_queries_with_unique_names():
+    specs = registered_indexes()
+    names = [(s.collection, s.index_name) for s in specs]
+    assert len(names) == len(set(names))
+    assert ("orders", "shopId_1_status_1_createdAt_-1") in names
+    assert ("orders", "customerPhone_1_shopId_1_status_1") in names
+    assert ("conversations", "shopId_1_customerPhone_1") in names
+    assert ("otp_codes", "phone_1") in names
+
+
+def test_ensure_creates_every_index_with_options():
+    database = MemoryDatabase()
+
+    result = asyncio.run(ensure_indexes(database))
+
+    assert result == {"ensured": len(registered_indexes()), "failed": {}}
+    question = database.knowledge_base.indexes["shopId_1_question_1"]
+    assert question["key"] == [("shopId", 1), ("question", 1)]
+    assert question["collation"] == CASE_INSENSITIVE
+    assert database.webhook_dedup.indexes["createdAt_1"]["expireAfterSeconds"] == settings.WEBHOOK_DEDUP_TTL_SECONDS
+    assert database.shops.indexes["whatsappPhoneNumberId_1"]["sparse"] is True
+
+
+def test_one_failed_index_does_not_stop_the_rest():
+    database = MemoryDatabase()
+
+    async def conflict(keys, **kwargs):
+        raise RuntimeError("Index already exists with a different name")
+
+    database.users.create_index = conflict
+
+    result = asyncio.run(ensure_indexes(database))
+
+    assert list(result["failed"]) == ["users.phone_1"]
+    assert "shopId_1_customerPhone_1" in database.conversations.indexes
+
+
+def test_report_lists_missing_unregistered_and_unused():
+    database = MemoryDatabase()
+    specs = [s for s in registered_indexes() if s.collection == "orders"]
+    asyncio.run(ensure_indexes(database, specs[1:]))
+    asyncio.run(database.orders.create_index([("customerName", 1)]))
+    database.orders.aggregate = lambda pipeline: _Stats([
+        {"name": "_id_", "accesses": {"ops": 0}},
+        {"name": "shopId_1_createdAt_-1", "accesses": {"ops": 0}},
+        {"name": "customerPhone_1_shopId_1_status_1", "accesses": {"ops": 812}},
+        {"name": "customerName_1", "accesses": {"ops": 3}},
+    ])
+
+    report = asyncio.run(index_report(database, specs))
+
+    assert [m["index"] for m in report["missing"]] == [specs[0].index_name]
+    assert report["unregistered"] == ["orders.customerName_1"]
+    assert report["unused"] == ["orders.shopId_1_createdAt_-1"]
+    assert report["usage"]["orders.customerPhone_1_shopId_1_status_1"] == 812
+
+
+def test_lifespan_creates_required_indexes_with_ensure_off(monkeypatch):
+    database = MemoryDatabase()
+    monkeypatch.setattr(db, "get_db", lambda: database)
+    monkeypatch.setattr(db, "warmup", database.warmup)
+    monkeypatch.setattr(settings, "MONGO_ENSURE_INDEXES", False)
+    monkeypatch.setattr(settings, "WHATSAPP_WEBHOOK_ASYNC", False)
+
+    async def scenario():
+        async with app.router.lifespan_context(app):
+            pass
+
+    asyncio.run(scenario())
+
+    assert [s.index_name for s in required_indexes()] == ["sentAt_1", "deadAt_1", "settledAt_1", "createdAt_1"]
+    assert database.outbound_messages.indexes["deadAt_1"]["expireAfterSeconds"] == settings.OUTBOX_DEAD_RETENTION_SECONDS
+    assert "createdAt_1" in database.webhook_dedup.indexes
+    assert database.webhook_events.indexes["settledAt_1"]["expireAfterSeconds"] == settings.WEBHOOK_EVENT_RETENTION_SECONDS
+    assert list(database.orders.indexes) == ["_id_"]
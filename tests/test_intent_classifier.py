@@ -0,0 +1,48 @@
+import json
+import os
+from pathlib import Path
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.services.intent_classifier import CHAT, classify_intent
+from app.services.product_matcher import ProductMatcher
+
+
+CORPUS = Path(__file__).parent / "data" / "intent_corpus.jsonl"
+PRODUCTS = [
+    "Zinger Burger", "Chicken Biryani", "Beef Pulao", "Chocolate Cake", "Mango Shake",
+    "Chicken Karahi", "Naan", "Cold Drink 1.5L", "Fries",
+]
+
+
+def _load_corpus():
+    with CORPUS.open(encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def test_chat_short_circuit_precision_and_recall():
+    corpus = _load_corpus()
+    predicted_chat = [row for row in corpus if classify_intent(row["text"], PRODUCTS).label == CHAT]
+    true_positives = [row for row in predicted_chat if row["label"] == "chat"]
+    actual_chat = [row for row in corpus if row["label"] == "chat"]
+
+    precision = len(true_positives) / len(predicted_chat)
+    recall = len(true_positives) / len(actual_chat)
+
+    # A false "chat" loses an order, so precision is the number that matters.
+    assert precision == 1.0, [row["text"] for row in predicted_chat if row["label"] != "chat"]
+    assert recall >= 0.8
+
+
+def test_product_question_is_chat_but_product_order_is_not():
+    assert classify_intent("zinger burger ka price kya hai?", PRODUCTS).label == CHAT
+    assert classify_intent("2 zinger burger", PRODUCTS).label != CHAT
+    assert classify_intent("zinger burger", PRODUCTS).label != CHAT
+
+
+def test_matcher_token_index_classifies_like_product_names():
+    postings = ProductMatcher([{"_id": n, "name": name} for n, name in enumerate(PRODUCTS)]).token_postings
+    for row in _load_corpus():
+        expected = classify_intent(row["text"], PRODUCTS)
+        assert classify_intent(row["text"], product_tokens=postings) == expected, row["text"]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.database import db
+from app.services.kb_index import KnowledgeBaseIndex, ShopKnowledge
+
+
+DOCS = [
+    {"_id": "1", "question": "Delivery charges kitne hain?", "answer": "Rs. 200 delivery charges hain."},
+    {"_id": "2", "question": "What are your timings?", "answer": "Hum 11am se 11pm tak khule hain."},
+    {"_id": "3", "question": "Do you accept JazzCash?", "answer": "Ji haan, JazzCash aur EasyPaisa dono."},
+]
+
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+
+    async def to_list(self, length):
+        return self.records[:length]
+
+
+class FakeKnowledgeBase:
+    def __init__(self, records):
+        self.records = records
+        self.find_calls = 0
+
+    def find(self, query, projection=None):
+        self.find_calls += 1
+        return FakeCursor(self.records)
+
+
+class FakeDB:
+    def __init__(self):
+        self.knowledge_base = FakeKnowledgeBase(DOCS)
+
+
+def test_exact_match_ignores_case_and_punctuation():
+    match = ShopKnowledge(DOCS).match("delivery charges KITNE hain")
+    assert match.kind == "exact"
+    assert match.entry.id == "1"
+
+
+def test_fuzzy_match_scores_typos_high_and_unrelated_low():
+    knowledge = ShopKnowledge(DOCS)
+    typo = knowledge.match("what are ur timings")
+    assert typo.entry.id == "2" and typo.score >= 0.9
+    unrelated = knowledge.match("2 zinger burger chahiye")
+    assert unrelated is None or unrelated.score < 0.9
+
+
+def test_fast_answer_uses_threshold_and_caches_per_shop(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(db, "get_db", lambda: fake_db)
+    index = KnowledgeBaseIndex(max_shops=10, ttl_seconds=60)
+
+    async def scenario():
+        hit = await index.fast_answer("shop1", "Do you accept Jazzcash")
+        miss = await index.fast_answer("shop1", "Do you have parking space nearby?")
+        return hit, miss
+
+    hit, miss = asyncio.run(scenario())
+
+    assert hit.entry.answer.startswith("Ji haan")
+    assert miss is None
+    assert fake_db.knowledge_base.find_calls == 1
+    assert index.hit_rate("shop1") > 0
+
+    index.invalidate("shop1")
+    asyncio.run(index.fast_answer("shop1", "hello"))
+    assert fake_db.knowledge_base.find_calls == 2
+
+
+def test_bm25_ranks_the_relevant_pair_first():
+    docs = DOCS + [
+        {"_id": str(i), "question": f"Deal {i} mein kya hai?", "answer": f"Deal {i}: burger aur drink."}
+        for i in range(4, 40)
+    ]
+    knowledge = ShopKnowledge(docs)
+
+    results = knowledge.search("jazzcash se payment ho sakti hai?", 3)
+
+    assert results[0].entry.id == "3"
+    assert knowledge.search("xyz", 3) == []
+
+
+def test_upsert_and_remove_update_the_index_in_place():
+    knowledge = ShopKnowledge(DOCS)
+
+    knowledge.upsert({"_id": "2", "question": "What are your timings?", "answer": "Ab hum 24 ghante khule hain."})
+    knowledge.upsert({"_id": "4", "question": "Home delivery?", "answer": "Sirf DHA mein.", "is_active": True})
+    knowledge.remove("1")
+
+    assert len(knowledge) == 3
+    assert knowledge.match("what are your timings").entry.answer == "Ab hum 24 ghante khule hain."
+    assert knowledge.search("ghante", 1)[0].entry.id == "2"
+    assert knowledge.search("200 charges", 3) == []
+    assert knowledge.total_len == sum(knowledge.doc_len.values())
+
+    knowledge.upsert({"_id": "4", "question": "Home delivery?", "answer": "Sirf DHA mein.", "is_active": False})
+    assert "4" not in knowledge.entries
+    assert "dha" not in knowledge.postings
+
+
+def test_top_k_returns_small_kbs_whole_and_ranks_large_ones(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(db, "get_db", lambda: fake_db)
+    index = KnowledgeBaseIndex(max_shops=10, ttl_seconds=60)
+
+    small = asyncio.run(index.top_k("shop-1", "hello", 5))
+    assert {e.id for e in small} == {"1", "2", "3"}
+
+    top = asyncio.run(index.top_k("shop-1", "delivery charges?", 1))
+    assert [e.id for e in top] == ["1"]
+
+    index.upsert("shop-1", {"_id": "9", "question": "Free delivery?", "answer": "2000 se upar free delivery charges."})
+    index.remove("shop-1", "1")
+    top = asyncio.run(index.top_k("shop-1", "delivery charges?", 1))
+    assert [e.id for e in top] == ["9"]
+    assert fake_db.knowledge_base.find_calls == 1
@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.metrics import metrics
+from app.services.llm_scheduler import LLMScheduler, plan_weight
+
+
+def test_plan_weights_grow_with_plan_limits():
+    assert plan_weight("free") == 1
+    assert plan_weight("free") < plan_weight("starter") < plan_weight("growth") < plan_weight("business")
+    assert plan_weight("unknown") == 1
+
+
+def test_flooding_shop_does_not_starve_others():
+    metrics.reset()
+
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, per_shop_limit=1)
+        order = []
+
+        async def call(shop_id, plan="free"):
+            async with scheduler.slot(shop_id, plan):
+                order.append(shop_id)
+                await asyncio.sleep(0)
+
+        flood = [asyncio.create_task(call("spammer")) for _ in range(10)]
+        await asyncio.sleep(0)
+        quiet = [asyncio.create_task(call("quiet")) for _ in range(2)]
+        await asyncio.gather(*flood, *quiet)
+        return order
+
+    order = asyncio.run(scenario())
+
+    assert len(order) == 12
+    # Both "quiet" calls run long before the spammer's backlog drains.
+    assert max(i for i, shop in enumerate(order) if shop == "quiet") <= 4
+    assert metrics.histogram("llm_queue_wait_ms", shop="quiet").count == 2
+
+
+def test_caps_and_cancellation():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=3, per_shop_limit=2)
+        release = asyncio.Event()
+        peak = {"a": 0}
+
+        async def call(shop_id):
+            async with scheduler.slot(shop_id):
+                peak[shop_id] = max(peak.get(shop_id, 0), scheduler._inflight[shop_id])
+                await release.wait()
+
+        tasks = [asyncio.create_task(call("a")) for _ in range(4)] + [asyncio.create_task(call("b"))]
+        await asyncio.sleep(0.01)
+        assert scheduler.active == 3 and scheduler.depth() == 2
+
+        tasks[3].cancel()
+        await asyncio.sleep(0)
+        assert scheduler.depth() == 1
+
+        release.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert scheduler.active == 0 and scheduler.depth() == 0
+        return peak
+
+    peak = asyncio.run(scenario())
+    assert peak["a"] == 2
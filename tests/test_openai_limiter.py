@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.token_bucket import TokenBucket
+from app.services.ai_service import AIService
+from app.services.llm_scheduler import llm_scheduler
+from app.services.openai_limiter import openai_limiter, parse_duration, retry_after
+
+COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Ji haan"}}],
+}
+LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "600",
+    "x-ratelimit-remaining-requests": "599",
+    "x-ratelimit-limit-tokens": "60000",
+    "x-ratelimit-remaining-tokens": "59000",
+}
+
+
+def _service(responses, seen):
+    async def handler(request):
+        seen.append(request)
+        return responses.pop(0)
+
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-openai.local/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    return AIService(client=client)
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter():
+    metrics.reset()
+    openai_limiter.reset()
+    yield
+    openai_limiter.reset()
+
+
+def test_header_parsing():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5") == 1.5
+    assert retry_after({"retry-after-ms": "250"}) == 0.25
+    assert retry_after({"retry-after": "3"}) == 3
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate=100, capacity=2)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    waited = asyncio.run(bucket.acquire())
+    assert 0 < waited < 0.1
+
+
+def test_throttle_honours_retry_after_and_halves_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_SECONDS", 0.001)
+    seen = []
+    service = _service([
+        httpx.Response(429, json={"error": {"message": "slow down"}}, headers={"retry-after-ms": "20"}),
+        httpx.Response(200, json=COMPLETION, headers=LIMIT_HEADERS),
+    ], seen)
+
+    reply = asyncio.run(service.generate_response("ctx", [], "delivery hoti hai?"))
+
+    assert reply == "Ji haan"
+    assert len(seen) == 2
+    assert openai_limiter.limit < settings.LLM_MAX_CONCURRENCY
+    assert llm_scheduler.max_concurrency == int(openai_limiter.limit)
+    assert metrics.counter("llm_throttled_total", kind="429") == 1
+    assert metrics.histogram("llm_retry_delay_ms").percentile(50) >= 20
+    # Headers from the successful call now drive the local buckets.
+    assert openai_limiter.requests.rate == 10 and openai_limiter.tokens.capacity == 60000
+    assert metrics.gauge("llm_ratelimit_remaining_requests") == 599
+
+
+def test_long_retry_hints_fail_fast(monkeypatch):
+    seen = []
+    service = _service([
+        httpx.Response(429, json={"error": {"message": "quota"}}, headers={"retry-after": "120"}),
+    ], seen)
+
+    with pytest.raises(Exception):
+        asyncio.run(service.generate_response("ctx", [], "hello"))
+
+    assert len(seen) == 1
+    assert metrics.counter("llm_retries_skipped_total", reason="delay") == 1
+
+
+def test_client_errors_are_not_throttling():
+    seen = []
+    service = _service([httpx.Response(401, json={"error": {"message": "bad key"}})], seen)
+
+    with pytest.raises(Exception):
+        asyncio.run(service.generate_response("ctx", [], "hello"))
+
+    assert len(seen) == 1
+    assert metrics.counter("llm_request_errors_total", status="401") == 1
+    assert metrics.counter("llm_throttled_total", kind="5xx") == 0
+    assert metrics.histogram("llm_retry_delay_ms").count == 0
+    assert openai_limiter.paused_until == 0 and openai_limiter.limit == settings.LLM_MAX_CONCURRENCY
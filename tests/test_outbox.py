@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services import outbox as outbox_module
+from app.services.outbox import DEAD, PENDING, SENT, Outbox
+
+
+class FakeOutboundMessages:
+    def __init__(self):
+        self.docs = {}
+        self._ids = itertools.count(1)
+
+    async def insert_one(self, doc):
+        doc["_id"] = next(self._ids)
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def update_one(self, query, update):
+        self.docs[query["_id"]].update(update["$set"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.outbound_messages = FakeOutboundMessages()
+
+
+def _run(monkeypatch, responses, scenario):
+    fake_db = FakeDB()
+    monkeypatch.setattr(outbox_module.db, "get_db", lambda: fake_db)
+    monkeypatch.setattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 0.01)
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return responses.pop(0) if responses else httpx.Response(200, json={})
+
+    async def main():
+        outbox_module.graph_client.start(transport=httpx.MockTransport(handler))
+        try:
+            await scenario(Outbox(workers=2))
+        finally:
+            await outbox_module.graph_client.close()
+
+    asyncio.run(main())
+    return fake_db.outbound_messages.docs, sent
+
+
+def test_inline_delivery_without_dispatcher(monkeypatch):
+    async def scenario(box):
+        await box.enqueue("111", "923001234567", "Shukriya!", access_token="tok")
+
+    docs, sent = _run(monkeypatch, [], scenario)
+
+    assert len(sent) == 1
+    assert docs[1]["status"] == SENT and docs[1]["attempts"] == 1
+    assert "access_token" not in docs[1]
+
+
+def test_dispatcher_retries_throttled_messages_and_dead_letters_permanent_failures(monkeypatch):
+    metrics.reset()
+    responses = [
+        httpx.Response(429, json={"error": {"code": 130429}}, headers={"retry-after": "0.02"}),
+        httpx.Response(400, json={"error": {"message": "bad recipient"}}),
+    ]
+
+    async def scenario(box):
+        box.start()
+        await box.enqueue("111", "923001111111", "first", access_token="tok")
+        await asyncio.sleep(0.005)
+        await box.enqueue("222", "923002222222", "second", kind="order_status", access_token="tok")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if metrics.counter("outbox_sent_total", kind="reply") and metrics.counter("outbox_dead_total", kind="order_status"):
+                break
+        await box.stop()
+
+    docs, sent = _run(monkeypatch, responses, scenario)
+
+    assert docs[1]["status"] == SENT and docs[1]["attempts"] == 2
+    assert docs[2]["status"] == DEAD and "400" in docs[2]["lastError"] and "deadAt" in docs[2]
+    assert len(sent) == 3
+    assert metrics.counter("outbox_retries_total", status="429") == 1
+    assert metrics.histogram("outbox_delivery_lag_ms", kind="reply").count == 1
+
+
+def test_per_number_bucket_paces_bursts(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_RATE_PER_SECOND", 50)
+    monkeypatch.setattr(settings, "OUTBOX_BURST", 1)
+
+    async def scenario(box):
+        box.start()
+        for n in range(3):
+            await box.enqueue("111", "923001234567", f"msg {n}", access_token="tok")
+        await asyncio.sleep(0)
+        assert box.depth() > 0
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if box.depth() == 0 and box._queue.empty():
+                break
+        await asyncio.sleep(0.02)
+        await box.stop()
+
+    docs, sent = _run(monkeypatch, [], scenario)
+
+    assert len(sent) == 3
+    assert all(doc["status"] == SENT for doc in docs.values())
+    assert PENDING not in {doc["status"] for doc in docs.values()}
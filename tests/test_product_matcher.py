@@ -0,0 +1,149 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.routers import ai as ai_router
+from app.services.catalog_cache import catalog_cache
+from app.services.product_matcher import ProductMatcher, edit_distance
+
+PRODUCTS = [
+    {"_id": "p1", "name": "Zinger Burger", "price": 550, "unit": "piece"},
+    {"_id": "p2", "name": "Zinger Burger Deal", "price": 850, "unit": "piece"},
+    {"_id": "p3", "name": "Chicken Biryani (Full)", "price": 900, "unit": "plate"},
+    {"_id": "p4", "name": "Coke 1.5L", "price": 220, "unit": "bottle"},
+]
+
+
+def test_ranked_scorer():
+    matcher = ProductMatcher(PRODUCTS)
+
+    exact = matcher.match("zinger burger")
+    assert (exact.product["_id"], exact.kind, exact.score) == ("p1", "exact", 1.0)
+    assert matcher.match("Zinger").product["_id"] == "p1"
+    assert matcher.match("biryani (full").product["_id"] == "p3"
+    typo = matcher.match("zingr burgr")
+    assert typo.product["_id"] == "p1" and typo.kind == "edit"
+    assert matcher.match("biryani chicken").kind == "tokens"
+    assert matcher.match("pizza", min_score=0.6) is None
+    assert edit_distance("kitten", "sitting", 5) == 3
+    assert edit_distance("abc", "abcdefgh", 2) == 3
+
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+
+    async def to_list(self, length):
+        return self.records[:length]
+
+
+class FakeProducts:
+    def __init__(self):
+        self.find_calls = 0
+
+    def find(self, query, projection=None):
+        self.find_calls += 1
+        return FakeCursor(PRODUCTS)
+
+
+class FakeDB:
+    def __init__(self):
+        self.products = FakeProducts()
+
+
+def test_enrich_loads_the_catalog_once_per_order(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    catalog_cache.clear()
+    items = [
+        {"name": "zinger burger", "quantity": 2},
+        {"name": "coke 1.5l", "quantity": 1},
+        {"name": "nihari ++ (special)", "quantity": 1},
+    ]
+
+    enriched, total = asyncio.run(ai_router.enrich_order_items(items, "shop-1"))
+
+    assert fake_db.products.find_calls == 1
+    assert [e["productId"] for e in enriched] == ["p1", "p4", ""]
+    assert enriched[0]["matchConfidence"] == 1.0
+    assert enriched[2]["price"] == 0.0 and enriched[2]["matchConfidence"] == 0.0
+    assert total == 2 * 550 + 220
+
+
+def test_incremental_updates_and_free_text_search():
+    matcher = ProductMatcher(PRODUCTS)
+
+    matcher.upsert({"_id": "p4", "name": "Pepsi 1.5L", "price": 210, "unit": "bottle"})
+    matcher.upsert({"_id": "p5", "name": "Chicken Karahi", "price": 1400, "unit": "plate"})
+    matcher.remove("p2")
+
+    assert len(matcher) == 4
+    assert matcher.match("coke 1.5l", min_score=0.6) is None
+    assert matcher.match("pepsi 1.5l").product["price"] == 210
+    assert matcher.match("chiken karahi").product["_id"] == "p5"
+    assert matcher.match("zinger burger deal").product["_id"] == "p1"
+
+    found = matcher.search("bhai zingr burger ka price kya hai?")
+    assert [m.product["_id"] for m in found] == ["p1"]
+    assert matcher.search("assalam o alaikum") == []
+
+
+def test_cache_applies_product_writes_without_reloading(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    catalog_cache.clear()
+    matcher = asyncio.run(catalog_cache.get_matcher("shop-1"))
+
+    catalog_cache.upsert("shop-1", {"_id": "p6", "name": "Mango Shake", "price": 350, "stock": 4})
+    catalog_cache.upsert("shop-1", {"_id": "p1", "name": "Zinger Burger", "price": 600, "unit": "piece"})
+    catalog_cache.remove("shop-1", "p4")
+
+    assert asyncio.run(catalog_cache.get_matcher("shop-1")) is matcher
+    assert fake_db.products.find_calls == 1
+    assert matcher.match("mango shaek").product == {"_id": "p6", "name": "Mango Shake", "price": 350}
+    assert matcher.match("zinger burger").product["price"] == 600
+    assert "Coke 1.5L" not in asyncio.run(catalog_cache.get_names("shop-1"))
+    catalog_cache.clear()
+
+
+def test_product_context_lists_mentioned_prices(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    catalog_cache.clear()
+
+    context = asyncio.run(ai_router.product_context("shop-1", "coke 1.5l ka rate?"))
+
+    assert "- Coke 1.5L: Rs.220 per bottle" in context
+    assert asyncio.run(ai_router.product_context("shop-1", "salam")) == ""
+    catalog_cache.clear()
+
+
+def test_search_windows_stop_at_the_longest_name():
+    matcher = ProductMatcher(PRODUCTS)
+    assert matcher.max_words == 3
+
+    matcher.upsert({"_id": "p6", "name": "Chicken Tikka Pizza Large Family", "price": 2400})
+    assert matcher.max_words == 5
+    matcher.remove("p6")
+    assert matcher.max_words == 3
+
+    message = "coke 1.5l bhi " + "aur haan jaldi bhejna please " * 200 + "zinger burger"
+    found = matcher.search(message)
+    assert [m.product["_id"] for m in found] == ["p4"]
+
+
+def test_cache_writes_find_products_by_id_after_removals():
+    catalog_cache.clear()
+    catalog_cache.put("shop-1", [{"_id": f"p{n}", "name": f"Item {n}", "price": n} for n in range(5)])
+
+    catalog_cache.remove("shop-1", "p1")
+    catalog_cache.upsert("shop-1", {"_id": "p4", "name": "Item 4", "price": 40})
+    catalog_cache.upsert("shop-1", {"_id": "p5", "name": "Item 5", "price": 5})
+    catalog_cache.remove("shop-1", "p5")
+    catalog_cache.remove("shop-1", "missing")
+
+    products = asyncio.run(catalog_cache.get_products("shop-1"))
+    assert sorted((p["_id"], p["price"]) for p in products) == [("p0", 0), ("p2", 2), ("p3", 3), ("p4", 40)]
+    catalog_cache.clear()
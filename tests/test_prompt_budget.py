@@ -0,0 +1,120 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.metrics import metrics
+from app.services.ai_service import AIService
+from app.services.prompt_budget import (
+    SystemPrompt,
+    assemble_messages,
+    count_tokens,
+    message_tokens,
+    normalize_history,
+)
+
+
+def _history(n, words=20):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "kya haal hai " * words}
+        for i in range(n)
+    ]
+
+
+def _kb_prompt(pairs):
+    return "You are the assistant for Shop.\n" + "".join(f"Q: {q}\nA: {a}\n" for q, a in pairs)
+
+
+def test_count_tokens_estimates():
+    assert count_tokens("") == 0
+    assert count_tokens("Zinger burger ka price?") == 7
+    assert count_tokens("Rs.12500") == 4
+    assert count_tokens("آپ کیسے ہیں") == 9
+    messages = [{"role": "system", "content": "hi"}, {"role": "user", "content": "salam"}]
+    assert message_tokens(messages) == 1 + 1 + 2 * 4 + 3
+
+
+def test_everything_fits_under_a_large_budget():
+    pairs = [("timing?", "9 to 5"), ("delivery?", "Rs.200")]
+    prompt = assemble_messages(SystemPrompt(_kb_prompt, pairs), _history(4), "hello", budget=10_000)
+
+    assert prompt.trimmed == []
+    assert (prompt.context_used, prompt.history_used) == (2, 4)
+    assert prompt.system == _kb_prompt(pairs)
+    assert [m["role"] for m in prompt.messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    assert prompt.tokens == message_tokens(prompt.messages)
+
+
+def test_trims_older_history_then_low_ranked_context():
+    pairs = [(f"question {i}?", "answer " * 80) for i in range(50)]
+    system = SystemPrompt(_kb_prompt, pairs)
+
+    prompt = assemble_messages(system, _history(10), "price kya hai?", budget=1000)
+
+    assert prompt.tokens <= 1000
+    assert 0 < prompt.context_used < 50
+    assert prompt.system == _kb_prompt(pairs[:prompt.context_used])
+    # The latest exchange is kept ahead of the knowledge base, older turns after it.
+    assert prompt.history_used == 2
+    assert prompt.messages[1]["content"].startswith("turn 8")
+    assert prompt.messages[-1] == {"role": "user", "content": "price kya hai?"}
+    assert set(prompt.trimmed) == {"context", "history"}
+
+
+def test_oversized_system_prompt_and_message_are_truncated():
+    system = "You are a helpful assistant.\n" + "long description " * 2000
+
+    prompt = assemble_messages(system, _history(4), "order " * 500, budget=600, max_user_tokens=100)
+
+    assert prompt.tokens <= 600
+    assert prompt.system.startswith("You are a helpful assistant.")
+    assert prompt.system.endswith("[...]")
+    assert count_tokens(prompt.messages[-1]["content"]) <= 100
+    assert prompt.history_used == 0
+    assert set(prompt.trimmed) == {"user", "system", "history"}
+
+
+def test_suffix_survives_a_truncated_system_prompt():
+    instruction = "\n\nRespond with ONLY a JSON object."
+    system = SystemPrompt.of("You are a helpful assistant.\n" + "long description " * 2000).with_suffix(instruction)
+
+    prompt = assemble_messages(system, [], "2 zinger bhej do", budget=600)
+
+    assert prompt.tokens <= 600
+    assert "system" in prompt.trimmed
+    assert prompt.system.endswith("[...]" + instruction)
+
+
+def test_ai_service_records_prompt_tokens(monkeypatch):
+    metrics.reset()
+    service = AIService(client=object())
+    monkeypatch.setattr("app.services.ai_service.settings.AI_PROMPT_TOKEN_BUDGET", 300)
+    monkeypatch.setattr("app.services.ai_service.settings.AI_HISTORY_MAX_MESSAGES", 10)
+
+    messages = service.build_messages("You help customers.", _history(30), "salam", purpose="reply")
+
+    assert message_tokens(messages) <= 300
+    assert metrics.histogram("llm_prompt_tokens", purpose="reply").count == 1
+    assert metrics.counter("llm_prompt_trimmed_total", part="history") == 1
+
+
+def test_largest_fitting_context_prefix_is_found_among_many():
+    pairs = [(f"sawal {i}", "jawab " * (i % 7 + 1)) for i in range(500)]
+    system = SystemPrompt(_kb_prompt, pairs)
+    base = count_tokens(_kb_prompt([]))
+    budget = 2000
+
+    prompt = assemble_messages(system, [], "hi", budget=budget)
+
+    # Same answer as trying every prefix.
+    available = budget - 3 - 2 * 4 - count_tokens("hi") - base
+    expected = max(n for n in range(len(pairs) + 1) if count_tokens(_kb_prompt(pairs[:n])) - base <= available)
+    assert prompt.context_used == expected
+    assert 0 < expected < len(pairs) and prompt.trimmed == ["context"]
+
+
+def test_history_limit_only_normalizes_recent_messages():
+    history = [{"role": "user"}] * 3 + _history(4) + [{"text": "latest", "sender": "customer"}, 42]
+    assert normalize_history(history, limit=3) == normalize_history(history)[-3:]
+    assert normalize_history(history, limit=3)[-1] == {"role": "user", "content": "latest"}
+    assert len(normalize_history(history, limit=50)) == 5
@@ -0,0 +1,61 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.metrics import metrics
+from app.services.kb_index import ShopKnowledge
+from app.services.prompt_budget import SystemPrompt, assemble_messages
+from app.services.prompt_cache import PromptCache
+
+SHOP = {"_id": "shop-1", "name": "Karachi Biryani", "description": "Best biryani in town"}
+KNOWLEDGE = ShopKnowledge([
+    {"_id": "1", "question": "Delivery charges?", "answer": "Rs. 200"},
+    {"_id": "2", "question": "Timings?", "answer": "11am se 11pm"},
+])
+
+
+def test_prompt_is_reused_until_the_version_changes():
+    metrics.reset()
+    cache = PromptCache(max_chars=100_000, max_variants=4)
+    pairs = list(KNOWLEDGE.entries.values())
+
+    first = cache.render(SHOP, pairs)
+    assert cache.render(SHOP, pairs) is first
+    assert "Karachi Biryani" in first and "Q: Delivery charges?\nA: Rs. 200" in first
+    assert "IMPORTANT" not in cache.render(SHOP, [])
+
+    cache.bump("shop-1")
+    cache.render(SHOP, pairs)
+    assert metrics.counter("prompt_cache_total", result="hit") == 2
+    assert metrics.counter("prompt_cache_total", result="miss") == 2
+
+
+def test_stale_shop_fields_recompile_and_budget_evicts_old_shops():
+    cache = PromptCache(max_chars=1_000, max_variants=4)
+    cache.render(SHOP, [])
+    renamed = dict(SHOP, name="Lahore Biryani")
+    assert "Lahore Biryani" in cache.render(renamed, [])
+
+    for i in range(10):
+        cache.render({"_id": f"shop-{i + 2}", "name": f"Shop {i}", "description": ""}, [])
+    assert cache.size <= 1_000
+    assert cache.size == sum(p.size for p in cache._prompts.values())
+
+
+def test_budget_trials_cache_only_the_chosen_prefix():
+    cache = PromptCache(max_chars=1_000_000, max_variants=50)
+    knowledge = ShopKnowledge([
+        {"_id": str(i), "question": f"Sawal {i}?", "answer": "jawab " * 40} for i in range(16)
+    ])
+    pairs = list(knowledge.entries.values())
+    system = SystemPrompt(
+        lambda items: cache.render(SHOP, items), pairs, preview=lambda items: cache.preview(SHOP, items)
+    )
+
+    prompt = assemble_messages(system, [], "salam", budget=600)
+
+    assert 0 < prompt.context_used < len(pairs)
+    variants = cache.get(SHOP).variants
+    assert list(variants) == [tuple(qa.id for qa in pairs[:prompt.context_used])]
+    assert prompt.system == variants[next(iter(variants))]
@@ -0,0 +1,102 @@
+import asyncio
+import os
+from datetime import datetime
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.services import quota
+from app.services.quota import QuotaService, month_key, stored_usage
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if "$exists" in cond and (key in doc) != cond["$exists"]:
+                return False
+            if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                return False
+            if "$gte" in cond and not (value is not None and value >= cond["$gte"]):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeShops:
+    def __init__(self, doc):
+        self.doc = doc
+        self.reads = 0
+        self.writes = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        return dict(self.doc) if _matches(self.doc, query) else None
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=False):
+        if not _matches(self.doc, query):
+            return None
+        self.writes += 1
+        for key, amount in update.get("$inc", {}).items():
+            self.doc[key] = self.doc.get(key, 0) + amount
+        self.doc.update(update.get("$set", {}))
+        return dict(self.doc)
+
+
+class FakeDB:
+    def __init__(self, doc):
+        self.shops = FakeShops(doc)
+
+
+def _run(service, shop, times):
+    async def go():
+        return [await service.try_consume(shop) for _ in range(times)]
+    return asyncio.run(go())
+
+
+def test_limit_is_enforced_in_memory_and_flushed_once(monkeypatch):
+    fake_db = FakeDB({"_id": "s1", "quota_month": month_key(), "messages_this_month": 197})
+    monkeypatch.setattr(quota.db, "get_db", lambda: fake_db)
+    service = QuotaService()
+    monkeypatch.setattr(QuotaService, "running", property(lambda self: True))
+    shop = {"_id": "s1", "plan": "free"}
+
+    results = _run(service, shop, 5)
+
+    assert [allowed for allowed, _, _ in results] == [True, True, True, False, False]
+    assert results[-1][1:] == (200, 200)
+    assert fake_db.shops.reads == 1 and fake_db.shops.writes == 0
+    assert service.usage(fake_db.shops.doc) == 200
+
+    asyncio.run(service.flush())
+    assert fake_db.shops.doc["messages_this_month"] == 200
+    assert fake_db.shops.writes == 1
+
+
+def test_flush_rolls_over_a_previous_month(monkeypatch):
+    fake_db = FakeDB({"_id": "s1", "quota_month": "2000-01", "messages_this_month": 999})
+    monkeypatch.setattr(quota.db, "get_db", lambda: fake_db)
+    service = QuotaService()
+
+    allowed, used, limit = _run(service, {"_id": "s1", "plan": "business"}, 1)[0]
+
+    assert (allowed, used, limit) == (True, 1, -1)
+    assert fake_db.shops.doc["quota_month"] == month_key()
+    assert fake_db.shops.doc["messages_this_month"] == 1
+
+
+def test_legacy_counter_from_this_month_is_kept(monkeypatch):
+    fake_db = FakeDB({"_id": "s1", "messages_this_month": 50, "last_reset_date": datetime.utcnow()})
+    monkeypatch.setattr(quota.db, "get_db", lambda: fake_db)
+    service = QuotaService()
+
+    _run(service, {"_id": "s1", "plan": "starter"}, 2)
+
+    assert fake_db.shops.doc["messages_this_month"] == 52
+    assert fake_db.shops.doc["quota_month"] == month_key()
+    assert stored_usage({"messages_this_month": 9, "quota_month": "2000-01"}) == 0
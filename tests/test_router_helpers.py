@@ -0,0 +1,67 @@
+import os
+from datetime import datetime
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import pytest
+from bson import ObjectId
+
+from app.models.order import OrderResponse
+from app.routers.insights import weekly_stats
+from app.routers.knowledge_base import detect_category
+from app.routers.orders import order_response_doc
+from app.routers.products import product_fields, read_product_rows
+
+
+def test_product_import_columns_follow_alias_priority():
+    content = "Item,Product Name,Rate,qty,Type\nIgnored,Zinger Burger,450,abc,\n,,1,1,\n".encode("utf-8-sig")
+    rows = read_product_rows(content, "menu.csv")
+    columns = {}
+
+    assert product_fields(rows[0], columns) == {
+        "name": "Zinger Burger",
+        "price": 450.0,
+        "description": "",
+        "stock": 0,
+        "category": "General",
+    }
+    with pytest.raises(ValueError, match="Missing product name"):
+        product_fields(rows[1], columns)
+    assert len(columns) == 1
+
+
+def test_weekly_stats_counts_questions_hours_and_products():
+    conversations = [{"messages": [
+        {"role": "user", "content": "price?", "timestamp": datetime(2026, 3, 2, 13, 5)},
+        {"role": "assistant", "content": "450", "timestamp": datetime(2026, 3, 2, 13, 6)},
+        {"role": "user", "text": "price?", "createdAt": "2026-03-02T20:15:00"},
+        {"role": "user", "content": "open?", "timestamp": "not a date"},
+    ]}]
+    orders = [
+        {"total": 900, "status": "completed", "customerName": "Ali", "items": [{"name": "Zinger"}, {"name": "Fries"}]},
+        {"total": 450, "status": "new", "items": [{"name": "Zinger"}]},
+    ]
+
+    stats = weekly_stats(orders, conversations)
+
+    assert stats["total_sales"] == 1350
+    assert stats["top_questions"] == [{"question": "price?", "count": 2}, {"question": "open?", "count": 1}]
+    assert stats["busiest_hours"] == [{"label": "13:00", "messages": 2}, {"label": "20:00", "messages": 1}]
+    assert stats["popular_products"][0] == {"name": "Zinger", "inquiries": 2, "demand": "Medium"}
+    assert stats["automated_sales"] == [{"customerName": "Ali", "interaction": "completed", "value": 900}]
+
+
+def test_detect_category_keeps_category_priority():
+    assert detect_category("Delivery charges kitna hai?", "") == "Billing"
+    assert detect_category("Refund kab milega", "3 din mein") == "Returns"
+    assert detect_category("Kahan hain aap?", "Gulberg") == "Location"
+    assert detect_category("Salam", "Walaikum salam") == "General"
+
+
+def test_order_response_doc_validates_as_response_model():
+    doc = order_response_doc({
+        "_id": ObjectId(), "shopId": ObjectId(), "customerId": "c1", "customerName": "Ali",
+        "customerPhone": "923001234567", "items": [], "totalAmount": 0, "status": "new",
+    })
+    assert OrderResponse.model_validate(doc).id == doc["_id"]
@@ -0,0 +1,180 @@
+import asyncio
+import os
+
+from pymongo.errors import BulkWriteError
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import ai as ai_router
+from app.services.dedup import message_dedup
+from app.services.shop_cache import shop_cache
+
+
+client = TestClient(app)
+
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+
+    async def to_list(self, length):
+        return self.records[:length]
+
+
+class FakeShopsCollection:
+    def __init__(self, records):
+        self.records = records
+        self.find_calls = 0
+
+    def find(self, query, projection=None):
+        self.find_calls += 1
+        ids = set()
+        for clause in query["$or"]:
+            for values in clause.values():
+                ids.update(values["$in"])
+        return FakeCursor([r for r in self.records if r.get("whatsapp_phone_number_id") in ids])
+
+
+class FakeDedupCollection:
+    def __init__(self):
+        self.ids = set()
+        self.calls = 0
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["_id"] in self.ids:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate"})
+            self.ids.add(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+
+class FakeDB:
+    def __init__(self, shops):
+        self.shops = FakeShopsCollection(shops)
+        self.webhook_dedup = FakeDedupCollection()
+
+
+def _text(sender, body, msg_id):
+    return {"from": sender, "id": msg_id, "type": "text", "text": {"body": body}}
+
+
+def test_webhook_processes_every_message_in_payload(monkeypatch):
+    fake_db = FakeDB([
+        {"_id": "s1", "name": "One", "whatsapp_phone_number_id": "111"},
+        {"_id": "s2", "name": "Two", "whatsapp_phone_number_id": "222"},
+    ])
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    shop_cache.clear()
+    message_dedup.clear()
+
+    processed = []
+
+    async def fake_process(phone_number_id, message, shop=None):
+        processed.append((phone_number_id, message["id"], shop["_id"]))
+
+    monkeypatch.setattr(ai_router, "process_whatsapp_message", fake_process)
+
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {"changes": [
+                {"value": {
+                    "metadata": {"phone_number_id": "111"},
+                    "messages": [_text("9230011", "salam", "m1"), _text("9230011", "price?", "m2")],
+                }},
+                {"value": {
+                    "metadata": {"phone_number_id": "222"},
+                    "messages": [_text("9230022", "hello", "m3")],
+                }},
+            ]},
+            {"changes": [
+                {"value": {
+                    "metadata": {"phone_number_id": "333"},
+                    "messages": [_text("9230033", "unknown shop", "m4")],
+                }},
+                {"value": {"metadata": {"phone_number_id": "111"}, "statuses": [{"id": "x"}]}},
+            ]},
+        ],
+    }
+
+    response = client.post("/api/ai/webhook/whatsapp", json=payload)
+
+    assert response.status_code == 200
+    assert fake_db.shops.find_calls == 1
+    assert sorted(processed) == [("111", "m1", "s1"), ("111", "m2", "s1"), ("222", "m3", "s2")]
+    # Messages from the same customer stay in arrival order.
+    assert [m for pid, m, _ in processed if pid == "111"] == ["m1", "m2"]
+
+
+def test_shop_cache_skips_mongo_after_first_lookup(monkeypatch):
+    fake_db = FakeDB([{"_id": "s1", "name": "One", "whatsapp_phone_number_id": "111"}])
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    shop_cache.clear()
+    message_dedup.clear()
+
+    async def fake_process(phone_number_id, message, shop=None):
+        pass
+
+    monkeypatch.setattr(ai_router, "process_whatsapp_message", fake_process)
+
+    def payload(msg_id):
+        return {"entry": [{"changes": [{"value": {
+            "metadata": {"phone_number_id": "111"},
+            "messages": [_text("9230011", "salam", msg_id)],
+        }}]}]}
+
+    for i in range(3):
+        client.post("/api/ai/webhook/whatsapp", json=payload(f"m{i}"))
+    assert fake_db.shops.find_calls == 1
+
+    shop_cache.invalidate(shop_id="s1")
+    client.post("/api/ai/webhook/whatsapp", json=payload("m3"))
+    assert fake_db.shops.find_calls == 2
+
+
+def test_redelivered_messages_are_processed_once(monkeypatch):
+    fake_db = FakeDB([{"_id": "s1", "name": "One", "whatsapp_phone_number_id": "111"}])
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    shop_cache.clear()
+    message_dedup.clear()
+    processed = []
+
+    async def fake_process(phone_number_id, message, shop=None):
+        processed.append(message["id"])
+
+    monkeypatch.setattr(ai_router, "process_whatsapp_message", fake_process)
+    payload = {"entry": [{"changes": [{"value": {
+        "metadata": {"phone_number_id": "111"},
+        "messages": [_text("9230011", "2 zinger", "wamid.1"), _text("9230011", "2 zinger", "wamid.1")],
+    }}]}]}
+
+    client.post("/api/ai/webhook/whatsapp", json=payload)
+    client.post("/api/ai/webhook/whatsapp", json=payload)
+    # A restarted process has an empty LRU but the store still knows the id.
+    message_dedup.clear()
+    client.post("/api/ai/webhook/whatsapp", json=payload)
+
+    assert processed == ["wamid.1"]
+    assert message_dedup.duplicate_rate() > 0
+    # One insert_many per payload; the second payload was answered by the LRU.
+    assert fake_db.webhook_dedup.calls == 2
+
+
+def test_batch_claims_read_store_duplicates_from_bulk_errors(monkeypatch):
+    fake_db = FakeDB([])
+    fake_db.webhook_dedup.ids.add("wamid.2")
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    message_dedup.clear()
+    items = [("111", _text("9230011", "salam", f"wamid.{n}")) for n in range(1, 4)]
+
+    fresh = asyncio.run(ai_router.drop_duplicate_messages(items))
+
+    assert [m["id"] for _, m in fresh] == ["wamid.1", "wamid.3"]
+    assert fake_db.webhook_dedup.calls == 1
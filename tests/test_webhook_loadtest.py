@@ -0,0 +1,52 @@
+import json
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.config import settings
+from app.core.database import db
+from app.services.ai_service import ai_service
+from app.services.catalog_cache import catalog_cache
+from app.services.kb_index import kb_index
+from app.services.shop_cache import shop_cache
+from scripts import webhook_loadtest
+from scripts.fakes.memory_mongo import apply_update, matches
+
+
+def test_memory_mongo_query_and_update_subset():
+    doc = {"_id": 1, "plan": "free", "messages": [{"t": 1}, {"t": 2}, {"x": 1}], "n": 1}
+
+    assert matches(doc, {"$or": [{"plan": {"$in": ["starter"]}}, {"n": {"$gte": 1}}], "missing": {"$exists": False}})
+    assert not matches(doc, {"plan": "free", "n": {"$lt": 1}})
+    apply_update(doc, {
+        "$inc": {"n": 2},
+        "$pull": {"messages": {"$or": [{"t": {"$lte": 1}}, {"t": {"$exists": False}}]}},
+    })
+    apply_update(doc, {"$push": {"messages": {"$each": [{"t": 3}, {"t": 4}], "$slice": -2}}})
+    assert doc["n"] == 3
+    assert doc["messages"] == [{"t": 3}, {"t": 4}]
+
+
+def test_harness_replays_corpus_and_reports(monkeypatch, tmp_path):
+    for target, name in ((db, "get_db"), (db, "warmup"), (ai_service, "client"), (settings, "WHATSAPP_WEBHOOK_ASYNC")):
+        monkeypatch.setattr(target, name, getattr(target, name))
+    corpus = tmp_path / "payloads.jsonl"
+    corpus.write_text(json.dumps(webhook_loadtest.synthetic_payload("555", "923001112222", "2 zinger burger chahiye")))
+    report_path = tmp_path / "report.json"
+
+    code = webhook_loadtest.main([
+        "--corpus", str(corpus), "--rate", "20", "--duration", "0.5",
+        "--mongo-latency-ms", "0", "--openai-latency-ms", "0", "--graph-latency-ms", "0",
+        "--max-p99-ms", "5000", "--json", str(report_path),
+    ])
+
+    report = json.loads(report_path.read_text())
+    assert code == 0
+    assert report["requests"] == report["replies"] == 10
+    assert report["e2e_ms"]["count"] == 10 and report["loop_lag_ms"]["count"] > 0
+    assert report["rss_mb"]["peak"] > 0
+    assert report["mongo_ops"]["orders"] > 0
+    shop_cache.clear()
+    catalog_cache.clear()
+    kb_index.clear()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+from app.core.metrics import metrics
+from app.routers import ai as ai_router
+from app.services.catalog_cache import catalog_cache
+from app.services.kb_index import kb_index
+
+LATENCY = 0.05
+SHOP = {"_id": "s1", "name": "Karachi Broast", "plan": "starter", "whatsapp_access_token": "token"}
+
+
+class SlowCursor:
+    def __init__(self, records):
+        self.records = records
+
+    async def to_list(self, length):
+        await asyncio.sleep(LATENCY)
+        return self.records[:length]
+
+
+class SlowCollection:
+    def __init__(self, records=()):
+        self.records = list(records)
+        self.writes = []
+
+    def find(self, query, projection=None):
+        return SlowCursor(self.records)
+
+    async def find_one(self, query, projection=None):
+        await asyncio.sleep(LATENCY)
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        await asyncio.sleep(LATENCY)
+        self.writes.append(update)
+
+
+class FakeDB:
+    def __init__(self):
+        self.knowledge_base = SlowCollection([{"_id": "q1", "question": "Timing?", "answer": "12pm to 12am"}])
+        self.products = SlowCollection([{"_id": "p1", "name": "Zinger Burger", "price": 550}])
+        self.conversations = SlowCollection()
+        self.orders = SlowCollection()
+
+
+class FakeAIService:
+    async def generate_structured(self, shop_context, history, user_message, purpose="structured", **params):
+        return {"type": "chat", "reply": "Zinger Burger Rs.550 ka hai."}
+
+    async def generate_response(self, shop_context, history, user_message, purpose="reply", **params):
+        return "Zinger Burger Rs.550 ka hai."
+
+
+def test_independent_reads_and_writes_overlap(monkeypatch):
+    fake_db = FakeDB()
+    sent = []
+
+    async def try_consume(shop):
+        return True, 1, 1000
+
+    async def enqueue(phone_number_id, to, body, **kwargs):
+        await asyncio.sleep(LATENCY)
+        sent.append((to, body))
+
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: fake_db)
+    monkeypatch.setattr(ai_router.quota_service, "try_consume", try_consume)
+    monkeypatch.setattr(ai_router.outbox, "enqueue", enqueue)
+    monkeypatch.setattr(ai_router, "ai_service", FakeAIService())
+    monkeypatch.setattr(ai_router.settings, "INTENT_PREFILTER_ENABLED", False)
+    kb_index.clear()
+    catalog_cache.clear()
+    metrics.reset()
+    message = {"from": "923001234567", "id": "m1", "type": "text", "text": {"body": "zinger burger ka price?"}}
+
+    started = time.perf_counter()
+    asyncio.run(ai_router.process_whatsapp_message("111", message, shop=SHOP))
+    elapsed = time.perf_counter() - started
+
+    assert sent == [("923001234567", "Zinger Burger Rs.550 ka hai.")]
+    assert len(fake_db.conversations.writes) == 1
+    # Six dependent-free round trips of LATENCY each, run as two concurrent stages.
+    assert elapsed < 4 * LATENCY
+    for stage in ("load", "context", "products", "history", "pending_order", "deliver", "save", "send"):
+        assert metrics.histogram("webhook_stage_ms", stage=stage).count == 1, stage
+    assert metrics.histogram("webhook_stage_ms", stage="load").percentile(50) < 2 * LATENCY * 1000
+    kb_index.clear()
+    catalog_cache.clear()
@@ -0,0 +1,194 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.routers import ai as ai_router
+from app.services.dedup import message_dedup
+from app.services.webhook_queue import WebhookQueue
+from scripts.fakes.memory_mongo import MemoryDatabase
+
+
+def test_jobs_with_same_key_run_in_order():
+    async def scenario():
+        queue = WebhookQueue(workers=4, maxsize=100)
+        seen = []
+
+        async def handler(job):
+            # Later jobs finish faster, so only shard ordering keeps them in sequence.
+            await asyncio.sleep(0.01 * (5 - job["n"]))
+            seen.append((job["key"], job["n"]))
+
+        queue.start(handler)
+        for n in range(5):
+            for key in ("shop1:cust1", "shop1:cust2"):
+                assert queue.enqueue(key, {"key": key, "n": n})
+        await queue.stop()
+        return seen
+
+    seen = asyncio.run(scenario())
+
+    for key in ("shop1:cust1", "shop1:cust2"):
+        assert [n for k, n in seen if k == key] == [0, 1, 2, 3, 4]
+
+
+def test_enqueue_rejects_when_full_or_stopped():
+    async def scenario():
+        queue = WebhookQueue(workers=1, maxsize=1)
+        assert not queue.enqueue("k", {})
+
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+
+        queue.start(handler)
+        assert queue.enqueue("k", {"n": 1})
+        await asyncio.sleep(0)  # worker picks up the first job
+        assert queue.enqueue("k", {"n": 2})
+        assert not queue.enqueue("k", {"n": 3})
+        release.set()
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def _message(msg_id, sender="9230011"):
+    return {"from": sender, "id": msg_id, "type": "text", "text": {"body": "salam"}}
+
+
+def _async_pipeline(monkeypatch, process):
+    database = MemoryDatabase()
+    monkeypatch.setattr(ai_router.db, "get_db", lambda: database)
+    monkeypatch.setattr(ai_router, "process_whatsapp_message", process)
+    message_dedup.clear()
+    return database
+
+
+def test_requeue_only_pending_messages(monkeypatch):
+    processed = []
+
+    async def process(phone_number_id, message, shop=None):
+        processed.append(message["id"])
+
+    database = _async_pipeline(monkeypatch, process)
+    jobs = ai_router.webhook_jobs([("111", _message("m1")), ("111", _message("m2"))])
+    event_id = asyncio.run(ai_router._store_webhook_event({"entry": []}, jobs))
+    # m1 was answered before the restart.
+    asyncio.run(database.webhook_events.update_one(
+        {"_id": event_id}, {"$pull": {"pendingIds": "m1"}, "$inc": {"pending": -1}}
+    ))
+
+    async def scenario():
+        queue = WebhookQueue(workers=2, maxsize=10)
+        monkeypatch.setattr(ai_router, "webhook_queue", queue)
+        queue.start(ai_router.run_webhook_job)
+        assert await ai_router.requeue_pending_webhook_events() == 1
+        await queue.stop()
+        # A second completion of the same message changes nothing.
+        await ai_router.run_webhook_job({**jobs[1], "event_id": event_id})
+
+    asyncio.run(scenario())
+
+    event = database.webhook_events.docs[event_id]
+    assert processed == ["m2", "m2"]
+    assert (event["status"], event["pending"], event["pendingIds"]) == ("processed", 0, [])
+    assert "settledAt" in event
+
+
+def test_requeue_pages_through_every_event_and_counts_what_does_not_fit(monkeypatch):
+    processed = []
+    gate = {}
+
+    async def process(phone_number_id, message, shop=None):
+        await gate["open"].wait()
+        processed.append(message["id"])
+
+    database = _async_pipeline(monkeypatch, process)
+    metrics.reset()
+    monkeypatch.setattr(settings, "WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS", 0.05)
+    for n in range(5):
+        # Same receivedAt on every event, so paging must break ties on _id.
+        asyncio.run(ai_router._store_webhook_event({"entry": []}, ai_router.webhook_jobs(
+            [("111", _message(f"m{n}", sender=f"92300{n}"))]
+        )))
+    received = next(iter(database.webhook_events.docs.values()))["receivedAt"]
+    for event in database.webhook_events.docs.values():
+        event["receivedAt"] = received
+
+    async def scenario(maxsize):
+        gate["open"] = asyncio.Event()
+        queue = WebhookQueue(workers=1, maxsize=maxsize)
+        monkeypatch.setattr(ai_router, "webhook_queue", queue)
+        queue.start(ai_router.run_webhook_job)
+        requeued = await ai_router.requeue_pending_webhook_events(batch=2)
+        gate["open"].set()
+        await queue.stop()
+        return requeued
+
+    # One job with the worker, one waiting on the shard, the rest time out.
+    assert asyncio.run(scenario(maxsize=1)) == 2
+    assert metrics.counter("webhook_requeue_total", result="queue_full") == 3
+    assert asyncio.run(scenario(maxsize=10)) == 3
+    assert sorted(processed) == ["m0", "m1", "m2", "m3", "m4"]
+    assert {e["status"] for e in database.webhook_events.docs.values()} == {"processed"}
+
+
+def test_full_shard_releases_the_rest_for_redelivery(monkeypatch):
+    processed = []
+    gate = {}
+
+    async def process(phone_number_id, message, shop=None):
+        await gate["open"].wait()
+        processed.append(message["id"])
+
+    database = _async_pipeline(monkeypatch, process)
+    monkeypatch.setattr(settings, "WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS", 0.05)
+    items = [("111", _message(f"m{n}")) for n in range(1, 5)]
+
+    async def scenario():
+        gate["open"] = asyncio.Event()
+        queue = WebhookQueue(workers=1, maxsize=1)
+        monkeypatch.setattr(ai_router, "webhook_queue", queue)
+        queue.start(ai_router.run_webhook_job)
+        fresh = await ai_router.drop_duplicate_messages(items)
+        queued = await ai_router.queue_webhook_messages({"entry": []}, fresh)
+        gate["open"].set()
+        await queue.stop()
+        return queued
+
+    assert asyncio.run(scenario()) is False
+
+    # m1 is with the worker and m2 waits on the shard; m3 and m4 go back to Meta.
+    assert processed == ["m1", "m2"]
+    (event,) = database.webhook_events.docs.values()
+    assert (event["status"], event["pending"], event["pendingIds"]) == ("processed", 0, [])
+    assert set(database.webhook_dedup.docs) == {"m1", "m2"}
+    redelivered = asyncio.run(ai_router.drop_duplicate_messages(items))
+    assert [m["id"] for _, m in redelivered] == ["m3", "m4"]
+
+
+def test_failed_store_releases_dedup_claims(monkeypatch):
+    async def process(phone_number_id, message, shop=None):
+        pass
+
+    database = _async_pipeline(monkeypatch, process)
+
+    async def unavailable(doc):
+        raise RuntimeError("not primary")
+
+    database.webhook_events.insert_one = unavailable
+    items = [("111", _message("m1"))]
+
+    async def scenario():
+        fresh = await ai_router.drop_duplicate_messages(items)
+        with pytest.raises(RuntimeError):
+            await ai_router.queue_webhook_messages({"entry": []}, fresh)
+        return await ai_router.drop_duplicate_messages(items)
+
+    assert len(asyncio.run(scenario())) == 1